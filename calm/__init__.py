@@ -22,12 +22,40 @@ assigns URIs to them. Here is a basic example:
         return "Hello %s".format(your_name)
 
 For more information see `README.md`.
+
+The public API is imported lazily on the first access, so that `import calm`
+and the imports of the lightweight modules, e.g. `calm.ex` or `calm.codec`, do
+not pull in Tornado and the whole handler stack. The lazy attributes rely on
+the module `__getattr__` of PEP 562, hence Calm requires Python 3.7.
 """
 import logging
-
-from calm.core import CalmApp as Application  # noqa
-from calm.codec import ArgumentParser  # noqa
+import importlib
 
 logging.getLogger('calm').addHandler(logging.NullHandler())
 
 __version__ = '0.1.4'
+__all__ = ['Application', 'ArgumentParser']
+
+_LAZY_ATTRIBUTES = {
+    'Application': ('calm.core', 'CalmApp'),
+    'ArgumentParser': ('calm.codec', 'ArgumentParser')
+}
+
+
+def __getattr__(name):
+    """Imports the public API attributes on the first access."""
+    try:
+        module_name, attribute = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(
+            "module 'calm' has no attribute '{}'".format(name)
+        ) from None
+
+    value = getattr(importlib.import_module(module_name), attribute)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
@@ -0,0 +1,141 @@
+"""
+This module defines the asynchronous structured access log of Calm.
+
+When the `access_log` configuration is set to an `AccessLog`, `MainHandler`
+records every finished request with the following fields:
+
+    * time - the UNIX time of the start of the request
+    * request_id - the ID of the request
+    * method - the HTTP method
+    * route - the route template, rather than the path
+    * status - the response status code
+    * duration - the latency of the request in seconds
+    * request_size - the size of the request body in bytes
+    * response_size - the size of the response body in bytes
+    * remote_ip - the address of the client
+
+Every request gets an ID, taken from the request ID header (`X-Request-ID` by
+default) when the client sends a sane one, or generated otherwise. The ID is
+returned in the same response header and is available to the handlers as
+`request.request_id`.
+
+The IOLoop only puts the records to a bounded queue. A background thread
+serializes them to JSON lines and writes them to the log file, so that the
+IOLoop never blocks on the file I/O. When the queue is full, the records are
+dropped and counted in `dropped`, rather than blocking the IOLoop.
+"""
+import os
+import re
+import json
+import queue
+import logging
+import threading
+
+
+__all__ = ['AccessLog']
+
+
+REQUEST_ID_REGEX = re.compile(r'^[\w\-.:/+=@]{1,128}$')
+
+
+class AccessLog(object):
+    """
+    Writes the access log records in a background thread.
+
+    Arguments:
+        * target - the path of the log file, or a writable text stream
+        * max_queue - the number of the records buffered for writing
+        * request_id_header - the header carrying the request ID
+    """
+    _STOP = object()
+
+    def __init__(self, target, max_queue=10000,
+                 request_id_header='X-Request-ID'):
+        super(AccessLog, self).__init__()
+
+        self.target = target
+        self.request_id_header = request_id_header
+        self.dropped = 0
+
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+
+        self.log = logging.getLogger('calm')
+
+    def start(self):
+        """Starts the writer thread, if it is not running yet."""
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._write,
+                                        name='calm-access-log',
+                                        daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Writes the buffered records and stops the writer thread."""
+        if self._thread is None:
+            return
+
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def request_id(self, request):
+        """Returns the propagated ID of `request`, or generates a new one."""
+        request_id = request.headers.get(self.request_id_header)
+        if request_id is not None and REQUEST_ID_REGEX.match(request_id):
+            return request_id
+
+        return os.urandom(8).hex()
+
+    def record(self, record):
+        """Queues the `record` for writing, or drops it if the queue is full."""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def collect(self):
+        """Returns the number of dropped records in the Prometheus format."""
+        return [
+            '# HELP calm_access_log_dropped_total '
+            'Access log records dropped because the queue was full.',
+            '# TYPE calm_access_log_dropped_total counter',
+            'calm_access_log_dropped_total {}'.format(self.dropped)
+        ]
+
+    def _open(self):
+        if hasattr(self.target, 'write'):
+            return self.target, False
+
+        return open(self.target, 'a', encoding='utf-8'), True
+
+    def _write(self):
+        """The writing loop running in the background thread."""
+        stream, owned = self._open()
+        try:
+            stopped = False
+            while not stopped:
+                records = [self._queue.get()]
+                while True:
+                    try:
+                        records.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                if any(record is self._STOP for record in records):
+                    stopped = True
+                    records = [record for record in records
+                               if record is not self._STOP]
+
+                try:
+                    stream.write(''.join(
+                        json.dumps(record) + '\n' for record in records
+                    ))
+                    stream.flush()
+                except Exception:  # pylint: disable=broad-except
+                    self.log.exception("Failed to write the access log")
+        finally:
+            if owned:
+                stream.close()
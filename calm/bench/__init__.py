@@ -0,0 +1,26 @@
+"""
+This is the benchmark suite of the Calm request pipeline.
+
+Every scenario serves the same endpoint by a Calm Application and by a raw
+Tornado Application, which is the baseline, and loads them with concurrent
+requests from a client running in a separate process. The scenarios are:
+
+    * hello - a hello-world GET
+    * casting - path and query arguments casting
+    * consumes - a nested Resource request body
+    * produces - a large Resource list response
+    * not_found - requests to an undefined URL
+    * swagger - fetching the swagger.json
+    * websocket_echo - WebSocket message echo
+
+For every scenario and application, the throughput, the latency percentiles,
+the status distribution and the memory blocks and bytes allocated by the
+server per request are reported as JSON, so that the runs can be compared.
+
+Usage:
+    python -m calm.bench [--scenario hello --scenario casting]
+                         [--concurrency 32] [--duration 5 | --requests N]
+                         [--output results.json]
+"""
+from calm.bench.scenarios import Scenario, SCENARIOS  # noqa
+from calm.bench.runner import run, run_scenario  # noqa
@@ -0,0 +1,47 @@
+"""
+Runs the Calm benchmark suite, see `calm.bench`.
+"""
+import sys
+import json
+import argparse
+
+from tornado.ioloop import IOLoop
+
+from calm.bench import run, SCENARIOS
+
+
+def main(argv=None):
+    """The command line entry point."""
+    parser = argparse.ArgumentParser(prog='python -m calm.bench',
+                                     description=__doc__)
+    parser.add_argument('--scenario', action='append', dest='scenarios',
+                        choices=[s.name for s in SCENARIOS],
+                        help="the scenario to run, all by default")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5,
+                        help="seconds to load every application")
+    parser.add_argument('--requests', type=int, default=None,
+                        help="the number of requests per application, "
+                             "instead of the duration")
+    parser.add_argument('--output', default=None,
+                        help="the JSON file to write, stdout by default")
+    args = parser.parse_args(argv)
+
+    duration = None if args.requests else args.duration
+    results = IOLoop.current().run_sync(
+        lambda: run(args.scenarios,
+                    concurrency=args.concurrency,
+                    requests=args.requests,
+                    duration=duration)
+    )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+This module benchmarks the import time of Calm.
+
+Every statement is executed in fresh interpreters, reporting the median wall
+time in milliseconds and the heavy dependencies it has loaded, as JSON.
+
+Usage:
+    python -m calm.bench.imports [--runs 10]
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+
+__all__ = ['measure_import', 'STATEMENTS', 'HEAVY_MODULES']
+
+
+STATEMENTS = [
+    'import calm',
+    'import calm.ex',
+    'from calm import ArgumentParser',
+    'from calm import Application'
+]
+HEAVY_MODULES = ['tornado', 'tornado.web', 'tornado.websocket', 'untt',
+                 'jsonschema']
+
+_SCRIPT = '''
+import sys, json, time
+start = time.perf_counter()
+{statement}
+duration = time.perf_counter() - start
+print(json.dumps([duration, [m for m in {heavy!r} if m in sys.modules]]))
+'''
+
+
+def measure_import(statement, runs=5):
+    """
+    Executes the import `statement` in `runs` fresh interpreters.
+
+    Returns the median time in milliseconds and the heavy modules loaded.
+    """
+    script = _SCRIPT.format(statement=statement, heavy=HEAVY_MODULES)
+    durations = []
+    loaded = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', script])
+        duration, loaded = json.loads(output.decode('utf-8'))
+        durations.append(duration)
+
+    durations.sort()
+    return {
+        'statement': statement,
+        'median_ms': round(durations[len(durations) // 2] * 1000, 2),
+        'heavy_modules': loaded
+    }
+
+
+def main(argv=None):
+    """The command line entry point."""
+    parser = argparse.ArgumentParser(prog='python -m calm.bench.imports',
+                                     description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    results = [measure_import(s, args.runs) for s in STATEMENTS]
+    sys.stdout.write(json.dumps(results, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+This module defines the micro-benchmarks of the pure Calm components.
+
+Every case times a single call of a parser, a validator or a serializer on a
+representative input. The results are compared against a baseline file, and
+the run fails if any case is slower than its baseline by more than the
+tolerance percentage. The baseline is specific to the machine it was recorded
+on, so record it on the machine that runs the comparison.
+
+Usage:
+    python -m calm.bench.micro [--baseline calm-micro-baseline.json]
+                               [--tolerance 10] [--update]
+                               [--case resource.]
+
+The baseline is recorded when it does not exist yet, or when `--update` is
+given. The exit status is `1` when there are regressions.
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+
+from calm.codec import ArgumentParser
+from calm.core import CalmApp
+from calm.handler import HandlerDef
+from calm.param import ParameterJsonType
+from calm.bench.scenarios import BenchOrder, ORDER, _swagger_calm
+
+
+__all__ = ['measure', 'compare', 'format_comparison', 'main']
+
+
+DEFAULT_BASELINE = 'calm-micro-baseline.json'
+
+
+class _Integer(int):
+    pass
+
+
+async def _hello(request):
+    pass
+
+
+async def _get_post(request, user_id: int, post_id: int,
+                    limit: int = 10, full: bool = False, q=''):
+    pass
+
+
+def _generate_swagger(app):
+    """
+    Generates the swagger.json of `app` from scratch, dropping the operation
+    definitions cached on the handler definitions first.
+    """
+    for methods in app._route_map.values():  # pylint: disable=W0212
+        for handler_def in methods.values():
+            handler_def._operation_definition = None  # pylint: disable=W0212
+
+    return app.generate_swagger_json()
+
+
+def _cases():
+    """Returns the names and the functions of the micro-benchmark cases."""
+    parser = ArgumentParser()
+    order = BenchOrder.from_json(ORDER)
+    swagger_app = _swagger_calm()
+    swagger_app.make_app()
+
+    regexify = CalmApp('micro', '1')._regexify_uri  # pylint: disable=W0212
+    hello_uri = '/hello'
+    hello_regex = regexify(hello_uri)
+    post_uri = '/users/{user_id}/posts/{post_id}'
+    post_regex = regexify(post_uri)
+
+    return [
+        ('argument_parser.parse.int', lambda: parser.parse(int, '12345')),
+        ('argument_parser.parse.bool', lambda: parser.parse(bool, 'yes')),
+        ('param_json_type.basic',
+         lambda: ParameterJsonType.from_python_type(int)),
+        ('param_json_type.subclass',
+         lambda: ParameterJsonType.from_python_type(_Integer)),
+        ('param_json_type.array',
+         lambda: ParameterJsonType.from_python_type([int])),
+        ('handler_def.simple',
+         lambda: HandlerDef(hello_uri, hello_regex, _hello)),
+        ('handler_def.arguments',
+         lambda: HandlerDef(post_uri, post_regex, _get_post)),
+        ('resource.from_json', lambda: BenchOrder.from_json(ORDER)),
+        ('resource.validate', lambda: BenchOrder.validate(ORDER)),
+        ('resource.to_json', order.to_json),
+        ('swagger.generate', lambda: _generate_swagger(swagger_app)),
+    ]
+
+
+def measure(pattern=None, min_time=0.2, repeat=5):
+    """
+    Times the cases with names containing `pattern` (all by default).
+
+    Every case is called in batches taking at least `min_time` seconds, and
+    the best of `repeat` batches is taken. Returns a mapping of the case names
+    to the time of a single call in nanoseconds.
+    """
+    results = {}
+    for name, function in _cases():
+        if pattern and pattern not in name:
+            continue
+
+        timer = timeit.Timer(function)
+        number = 1
+        while timer.timeit(number) < min_time:
+            number *= 2
+        best = min(timer.repeat(repeat=repeat, number=number))
+        results[name] = round(best / number * 1e9, 1)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares the `results` against the `baseline`.
+
+    Returns the comparison rows of the case name, the baseline and current
+    times, the change percentage and whether it is a regression, i.e. slower
+    by more than `tolerance` percent. The cases missing in the baseline have
+    no baseline time and are never regressions.
+    """
+    rows = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None:
+            rows.append((name, None, current, None, False))
+            continue
+
+        change = (current - previous) / previous * 100
+        rows.append((name, previous, current, change, change > tolerance))
+
+    return rows
+
+
+def _format_time(nanoseconds):
+    if nanoseconds is None:
+        return '-'
+    if nanoseconds >= 1e6:
+        return '{:.2f} ms'.format(nanoseconds / 1e6)
+    if nanoseconds >= 1e3:
+        return '{:.2f} us'.format(nanoseconds / 1e3)
+
+    return '{:.1f} ns'.format(nanoseconds)
+
+
+def format_comparison(rows):
+    """Formats the comparison `rows` as a table."""
+    lines = ['{:<30} {:>12} {:>12} {:>9}'.format('case', 'baseline',
+                                                 'current', 'change')]
+    for name, previous, current, change, regression in rows:
+        lines.append('{:<30} {:>12} {:>12} {:>9}{}'.format(
+            name,
+            _format_time(previous),
+            _format_time(current),
+            '{:+.1f}%'.format(change) if change is not None else 'new',
+            '  REGRESSION' if regression else ''
+        ))
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """The command line entry point, returns the exit status."""
+    parser = argparse.ArgumentParser(prog='python -m calm.bench.micro',
+                                     description=__doc__)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help="the baseline file")
+    parser.add_argument('--tolerance', type=float, default=10,
+                        help="the allowed slowdown in percent")
+    parser.add_argument('--update', action='store_true',
+                        help="record the results as the new baseline")
+    parser.add_argument('--case', default=None,
+                        help="run only the cases containing this string")
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = measure(args.case, min_time=args.min_time, repeat=args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    rows = compare(results, baseline, args.tolerance)
+    sys.stdout.write(format_comparison(rows) + '\n')
+
+    if args.update or not baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        sys.stdout.write(
+            "\nThe baseline is recorded to '{}'\n".format(args.baseline)
+        )
+        return 0
+
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        sys.stderr.write(
+            "\n{} case(s) are more than {}% slower than the baseline: {}\n"
+            .format(len(regressions), args.tolerance, ', '.join(regressions))
+        )
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
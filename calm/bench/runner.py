@@ -0,0 +1,235 @@
+"""
+This module runs the Calm benchmark scenarios.
+
+The application under test is served on the IOLoop of the calling process,
+while the load is generated by a separate process, so that the work of the
+client does not delay the server nor count in its allocations.
+"""
+import gc
+import sys
+import logging
+import tracemalloc
+import multiprocessing
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+from tornado.websocket import websocket_connect
+
+from calm.testing import drive
+from calm.bench.scenarios import SCENARIOS
+
+
+__all__ = ['run_scenario', 'run', 'count_allocations']
+
+
+WARMUP_REQUESTS = 200
+ALLOCATION_REQUESTS = 200
+
+
+async def _http_request_factory(url, scenario, concurrency):
+    client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+
+    async def request(_):
+        resp = await client.fetch(url,
+                                  method=scenario.method,
+                                  body=scenario.body,
+                                  raise_error=False)
+        return resp.code
+
+    return request, client.close
+
+
+async def _websocket_request_factory(url, _, concurrency):
+    connections = [await websocket_connect(url) for _ in range(concurrency)]
+    message = 'x' * 64
+
+    async def request(worker):
+        connection = connections[worker]
+        connection.write_message(message)
+        echo = await connection.read_message()
+        return 200 if echo == message else 500
+
+    def close():
+        for connection in connections:
+            connection.close()
+
+    return request, close
+
+
+def _generate_load(connection, url, name, concurrency):
+    """
+    The load generator process. Loads `url` as the scenario `name` on every
+    `(requests, duration, concurrency)` command received on `connection`,
+    replying with the `drive` result, until `None` is received.
+    """
+    scenario = next(s for s in SCENARIOS if s.name == name)
+    factory = (_websocket_request_factory if scenario.websocket
+               else _http_request_factory)
+
+    async def serve():
+        request, close = await factory(url, scenario, concurrency)
+        try:
+            connection.send(None)
+            for command in iter(connection.recv, None):
+                requests, duration, workers = command
+                connection.send(await drive(request, workers,
+                                            requests=requests,
+                                            duration=duration))
+        finally:
+            close()
+
+    IOLoop.current().run_sync(serve)
+
+
+class _LoadProcess(object):
+    """The handle of the load generator process."""
+    def __init__(self, url, scenario, concurrency):
+        super(_LoadProcess, self).__init__()
+
+        self._concurrency = concurrency
+        # spawned, as a forked process would share the IOLoop poller
+        context = multiprocessing.get_context('spawn')
+        self._connection, child_connection = context.Pipe()
+        self._process = context.Process(
+            target=_generate_load,
+            args=(child_connection, url, scenario.name, concurrency),
+            daemon=True
+        )
+        self._process.start()
+
+    async def _receive(self):
+        # received off the IOLoop thread, which serves the load meanwhile
+        return await IOLoop.current().run_in_executor(None,
+                                                      self._connection.recv)
+
+    async def started(self):
+        """Waits until the load generator is connected."""
+        await self._receive()
+
+    async def drive(self, requests=None, duration=None, concurrency=None):
+        """Runs the load, returning the `calm.testing.drive` result."""
+        self._connection.send((requests, duration,
+                               concurrency or self._concurrency))
+        return await self._receive()
+
+    def close(self):
+        """Stops the load generator."""
+        try:
+            self._connection.send(None)
+        except OSError:
+            pass
+        self._process.join(5)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+
+
+async def count_allocations(drive_load, count=ALLOCATION_REQUESTS):
+    """
+    Returns the memory blocks and bytes allocated by this process per
+    request, while `await drive_load(count)` sends `count` requests to it one
+    by one.
+
+    The allocations are the difference of the tracemalloc snapshots taken
+    before and after the requests, with the cyclic garbage collector
+    disabled, so the reference cycles created per request, which cause the
+    garbage collection pauses, are counted. The blocks freed by reference
+    counting before the end of the requests are not.
+    """
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        await drive_load(count)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+
+    stats = after.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__)
+    ]).compare_to(before, 'filename')
+
+    return {
+        'blocks': round(sum(stat.count_diff for stat in stats) / count, 1),
+        'bytes': round(sum(stat.size_diff for stat in stats) / count)
+    }
+
+
+async def _run_app(app, scenario, concurrency, requests, duration):
+    sockets = bind_sockets(0, '127.0.0.1')
+    port = sockets[0].getsockname()[1]
+    server = HTTPServer(app)
+    server.add_sockets(sockets)
+
+    scheme = 'ws' if scenario.websocket else 'http'
+    url = '{}://127.0.0.1:{}{}'.format(scheme, port, scenario.path)
+    load = _LoadProcess(url, scenario, concurrency)
+
+    try:
+        await load.started()
+        await load.drive(requests=WARMUP_REQUESTS)
+        result = await load.drive(requests=requests, duration=duration)
+        result['allocations_per_request'] = await count_allocations(
+            lambda count: load.drive(requests=count, concurrency=1)
+        )
+    finally:
+        load.close()
+        server.stop()
+        await server.close_all_connections()
+
+    return result
+
+
+async def run_scenario(scenario, concurrency=32, requests=None,
+                       duration=5):
+    """
+    Runs `scenario` against Calm and against the raw Tornado baseline.
+
+    The logging is disabled during the run, so that the results do not
+    depend on the logging setup.
+    """
+    logging.disable(logging.CRITICAL)
+    try:
+        calm = await _run_app(scenario.make_calm_app().make_app(), scenario,
+                              concurrency, requests, duration)
+        tornado = await _run_app(scenario.make_tornado_app(), scenario,
+                                 concurrency, requests, duration)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    return {
+        'scenario': scenario.name,
+        'description': scenario.description,
+        'calm': calm,
+        'tornado': tornado,
+        'relative_rps': (round(calm['rps'] / tornado['rps'], 3)
+                         if calm['rps'] and tornado['rps'] else None)
+    }
+
+
+async def run(names=None, **kwargs):
+    """
+    Runs the scenarios with `names` (all by default) one by one.
+
+    The keyword arguments are passed to `run_scenario`.
+    """
+    scenarios = [s for s in SCENARIOS if names is None or s.name in names]
+    unknown = set(names or ()) - {s.name for s in scenarios}
+    if unknown:
+        raise ValueError(
+            "Unknown scenarios: {}".format(', '.join(sorted(unknown)))
+        )
+
+    results = []
+    for scenario in scenarios:
+        results.append(await run_scenario(scenario, **kwargs))
+
+    return {
+        'python': sys.version.split()[0],
+        'tornado': __import__('tornado').version,
+        'scenarios': results
+    }
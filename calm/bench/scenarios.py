@@ -0,0 +1,251 @@
+"""
+This module defines the canonical scenarios of the Calm benchmarks.
+
+Every scenario defines the same endpoint twice: as a Calm Application and as
+a raw Tornado Application doing the equivalent work by hand, which serves as
+the baseline.
+"""
+import json
+
+from tornado.web import Application, RequestHandler
+from tornado.websocket import WebSocketHandler
+
+from calm.core import CalmApp
+from calm.decorator import consumes, produces
+from calm.resource import Resource, Integer, String, Array
+
+
+__all__ = ['Scenario', 'SCENARIOS']
+
+
+class BenchAddress(Resource):
+    street = String()
+    city = String()
+    zip_code = String()
+
+
+class BenchCustomer(Resource):
+    name = String()
+    email = String()
+    address = BenchAddress.as_property()
+
+
+class BenchOrderLine(Resource):
+    sku = String()
+    quantity = Integer()
+
+
+class BenchOrder(Resource):
+    order_id = Integer()
+    customer = BenchCustomer.as_property()
+    lines = Array(items=BenchOrderLine.entity_schema)
+
+
+class BenchItem(Resource):
+    item_id = Integer()
+    name = String()
+    tags = Array(items={'type': 'string'})
+
+
+class BenchItemList(Resource):
+    items = Array(items=BenchItem.entity_schema)
+
+
+ORDER = {
+    'order_id': 42,
+    'customer': {
+        'name': 'Jane Doe',
+        'email': 'jane@example.com',
+        'address': {
+            'street': '1 Main St',
+            'city': 'Springfield',
+            'zip_code': '12345'
+        }
+    },
+    'lines': [{'sku': 'SKU-{}'.format(i), 'quantity': i} for i in range(10)]
+}
+
+ITEMS = {
+    'items': [
+        {'item_id': i, 'name': 'item {}'.format(i), 'tags': ['a', 'b']}
+        for i in range(1000)
+    ]
+}
+
+
+class Scenario(object):
+    """
+    A benchmark scenario.
+
+    Arguments:
+        * name - the name of the scenario
+        * description - what the scenario measures
+        * make_calm_app - returns the Calm Application of the scenario
+        * make_tornado_app - returns the baseline Tornado Application
+        * path - the path to request
+        * method - the HTTP method
+        * body - the request body
+        * websocket - whether the path is a WebSocket echo endpoint
+    """
+    def __init__(self, name, description, make_calm_app, make_tornado_app,
+                 path, *, method='GET', body=None, websocket=False):
+        super(Scenario, self).__init__()
+
+        self.name = name
+        self.description = description
+        self.make_calm_app = make_calm_app
+        self.make_tornado_app = make_tornado_app
+        self.path = path
+        self.method = method
+        self.body = body
+        self.websocket = websocket
+
+
+class _JSONHandler(RequestHandler):
+    def write_json(self, value):
+        self.set_header('Content-Type', 'application/json')
+        self.finish(json.dumps(value))
+
+
+def _hello_calm():
+    app = CalmApp('bench', '1')
+
+    @app.get('/hello')
+    async def hello(request):
+        return 'Hello, World!'
+
+    return app
+
+
+def _hello_tornado():
+    class HelloHandler(_JSONHandler):
+        async def get(self):
+            self.write_json('Hello, World!')
+
+    return Application([('/hello', HelloHandler)])
+
+
+def _casting_calm():
+    app = CalmApp('bench', '1')
+
+    @app.get('/users/{user_id}/posts/{post_id}')
+    async def get_post(request, user_id: int, post_id: int,
+                       limit: int = 10, full: bool = False, q=''):
+        return [user_id, post_id, limit, full, q]
+
+    return app
+
+
+def _casting_tornado():
+    class PostHandler(_JSONHandler):
+        async def get(self, user_id, post_id):
+            limit = int(self.get_query_argument('limit', '10'))
+            full = self.get_query_argument('full', 'no') in ('yes', 'true',
+                                                            '1')
+            query = self.get_query_argument('q', '')
+            self.write_json([int(user_id), int(post_id), limit, full, query])
+
+    return Application([(r'/users/([^/]+)/posts/([^/]+)', PostHandler)])
+
+
+def _consumes_calm():
+    app = CalmApp('bench', '1')
+
+    @app.post('/orders')
+    @consumes(BenchOrder)
+    async def create_order(request):
+        return {'order_id': request.body.order_id}
+
+    return app
+
+
+def _consumes_tornado():
+    class OrderHandler(_JSONHandler):
+        async def post(self):
+            order = json.loads(self.request.body.decode('utf-8'))
+            self.write_json({'order_id': order['order_id']})
+
+    return Application([('/orders', OrderHandler)])
+
+
+def _produces_calm():
+    app = CalmApp('bench', '1')
+
+    @app.get('/items')
+    @produces(BenchItemList)
+    async def list_items(request):
+        return ITEMS
+
+    return app
+
+
+def _produces_tornado():
+    class ItemsHandler(_JSONHandler):
+        async def get(self):
+            self.write_json(ITEMS)
+
+    return Application([('/items', ItemsHandler)])
+
+
+def _not_found_tornado():
+    return Application([('/hello', RequestHandler)])
+
+
+def _swagger_calm():
+    app = _consumes_calm()
+
+    @app.get('/items/{item_id}')
+    @produces(BenchItem)
+    async def get_item(request, item_id: int, verbose: bool = False):
+        """Returns the item."""
+        pass
+
+    return app
+
+
+def _swagger_tornado():
+    calm_app = _swagger_calm()
+    calm_app.make_app()
+    swagger_json = calm_app.swagger_json
+
+    class SwaggerHandler(_JSONHandler):
+        async def get(self):
+            self.write_json(swagger_json)
+
+    return Application([('/swagger.json', SwaggerHandler)])
+
+
+class _EchoHandler(WebSocketHandler):
+    def on_message(self, message):
+        self.write_message(message)
+
+
+def _echo_calm():
+    app = CalmApp('bench', '1')
+    app.websocket('/echo')(_EchoHandler)
+
+    return app
+
+
+def _echo_tornado():
+    return Application([('/echo', _EchoHandler)])
+
+
+SCENARIOS = [
+    Scenario('hello', "A hello-world GET",
+             _hello_calm, _hello_tornado, '/hello'),
+    Scenario('casting', "Path and query arguments casting",
+             _casting_calm, _casting_tornado,
+             '/users/12/posts/34?limit=20&full=yes&q=text'),
+    Scenario('consumes', "A nested Resource request body",
+             _consumes_calm, _consumes_tornado, '/orders',
+             method='POST', body=json.dumps(ORDER)),
+    Scenario('produces', "A large Resource list response",
+             _produces_calm, _produces_tornado, '/items'),
+    Scenario('not_found', "Requests to an undefined URL",
+             _hello_calm, _not_found_tornado, '/not/found'),
+    Scenario('swagger', "Fetching the swagger.json",
+             _swagger_calm, _swagger_tornado, '/swagger.json'),
+    Scenario('websocket_echo', "WebSocket message echo",
+             _echo_calm, _echo_tornado, '/echo', websocket=True)
+]
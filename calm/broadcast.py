@@ -0,0 +1,219 @@
+"""
+This module defines the WebSocket broadcasting of Calm.
+
+Every Calm Application has a `BroadcastHub` as its `broadcast` attribute.
+The WebSocket connections subscribe to topics, and the messages published to
+a topic are delivered to all its subscribers:
+
+    @app.websocket('/prices')
+    class PricesWebSocket(WebSocketHandler):
+        def open(self):
+            app.broadcast.subscribe(self, 'prices')
+
+    app.broadcast.publish('prices', {'EUR': 1.08})
+
+The delivery works as follows:
+
+    * a message is encoded to bytes once per publish, not per connection
+    * every connection has a bounded queue of the messages to send, so a
+      slow client holds at most `max_queue` messages
+    * when the queue of a connection is full, the `overflow` policy either
+      drops its oldest message (`drop`) or closes the connection with `1013`
+      (Try Again Later) code (`disconnect`)
+    * every connection is written by its own task, waiting for the previous
+      message to be flushed, so publishing never blocks and a slow client
+      does not delay the others
+
+The connections of the handlers registered via `CalmApp.websocket` are
+unsubscribed automatically when closed. To deliver the messages to the
+subscribers of the other processes as well, connect the hubs to a broker, see
+`calm.broker`.
+"""
+import json
+from collections import deque, defaultdict
+
+from tornado.ioloop import IOLoop
+from tornado.websocket import WebSocketClosedError
+
+from calm.ex import DefinitionError
+
+
+__all__ = ['BroadcastHub']
+
+
+class _Subscriber(object):
+    """The queue of the messages to send to a connection."""
+    __slots__ = ('connection', 'topics', 'queue', 'writing')
+
+    def __init__(self, connection, max_queue):
+        self.connection = connection
+        self.topics = set()
+        self.queue = deque(maxlen=max_queue)
+        self.writing = False
+
+
+class BroadcastHub(object):
+    """
+    Delivers the messages published to topics to the subscribed connections.
+
+    Arguments:
+        * max_queue - the number of the messages queued per connection
+        * overflow - `drop` or `disconnect`, the policy applied when the queue
+                     of a connection is full
+    """
+    OVERFLOW_POLICIES = ('drop', 'disconnect')
+    OVERFLOW_CLOSE_CODE = 1013
+
+    def __init__(self, max_queue=100, overflow='drop'):
+        super(BroadcastHub, self).__init__()
+
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.dropped = 0
+        self.disconnected = 0
+        self.broker = None
+
+        self._subscribers = {}
+        self._topics = defaultdict(set)
+
+    def configure(self, max_queue, overflow):
+        """Sets the queue size and the overflow policy."""
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise DefinitionError(
+                "Unknown broadcast overflow policy '{}'".format(overflow)
+            )
+
+        self.max_queue = max_queue
+        self.overflow = overflow
+
+    def subscribe(self, connection, topic):
+        """Subscribes the WebSocket `connection` to `topic`."""
+        subscriber = self._subscribers.get(connection)
+        if subscriber is None:
+            subscriber = self._subscribers[connection] = _Subscriber(
+                connection, self.max_queue
+            )
+
+        subscriber.topics.add(topic)
+        self._topics[topic].add(subscriber)
+
+    def unsubscribe(self, connection, topic=None):
+        """Unsubscribes `connection` from `topic`, or from all topics."""
+        subscriber = self._subscribers.get(connection)
+        if subscriber is None:
+            return
+
+        topics = [topic] if topic is not None else list(subscriber.topics)
+        for unsubscribed in topics:
+            subscriber.topics.discard(unsubscribed)
+            subscribers = self._topics.get(unsubscribed)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._topics[unsubscribed]
+
+        if not subscriber.topics:
+            del self._subscribers[connection]
+            subscriber.queue.clear()
+
+    def subscribers(self, topic):
+        """Returns the number of the connections subscribed to `topic`."""
+        return len(self._topics.get(topic, ()))
+
+    def queued_bytes(self, connection):
+        """Returns the size of the messages queued for `connection`."""
+        subscriber = self._subscribers.get(connection)
+        if subscriber is None:
+            return 0
+
+        return sum(len(message) for message, _ in subscriber.queue)
+
+    def publish(self, topic, message, binary=False):
+        """
+        Queues `message` for the subscribers of `topic`.
+
+        A `str` message is encoded as UTF-8, `bytes` are sent as is and the
+        other messages are encoded as JSON. The message is forwarded to the
+        other processes too, when the hub is connected to a `broker`. Returns
+        the number of the local connections the message is queued for.
+        """
+        broker = self.broker
+        subscribers = self._topics.get(topic)
+        if not subscribers and broker is None:
+            return 0
+
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        elif not isinstance(message, bytes):
+            message = json.dumps(message).encode('utf-8')
+
+        if broker is not None:
+            broker.forward(topic, message, binary)
+
+        return self.deliver(topic, message, binary)
+
+    def deliver(self, topic, message, binary=False):
+        """
+        Queues the encoded `message` for the local subscribers of `topic`.
+
+        Returns the number of the connections the message is queued for.
+        """
+        subscribers = self._topics.get(topic)
+        if not subscribers:
+            return 0
+
+        queued = 0
+        for subscriber in list(subscribers):
+            queue = subscriber.queue
+            if len(queue) == queue.maxlen:
+                if self.overflow == 'disconnect':
+                    self._disconnect(subscriber)
+                    continue
+
+                # the deque drops the oldest message
+                self.dropped += 1
+
+            queue.append((message, binary))
+            queued += 1
+            if not subscriber.writing:
+                subscriber.writing = True
+                IOLoop.current().spawn_callback(self._write, subscriber)
+
+        return queued
+
+    async def _write(self, subscriber):
+        """Writes the queued messages to the connection one by one."""
+        queue = subscriber.queue
+        try:
+            while queue:
+                message, binary = queue.popleft()
+                await subscriber.connection.write_message(message,
+                                                          binary=binary)
+        except WebSocketClosedError:
+            self.unsubscribe(subscriber.connection)
+        finally:
+            subscriber.writing = False
+
+    def _disconnect(self, subscriber):
+        """Closes the connection of the `subscriber` that cannot keep up."""
+        self.disconnected += 1
+        self.unsubscribe(subscriber.connection)
+        subscriber.connection.close(self.OVERFLOW_CLOSE_CODE,
+                                    "Broadcast queue overflow")
+
+    def collect(self):
+        """Returns the broadcast metrics in the Prometheus format."""
+        return [
+            '# HELP calm_broadcast_subscribers '
+            'WebSocket connections subscribed to broadcast topics.',
+            '# TYPE calm_broadcast_subscribers gauge',
+            'calm_broadcast_subscribers {}'.format(len(self._subscribers)),
+            '# HELP calm_broadcast_dropped_total '
+            'Broadcast messages dropped because a queue was full.',
+            '# TYPE calm_broadcast_dropped_total counter',
+            'calm_broadcast_dropped_total {}'.format(self.dropped),
+            '# HELP calm_broadcast_disconnected_total '
+            'WebSocket connections closed because a queue was full.',
+            '# TYPE calm_broadcast_disconnected_total counter',
+            'calm_broadcast_disconnected_total {}'.format(self.disconnected)
+        ]
@@ -0,0 +1,358 @@
+"""
+This module defines the cross-process publishing of the Calm broadcasts.
+
+When the application is served by several processes, every process has its
+own `BroadcastHub`, so a message published in one process reaches only the
+WebSocket connections of that process. The `Broker` relays the messages
+between the processes over a Unix socket:
+
+    * every process connects its hub to the broker with a `BrokerClient`,
+      e.g. by the `broker_path` configuration, and the messages published to
+      the hub are forwarded to the broker as well
+    * with the `embedded` option, e.g. by the `broker_embedded`
+      configuration, the first process which finds no broker runs the broker
+      itself, and connects to it like the other processes do, so that no
+      separate service is needed. The processes take the lock of the socket
+      (the `.lock` file next to it) to run the broker, so only one of them
+      does, and another one takes over when that process exits
+    * the messages published during an IOLoop iteration are sent to the
+      broker in a single write
+    * the broker relays the received data as is to every other connected
+      process in a single write per process, without decoding the messages,
+      and every process delivers them to its local subscribers
+    * the messages for a process which has more than `max_buffer_size` bytes
+      waiting to be written are dropped, so that a stalled process does not
+      make the broker buffer without bounds
+    * the frames longer than `MAX_FRAME_SIZE` are not published, and a peer
+      announcing one is disconnected
+
+Every message is a frame of a 4-byte big-endian length, followed by a 2-byte
+topic length, a binary flag byte, the UTF-8 encoded topic and the encoded
+message.
+
+The broker can also be run in a separate process by:
+
+    python -m calm.broker /path/to/broker.sock
+"""
+import sys
+import fcntl
+import socket
+import struct
+import logging
+import argparse
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.iostream import IOStream, StreamClosedError
+from tornado.netutil import bind_unix_socket
+from tornado.tcpserver import TCPServer
+
+
+__all__ = ['Broker', 'BrokerClient', 'encode_frame', 'split_frames',
+           'count_frames', 'decode_frames']
+
+
+_LENGTH = struct.Struct('!I')
+_HEADER = struct.Struct('!HB')
+READ_CHUNK_SIZE = 65536
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def encode_frame(topic, message, binary=False):
+    """Returns the frame of the encoded `message` published to `topic`."""
+    topic = topic.encode('utf-8')
+    body = b''.join([_HEADER.pack(len(topic), binary), topic, message])
+
+    return _LENGTH.pack(len(body)) + body
+
+
+def split_frames(data):
+    """
+    Splits `data` into the complete frames and the incomplete rest.
+
+    Returns the length of the complete frames in `data`.
+    """
+    offset = 0
+    size = len(data)
+    while size - offset >= _LENGTH.size:
+        end = offset + _LENGTH.size + _LENGTH.unpack_from(data, offset)[0]
+        if end > size:
+            break
+        offset = end
+
+    return offset
+
+
+def count_frames(data):
+    """Returns the number of the complete frames in `data`."""
+    count = offset = 0
+    size = len(data)
+    while size - offset >= _LENGTH.size:
+        offset += _LENGTH.size + _LENGTH.unpack_from(data, offset)[0]
+        if offset > size:
+            break
+        count += 1
+
+    return count
+
+
+def decode_frames(data):
+    """Yields the `(topic, message, binary)` of the complete frames."""
+    offset = 0
+    while offset < len(data):
+        length, = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        topic_length, binary = _HEADER.unpack_from(data, offset)
+        topic_start = offset + _HEADER.size
+        message_start = topic_start + topic_length
+        yield (bytes(data[topic_start:message_start]).decode('utf-8'),
+               bytes(data[message_start:offset + length]),
+               bool(binary))
+        offset += length
+
+
+async def _read_frames(stream, handle):
+    """
+    Reads the frames from `stream`, calling `handle` with every batch.
+
+    Closes `stream` and returns when a frame is longer than `MAX_FRAME_SIZE`.
+    """
+    buffer = bytearray()
+    while True:
+        buffer += await stream.read_bytes(READ_CHUNK_SIZE, partial=True)
+        complete = split_frames(buffer)
+        if complete:
+            handle(bytes(buffer[:complete]))
+            del buffer[:complete]
+
+        if (len(buffer) >= _LENGTH.size and
+                _LENGTH.unpack_from(buffer)[0] > MAX_FRAME_SIZE):
+            logging.getLogger('calm').warning(
+                "Closing the broker connection sending a frame of %d bytes",
+                _LENGTH.unpack_from(buffer)[0]
+            )
+            stream.close()
+            return
+
+
+class Broker(TCPServer):
+    """
+    Relays the frames of every connected process to the other ones.
+
+    The frames for a process with more than `max_buffer_size` bytes waiting
+    to be written are dropped, and counted in `dropped`. The bytes waiting
+    are the ones written to the stream of the process and not flushed yet.
+    """
+    def __init__(self, path, max_buffer_size=16 * 1024 * 1024):
+        super(Broker, self).__init__()
+
+        self.path = path
+        self.max_buffer_size = max_buffer_size
+        self.streams = set()
+        self.dropped = 0
+
+        self._buffered = {}
+        self._lock = None
+        self.log = logging.getLogger('calm')
+
+    def start_serving(self):
+        """
+        Starts accepting the processes on the Unix socket.
+
+        Returns `False`, without binding the socket, if another broker holds
+        its lock.
+        """
+        lock = open(self.path + '.lock', 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+
+        self._lock = lock
+        self.add_socket(bind_unix_socket(self.path))
+        return True
+
+    def stop(self):
+        """Stops accepting the processes and releases the lock."""
+        super(Broker, self).stop()
+
+        for stream in list(self.streams):
+            stream.close()
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    async def handle_stream(self, stream, address):
+        self.streams.add(stream)
+        try:
+            await _read_frames(stream,
+                               lambda frames: self.relay(stream, frames))
+        except StreamClosedError:
+            pass
+        finally:
+            self.streams.discard(stream)
+            self._buffered.pop(stream, None)
+
+    def relay(self, sender, frames):
+        """Writes the `frames` received from `sender` to the others."""
+        size = len(frames)
+        for stream in list(self.streams):
+            if stream is sender:
+                continue
+
+            if self._buffered.get(stream, 0) > self.max_buffer_size:
+                self.dropped += count_frames(frames)
+                continue
+
+            try:
+                written = stream.write(frames)
+            except StreamClosedError:
+                self.streams.discard(stream)
+                continue
+
+            self._buffered[stream] = self._buffered.get(stream, 0) + size
+            written.add_done_callback(
+                lambda future, stream=stream: self._flushed(stream, size,
+                                                            future)
+            )
+
+    def _flushed(self, stream, size, future):
+        """Accounts the `size` bytes flushed to `stream`."""
+        future.exception()  # the closed streams are handled by handle_stream
+        if stream in self._buffered:
+            self._buffered[stream] -= size
+
+
+class BrokerClient(object):
+    """
+    Connects the broadcast `hub` to the broker listening on `path`.
+
+    The client reconnects every `reconnect_interval` seconds while the broker
+    is unavailable, and the messages published meanwhile are not forwarded.
+    When `embedded` is set, the client starts the broker itself instead, if
+    no other process runs it.
+    """
+    def __init__(self, path, hub, reconnect_interval=1, embedded=False):
+        super(BrokerClient, self).__init__()
+
+        self.path = path
+        self.hub = hub
+        self.reconnect_interval = reconnect_interval
+        self.embedded = embedded
+        self.embedded_broker = None
+        self.dropped = 0
+
+        self._stream = None
+        self._pending = None
+        self._closed = False
+
+        self.log = logging.getLogger('calm')
+
+    @property
+    def connected(self):
+        """Whether the client is connected to the broker."""
+        return self._stream is not None
+
+    async def connect(self):
+        """Connects to the broker and attaches to the hub."""
+        self.hub.broker = self
+        self._closed = False
+        while not self._closed:
+            stream = IOStream(socket.socket(socket.AF_UNIX))
+            try:
+                await stream.connect(self.path)
+            except (StreamClosedError, OSError):
+                stream.close()
+                if self.embedded and self.embedded_broker is None:
+                    broker = Broker(self.path)
+                    if broker.start_serving():
+                        self.log.info("Serving the broker at '%s'",
+                                      self.path)
+                        self.embedded_broker = broker
+                        continue
+                self.log.warning("Could not connect to the broker at '%s'",
+                                 self.path)
+                await gen.sleep(self.reconnect_interval)
+                continue
+
+            self._stream = stream
+            IOLoop.current().spawn_callback(self._receive, stream)
+            return
+
+    async def _receive(self, stream):
+        try:
+            await _read_frames(stream, self._deliver)
+        except StreamClosedError:
+            pass
+
+        if self._stream is stream:
+            self._stream = None
+        if not self._closed:
+            self.log.warning("Lost the connection to the broker at '%s'",
+                             self.path)
+            await gen.sleep(self.reconnect_interval)
+            await self.connect()
+
+    def _deliver(self, frames):
+        for topic, message, binary in decode_frames(frames):
+            self.hub.deliver(topic, message, binary)
+
+    def forward(self, topic, message, binary=False):
+        """Queues the encoded `message` to be sent to the broker."""
+        if self._stream is None:
+            self.dropped += 1
+            return
+
+        frame = encode_frame(topic, message, binary)
+        if len(frame) - _LENGTH.size > MAX_FRAME_SIZE:
+            self.log.warning("Not forwarding a message of %d bytes to '%s'",
+                             len(message), topic)
+            self.dropped += 1
+            return
+        if self._pending is None:
+            self._pending = [frame]
+            IOLoop.current().add_callback(self._flush)
+        else:
+            self._pending.append(frame)
+
+    def _flush(self):
+        """Writes the frames queued during the IOLoop iteration at once."""
+        pending = self._pending
+        self._pending = None
+        if not pending or self._stream is None:
+            return
+
+        try:
+            self._stream.write(b''.join(pending))
+        except StreamClosedError:
+            self.dropped += len(pending)
+
+    def close(self):
+        """Disconnects from the broker and detaches from the hub."""
+        self._closed = True
+        if self.hub.broker is self:
+            self.hub.broker = None
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        if self.embedded_broker is not None:
+            self.embedded_broker.stop()
+            self.embedded_broker = None
+
+
+def main(argv=None):
+    """The command line entry point."""
+    parser = argparse.ArgumentParser(prog='python -m calm.broker',
+                                     description=__doc__)
+    parser.add_argument('path', help="the Unix socket path")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if not Broker(args.path).start_serving():
+        parser.error("a broker is running at '{}' already".format(args.path))
+    IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,10 +6,22 @@ Classes:
                       provide custom parsers to convert request ArgumentParser
                       (path, query) to custom types
 """
+import functools
 
 from calm.ex import DefinitionError, ArgumentParseError
 
 
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError as ex:
+        raise DefinitionError(
+            "NumPy is required for the vectorized array arguments"
+        ) from ex
+
+    return numpy
+
+
 class ArgumentParser(object):
     """
     Extensible default parser for request arguments (path, query).
@@ -20,7 +32,21 @@ class ArgumentParser(object):
     extended by the user, to add more built-in or custom types.
 
     The default types supported are:
+        `str` - keeps the value as is
         `int` - parses base 10 number string into `int` object
+        `float` - parses decimal number string into `float` object
+        `bool` - parses true/false, yes/no and 1/0 into `bool` object
+        `[T]` - parses an array of `T` items, where the values are given by
+                repeating the argument and/or separating them by commas,
+                e.g. `?ids=1,2&ids=3` is parsed into `[1, 2, 3]`
+
+    The `int` and `float` arrays can be converted by NumPy in a single
+    vectorized operation instead of parsing the items one by one. This is
+    enabled by setting the `vectorized_arrays` attribute to `True` in a
+    subclass, and requires NumPy to be installed. The handlers then receive
+    the arrays of at least `VECTORIZE_MIN_SIZE` items as `numpy.ndarray`
+    objects, and the values out of the range of the NumPy type are rejected
+    with `ArgumentParseError`.
 
     To extend this class in a subclass, the user must define a class/instances
     attribute named `parser` which should be of type `dict`, mapping types to
@@ -47,32 +73,137 @@ class ArgumentParser(object):
     supply the subclass to the `calm.Application.configure` method, using the
     `argument_parser` key.
 
+    The parsers of the handler arguments are resolved once by `resolve` when
+    the application is made, so a missing parser is reported at startup. The
+    parsed values of the types listed in the `memoized_types` attribute are
+    memoized, up to `MEMO_SIZE` values per type, which is useful for the
+    costly parsers of the types with a few distinct values, e.g. enums.
+
     Side Effects:
         `DefinitionError`    - raises when a parser is not implemented for a
                                requested type
         `ArgumentParseError` - raises when the parsing fails for some reason
     """
+    vectorized_arrays = False
+    VECTORIZED_TYPES = {int: 'int64', float: 'float64'}
+    VECTORIZE_MIN_SIZE = 64
+    memoized_types = ()
+    MEMO_SIZE = 256
+    BOOL_VALUES = {
+        'true': True,
+        'false': False,
+        '1': True,
+        '0': False,
+        'yes': True,
+        'no': False
+    }
+
     def __init__(self):
         super(ArgumentParser, self).__init__()
 
         self._parsers = {
+            str: str,
             int: self.parse_int,
+            float: self.parse_float,
             bool: self.parse_bool
         }
 
     def parse(self, arg_type, value):
         """Parses the `value` to `arg_type` using the appropriate parser."""
-        if arg_type not in self._parsers:
-            if hasattr(arg_type, 'parse'):
-                return arg_type.parse(value)
-
-            raise DefinitionError(
-                "Argument parser for '{}' is not defined".format(
-                    arg_type
-                )
-            )
+        return self._find_parser(arg_type)(value)
+
+    def resolve(self, arg_type):
+        """
+        Returns the parser function of `arg_type`, memoized if `arg_type` is
+        one of the `memoized_types`.
+        """
+        parser = self._find_parser(arg_type)
+        if (not isinstance(arg_type, list) and
+                arg_type in self.memoized_types):
+            parser = functools.lru_cache(maxsize=self.MEMO_SIZE)(parser)
+
+        return parser
+
+    def _find_parser(self, arg_type):
+        if isinstance(arg_type, list):
+            item_type = arg_type[0]
+            item_parser = (None if item_type is str
+                           else self._find_parser(item_type))
+            return functools.partial(self.parse_array, item_type,
+                                     item_parser=item_parser)
+
+        try:
+            return self._parsers[arg_type]
+        except (KeyError, TypeError):
+            pass
 
-        return self._parsers[arg_type](value)
+        if hasattr(arg_type, 'parse'):
+            return arg_type.parse
+
+        raise DefinitionError(
+            "Argument parser for '{}' is not defined".format(
+                arg_type
+            )
+        )
+
+    def parse_array(self, item_type, values, item_parser=None):
+        """
+        Parses the array `values` to a list of `item_type` objects.
+
+        The `values` is either a single value or a list of the repeated
+        argument values, every value being split by commas. The items are
+        parsed by `item_parser`, when it is resolved already.
+        """
+        if isinstance(values, str):
+            values = [values]
+
+        items = [item.strip()
+                 for value in values if value
+                 for item in value.split(',')]
+
+        if item_type is str:
+            return items
+
+        vectorized = (self.vectorized_arrays and
+                      item_type in self.VECTORIZED_TYPES and
+                      len(items) >= self.VECTORIZE_MIN_SIZE)
+        if vectorized:
+            numpy = _import_numpy()
+            dtype = self.VECTORIZED_TYPES[item_type]
+            try:
+                return numpy.array(items).astype(dtype)
+            except (ValueError, OverflowError):
+                # parse the items one by one to report the bad one
+                pass
+
+        if item_parser is None:
+            item_parser = self._find_parser(item_type)
+
+        parsed = []
+        for index, item in enumerate(items):
+            try:
+                parsed.append(item_parser(item))
+            except ArgumentParseError as ex:
+                raise ArgumentParseError(
+                    "{} (at index {})".format(ex, index)
+                ) from ex
+
+        if vectorized:
+            # the items NumPy does not parse itself, e.g. `1_000`, are
+            # converted as well, so that the handlers always get an ndarray
+            for index, item in enumerate(parsed):
+                try:
+                    numpy.array(item, dtype=dtype)
+                except OverflowError as ex:
+                    raise ArgumentParseError(
+                        "Value out of range for {}: {} (at index {})".format(
+                            dtype, items[index], index
+                        )
+                    ) from ex
+
+            return numpy.array(parsed, dtype=dtype)
+
+        return parsed
 
     @classmethod
     def parse_int(cls, value):
@@ -84,18 +215,21 @@ class ArgumentParser(object):
                 "Bad value for integer: {}".format(value)
             )
 
+    @classmethod
+    def parse_float(cls, value):
+        """Parses a decimal string to `float` object."""
+        try:
+            return float(value)
+        except ValueError:
+            raise ArgumentParseError(
+                "Bad value for number: {}".format(value)
+            )
+
     @classmethod
     def parse_bool(cls, value):
-        """Parses a base 10 string to `int` object."""
+        """Parses true/false, yes/no or 1/0 string to `bool` object."""
         try:
-            return {
-                'true': True,
-                'false': False,
-                '1': True,
-                '0': False,
-                'yes': True,
-                'no': False
-            }[value.lower()]
+            return cls.BOOL_VALUES[value.lower()]
         except KeyError:
             raise ArgumentParseError(
                 "Bad value for boolean: {}".format(value)
@@ -0,0 +1,353 @@
+"""
+This module defines the connection management of the Calm WebSockets.
+
+Every Calm Application has a `ConnectionManager` as its `connections`
+attribute, which watches the WebSocket connections of the handlers
+registered via `CalmApp.websocket`:
+
+    * the connections are pinged every `ping_interval` seconds, and a
+      connection which has not answered the previous ping, nor sent any
+      message since, is closed as half-dead
+    * a connection which has not sent a message for `idle_timeout` seconds
+      is closed, as well as a connection open for `max_lifetime` seconds
+    * the new connections are refused with `503` status while there are
+      `max_connections` connections open
+    * the open connections, the bytes queued for them and the messages
+      received and sent are counted per URI and exposed as metrics
+
+The timers of all the connections are kept in a single `TimerWheel`, instead
+of an IOLoop timeout per connection: every connection has a single timer at
+its nearest deadline, and the wheel fires the timers of a slot once per tick.
+"""
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from calm.metrics import format_labels
+
+
+__all__ = ['TimerWheel', 'ConnectionManager']
+
+
+class _Timer(object):
+    """A callback scheduled on the `TimerWheel`."""
+    __slots__ = ('callback', 'rounds', 'cancelled')
+
+    def __init__(self, callback, rounds):
+        self.callback = callback
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self):
+        """Cancels the timer."""
+        self.cancelled = True
+
+
+class TimerWheel(object):
+    """
+    A hashed timer wheel with `slots` slots of `tick` seconds.
+
+    The timers fire up to a `tick` late. The wheel runs its periodic callback
+    only while it has timers.
+    """
+    def __init__(self, tick=1, slots=64):
+        super(TimerWheel, self).__init__()
+
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._cursor = 0
+        self._timers = 0
+        self._periodic = None
+
+    def __len__(self):
+        return self._timers
+
+    def schedule(self, delay, callback):
+        """Schedules `callback` in `delay` seconds and returns the timer."""
+        ticks = max(1, -(-delay // self.tick))
+        rounds, offset = divmod(int(ticks) - 1, len(self._slots))
+        timer = _Timer(callback, rounds)
+        slot = (self._cursor + offset + 1) % len(self._slots)
+        self._slots[slot].append(timer)
+        self._timers += 1
+
+        if self._periodic is None:
+            self._periodic = PeriodicCallback(self._advance, self.tick * 1000)
+            self._periodic.start()
+
+        return timer
+
+    def _advance(self):
+        """Moves to the next slot and fires its due timers."""
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        timers = self._slots[self._cursor]
+        pending = []
+        due = []
+        for timer in timers:
+            if timer.cancelled:
+                continue
+            if timer.rounds:
+                timer.rounds -= 1
+                pending.append(timer)
+            else:
+                due.append(timer)
+
+        self._timers -= len(timers) - len(pending)
+        self._slots[self._cursor] = pending
+        for timer in due:
+            timer.callback()
+
+        if not self._timers:
+            self.stop()
+
+    def stop(self):
+        """Stops the periodic callback until a timer is scheduled."""
+        if self._periodic is not None:
+            self._periodic.stop()
+            self._periodic = None
+
+
+class _Connection(object):
+    """The state of a managed WebSocket connection."""
+    __slots__ = ('websocket', 'uri', 'opened', 'last_message', 'last_ping',
+                 'last_pong', 'timer')
+
+    def __init__(self, websocket, uri, now):
+        self.websocket = websocket
+        self.uri = uri
+        self.opened = now
+        self.last_message = now
+        self.last_ping = None
+        self.last_pong = None
+        self.timer = None
+
+
+class _URIStats(object):
+    """The counters of the connections of a URI."""
+    __slots__ = ('open', 'received', 'sent', 'sent_bytes', 'rejected',
+                 'evicted')
+
+    def __init__(self):
+        self.open = 0
+        self.received = 0
+        self.sent = 0
+        self.sent_bytes = 0
+        self.rejected = 0
+        self.evicted = 0
+
+
+class ConnectionManager(object):
+    """
+    Watches the open WebSocket connections.
+
+    Arguments:
+        * ping_interval - the seconds between the pings of a connection
+        * idle_timeout - the seconds a connection may stay without messages
+        * max_lifetime - the seconds a connection may stay open
+        * max_connections - the number of the connections accepted at once
+        * tick - the resolution of the timers in seconds
+    """
+    IDLE_CLOSE_CODE = 1000
+    LIFETIME_CLOSE_CODE = 1001
+    UNRESPONSIVE_CLOSE_CODE = 1001
+
+    def __init__(self, ping_interval=None, idle_timeout=None,
+                 max_lifetime=None, max_connections=None, tick=1):
+        super(ConnectionManager, self).__init__()
+
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.max_connections = max_connections
+        self.wheel = TimerWheel(tick)
+        self.broadcast = None
+
+        self._connections = {}
+        self._stats = {}
+
+    def configure(self, ping_interval, idle_timeout, max_lifetime,
+                  max_connections, tick):
+        """Sets the timeouts, the connection cap and the timer resolution."""
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.max_connections = max_connections
+        self.wheel.tick = tick
+
+    def __len__(self):
+        return len(self._connections)
+
+    def stats(self, uri):
+        """Returns the counters of the connections of `uri`."""
+        stats = self._stats.get(uri)
+        if stats is None:
+            stats = self._stats[uri] = _URIStats()
+
+        return stats
+
+    def admit(self, uri):
+        """Returns whether a new connection of `uri` can be accepted."""
+        if (self.max_connections is not None
+                and len(self._connections) >= self.max_connections):
+            self.stats(uri).rejected += 1
+            return False
+
+        return True
+
+    def opened(self, websocket, uri):
+        """Starts watching the open `websocket` of `uri`."""
+        connection = _Connection(websocket, uri, IOLoop.current().time())
+        self._connections[websocket] = connection
+        self.stats(uri).open += 1
+        self._schedule(connection)
+
+    def closed(self, websocket):
+        """Stops watching the closed `websocket`."""
+        connection = self._connections.pop(websocket, None)
+        if connection is None:
+            return
+
+        self.stats(connection.uri).open -= 1
+        if connection.timer is not None:
+            connection.timer.cancel()
+
+    def message_received(self, websocket):
+        """Records a message received from `websocket`."""
+        connection = self._connections.get(websocket)
+        if connection is not None:
+            connection.last_message = IOLoop.current().time()
+            self.stats(connection.uri).received += 1
+
+    def message_sent(self, websocket, size):
+        """Records a message of `size` bytes sent to `websocket`."""
+        connection = self._connections.get(websocket)
+        if connection is not None:
+            stats = self.stats(connection.uri)
+            stats.sent += 1
+            stats.sent_bytes += size
+
+    def pong_received(self, websocket):
+        """Records the answer of `websocket` to a ping."""
+        connection = self._connections.get(websocket)
+        if connection is not None:
+            connection.last_pong = IOLoop.current().time()
+
+    def _deadline(self, connection):
+        """Returns the nearest deadline of `connection`, or None."""
+        deadlines = []
+        if self.ping_interval is not None:
+            deadlines.append((connection.last_ping or connection.opened)
+                             + self.ping_interval)
+        if self.idle_timeout is not None:
+            deadlines.append(connection.last_message + self.idle_timeout)
+        if self.max_lifetime is not None:
+            deadlines.append(connection.opened + self.max_lifetime)
+
+        return min(deadlines) if deadlines else None
+
+    def _schedule(self, connection):
+        """Schedules the check of `connection` at its nearest deadline."""
+        deadline = self._deadline(connection)
+        if deadline is None:
+            connection.timer = None
+            return
+
+        delay = deadline - IOLoop.current().time()
+        connection.timer = self.wheel.schedule(
+            delay, lambda: self._check(connection)
+        )
+
+    def _check(self, connection):
+        """Closes `connection` if it has timed out, or pings it if due."""
+        if connection.websocket not in self._connections:
+            return
+
+        now = IOLoop.current().time()
+        if (self.max_lifetime is not None
+                and now >= connection.opened + self.max_lifetime):
+            self._evict(connection, self.LIFETIME_CLOSE_CODE,
+                        "Connection lifetime exceeded")
+            return
+
+        if (self.idle_timeout is not None
+                and now >= connection.last_message + self.idle_timeout):
+            self._evict(connection, self.IDLE_CLOSE_CODE, "Idle timeout")
+            return
+
+        last_ping = connection.last_ping
+        if (self.ping_interval is not None
+                and now >= (last_ping or connection.opened)
+                + self.ping_interval):
+            if (last_ping is not None
+                    and (connection.last_pong or 0) < last_ping
+                    and connection.last_message < last_ping):
+                self._evict(connection, self.UNRESPONSIVE_CLOSE_CODE,
+                            "Ping timeout")
+                return
+
+            connection.last_ping = now
+            try:
+                connection.websocket.ping()
+            except Exception:  # pylint: disable=broad-except
+                self._evict(connection, self.UNRESPONSIVE_CLOSE_CODE,
+                            "Ping failed")
+                return
+
+        self._schedule(connection)
+
+    def _evict(self, connection, code, reason):
+        """Closes the timed out `connection`."""
+        self.stats(connection.uri).evicted += 1
+        websocket = connection.websocket
+        self.closed(websocket)
+        websocket.close(code, reason)
+
+    def queued_bytes(self, websocket):
+        """Returns the number of the bytes queued for `websocket`."""
+        queued = 0
+        stream = getattr(getattr(websocket, 'ws_connection', None),
+                         'stream', None)
+        if stream is not None:
+            queued += getattr(stream, '_write_buffer_size', 0)
+        if self.broadcast is not None:
+            queued += self.broadcast.queued_bytes(websocket)
+
+        return queued
+
+    def collect(self):
+        """Returns the connection metrics in the Prometheus format."""
+        queued = dict.fromkeys(self._stats, 0)
+        for websocket, connection in self._connections.items():
+            queued[connection.uri] += self.queued_bytes(websocket)
+
+        metrics = [
+            ('calm_websocket_connections', 'gauge',
+             'Open WebSocket connections.',
+             lambda uri, stats: stats.open),
+            ('calm_websocket_queued_bytes', 'gauge',
+             'Bytes waiting to be sent to the WebSocket connections.',
+             lambda uri, stats: queued[uri]),
+            ('calm_websocket_messages_received_total', 'counter',
+             'WebSocket messages received.',
+             lambda uri, stats: stats.received),
+            ('calm_websocket_messages_sent_total', 'counter',
+             'WebSocket messages sent.',
+             lambda uri, stats: stats.sent),
+            ('calm_websocket_sent_bytes_total', 'counter',
+             'WebSocket message bytes sent.',
+             lambda uri, stats: stats.sent_bytes),
+            ('calm_websocket_rejected_total', 'counter',
+             'WebSocket connections refused by the connection cap.',
+             lambda uri, stats: stats.rejected),
+            ('calm_websocket_evicted_total', 'counter',
+             'WebSocket connections closed by a timeout.',
+             lambda uri, stats: stats.evicted),
+        ]
+
+        lines = []
+        for name, kind, description, value in metrics:
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for uri, stats in sorted(self._stats.items()):
+                lines.append('{}{} {}'.format(name, format_labels(route=uri),
+                                              value(uri, stats)))
+
+        return lines
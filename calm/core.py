@@ -2,9 +2,13 @@
 Here lies the core of Calm.
 """
 import re
+import asyncio
+import inspect
+import logging
 from collections import defaultdict
 from inspect import cleandoc
 
+from tornado.ioloop import IOLoop
 from tornado.web import Application
 from tornado.websocket import WebSocketHandler
 
@@ -12,8 +16,14 @@ from calm.ex import DefinitionError, ClientError
 from calm.codec import ArgumentParser
 from calm.service import CalmService
 from calm.handler import (MainHandler, DefaultHandler, SwaggerHandler,
-                          HandlerDef)
+                          HealthHandler, MetricsHandler, HandlerDef)
 from calm.resource import Resource
+from calm.ratelimit import RateLimiter
+from calm.lifecycle import Lifecycle, track_websocket
+from calm.broadcast import BroadcastHub
+from calm.connections import ConnectionManager
+from calm.metrics import Metrics
+from calm.timing import PhaseTimings
 
 
 __all__ = ['CalmApp']
@@ -37,12 +47,45 @@ class CalmApp(object):
         * service - creates a new Service using provided URL prefix
         * make_app - compiles the Calm application and returns a Tornado
                      Application instance
+        * start - starts the services of the compiled application on the
+                  current IOLoop
+        * listen - compiles the Calm application and starts serving it
+        * shutdown - gracefully drains and stops the application
     """
     URI_REGEX = re.compile(r'\{([^\/\?\}]*)\}')
     config = {  # The default configuration
         'argument_parser': ArgumentParser,
         'error_key': 'error',
-        'swagger_url': '/swagger.json'
+        'swagger_url': '/swagger.json',
+        'concurrency_limiter': None,
+        'default_timeout': None,
+        'timeout_header': 'X-Request-Timeout',
+        'rate_limit': None,
+        'rate_limit_max_idle': 300,
+        'rate_limit_max_keys': 1000000,
+        'health_url': None,
+        'shutdown_grace_period': 30,
+        'metrics_url': None,
+        'server_timing': False,
+        'debug_url': None,
+        'debug_token': None,
+        'blocking_threshold': None,
+        'latency_budget': None,
+        'watchdog_buffer_size': 100,
+        'tracer': None,
+        'access_log': None,
+        'memory_sample_rate': None,
+        'swagger_warmup': True,
+        'route_cache': None,
+        'broadcast_queue_size': 100,
+        'broadcast_overflow': 'drop',
+        'broker_path': None,
+        'broker_embedded': True,
+        'websocket_ping_interval': None,
+        'websocket_idle_timeout': None,
+        'websocket_max_lifetime': None,
+        'websocket_max_connections': None,
+        'websocket_timer_tick': 1
     }
 
     def __init__(self, name, version, *,
@@ -50,6 +93,8 @@ class CalmApp(object):
                  description='', tos=''):
         super(CalmApp, self).__init__()
 
+        self.config = dict(self.config)
+
         self._app = None
         self._route_map = defaultdict(dict)
         self._custom_handlers = []
@@ -64,7 +109,28 @@ class CalmApp(object):
         self.host = host
         self.base_path = base_path
 
-        self.swagger_json = None
+        self._swagger_json = None
+        self._route_cache = None
+        self._route_regexes = {}
+        self.argument_parser = None
+        self.rate_limiter = None
+        self.rendered_errors = {}
+        self.lifecycle = Lifecycle()
+        self.broadcast = BroadcastHub()
+        self.broker = None
+        self.connections = ConnectionManager()
+        self.connections.broadcast = self.broadcast
+        self.metrics = None
+        self.phase_timings = None
+        self.profiler = None
+        self.watchdog = None
+        self.memory_profiler = None
+        self.diagnostics = []
+
+        self._servers = []
+        self._shutdown_hooks = []
+
+        self.log = logging.getLogger('calm')
 
     def set_licence(self, name, url):
         """
@@ -106,20 +172,36 @@ class CalmApp(object):
         """Compiles and returns a Tornado Application instance."""
         route_defs = []
 
+        self.argument_parser = self.config.get('argument_parser',
+                                               ArgumentParser)()
+        for methods in self._route_map.values():
+            for handler_def in methods.values():
+                handler_def.resolve_parsers(self.argument_parser)
+
         default_handler_args = {
-            'argument_parser': self.config.get('argument_parser',
-                                               ArgumentParser),
+            'argument_parser': self.argument_parser,
             'app': self
         }
 
+        snapshot = self._load_route_cache()
+        regexes = dict(snapshot['routes']) if snapshot else {}
+
+        def regexify(uri):
+            if uri not in regexes:
+                regexes[uri] = self._regexify_uri(uri)
+            return regexes[uri]
+
         for uri, methods in self._route_map.items():
             init_params = {
                 **methods,  # noqa
                 **default_handler_args  # noqa
             }
 
+            uri_regex = regexify(uri)
+            for handler_def in methods.values():
+                handler_def.uri_regex = uri_regex
             route_defs.append(
-                (self._regexify_uri(uri), MainHandler, init_params)
+                (uri_regex, MainHandler, init_params)
             )
 
         for url_spec in self._custom_handlers:
@@ -127,7 +209,9 @@ class CalmApp(object):
 
         for uri, handler in self._ws_map.items():
             route_defs.append(
-                (self._regexify_uri(uri), handler)
+                (regexify(uri),
+                 track_websocket(handler, self.lifecycle, self.broadcast,
+                                 self.connections, uri))
             )
 
         route_defs.append(
@@ -136,14 +220,339 @@ class CalmApp(object):
              default_handler_args)
         )
 
+        if self.config['health_url']:
+            route_defs.append(
+                (self.config['health_url'],
+                 HealthHandler,
+                 default_handler_args)
+            )
+
+        if self.config['server_timing']:
+            self.phase_timings = PhaseTimings()
+
+        if self.config['metrics_url']:
+            self.metrics = Metrics()
+            if self.phase_timings is not None:
+                self.metrics.add_collector(self.phase_timings.collect)
+            route_defs.append(
+                (self.config['metrics_url'],
+                 MetricsHandler,
+                 default_handler_args)
+            )
+
+        self.broadcast.configure(self.config['broadcast_queue_size'],
+                                 self.config['broadcast_overflow'])
+        if self.metrics is not None:
+            self.metrics.add_collector(self.broadcast.collect)
+
+        self.connections.configure(
+            ping_interval=self.config['websocket_ping_interval'],
+            idle_timeout=self.config['websocket_idle_timeout'],
+            max_lifetime=self.config['websocket_max_lifetime'],
+            max_connections=self.config['websocket_max_connections'],
+            tick=self.config['websocket_timer_tick']
+        )
+        if self.metrics is not None and self._ws_map:
+            self.metrics.add_collector(self.connections.collect)
+
+        access_log = self.config['access_log']
+        if access_log is not None and self.metrics is not None:
+            self.metrics.add_collector(access_log.collect)
+
+        self.rate_limiter = RateLimiter(
+            max_idle=self.config['rate_limit_max_idle'],
+            max_keys=self.config['rate_limit_max_keys']
+        )
+
+        self.diagnostics = []
+        self._make_watchdog()
+        self.memory_profiler = None
+        if self.config['memory_sample_rate']:
+            from calm.memory import MemoryProfiler
+            self.memory_profiler = MemoryProfiler(
+                self.config['memory_sample_rate']
+            )
+            self.diagnostics.append(self.memory_profiler)
+        route_defs += self._make_debug_routes(default_handler_args)
+
         self._app = Application(route_defs,
                                 default_handler_class=DefaultHandler,
                                 default_handler_args=default_handler_args)
 
-        self.swagger_json = self.generate_swagger_json()
+        self._route_regexes = regexes
+        self._swagger_json = None
+        if snapshot is not None:
+            self._restore_route_cache(snapshot)
+
+        self.start()
 
         return self._app
 
+    def start(self):
+        """
+        Starts the IOLoop-bound services of the compiled application on the
+        current IOLoop: the event-loop watchdog, the WebSocket timers and the
+        access log writer.
+
+        `make_app` starts them on the IOLoop current at the time. Call this
+        to serve the compiled application on another IOLoop, e.g. in tests
+        running a new IOLoop per test.
+        """
+        self.connections.wheel.stop()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            self.watchdog.start()
+
+        access_log = self.config['access_log']
+        if access_log is not None:
+            access_log.start()
+
+    def _load_route_cache(self):
+        """
+        Loads the snapshot of the `route_cache` configuration.
+
+        Returns `None` if the cache is disabled, missing or stale. In the
+        latter cases the snapshot is stored once swagger.json is generated.
+        """
+        self._route_cache = None
+        if self.config['route_cache'] is None:
+            return None
+
+        from calm.routecache import RouteCache
+        cache = RouteCache(self.config['route_cache'], self)
+        snapshot = cache.load()
+        if snapshot is None:
+            self._route_cache = cache
+
+        return snapshot
+
+    def _restore_route_cache(self, snapshot):
+        """Restores the operation definitions and swagger.json."""
+        swagger_json = snapshot['swagger']
+        paths = swagger_json['paths']
+        for uri, methods in self._route_map.items():
+            for method, handler_def in methods.items():
+                handler_def._operation_definition = (  # pylint: disable=W0212
+                    paths[uri][method]
+                )
+
+        self._swagger_json = swagger_json
+
+    @property
+    def swagger_json(self):
+        """
+        The swagger.json contents of the Calm Application.
+
+        The document is generated on the first access, or by `warm_up`,
+        unless it is loaded from the `route_cache` snapshot.
+        """
+        if self._swagger_json is None:
+            self._swagger_json = self.generate_swagger_json()
+            if self._route_cache is not None:
+                self._route_cache.store(self._route_regexes,
+                                        self._swagger_json)
+                self._route_cache = None
+
+        return self._swagger_json
+
+    async def warm_up(self):
+        """
+        Generates the operation definitions and the swagger.json document.
+
+        The operation definitions are generated one per IOLoop iteration, so
+        that serving the requests is not blocked meanwhile. This is scheduled
+        by `listen`, unless the `swagger_warmup` configuration is disabled.
+        """
+        for methods in list(self._route_map.values()):
+            for handler_def in list(methods.values()):
+                handler_def.operation_definition  # pylint: disable=W0104
+                await asyncio.sleep(0)
+
+        self.swagger_json  # pylint: disable=W0104
+
+    def _make_debug_routes(self, handler_args):
+        """Sets up the debug tools and returns their route definitions."""
+        debug_url = self.config['debug_url']
+        if not debug_url:
+            return []
+
+        if not self.config['debug_token']:
+            raise DefinitionError("'debug_url' requires a 'debug_token'")
+
+        from calm.profiling import Profiler, ProfileHandler
+        self.profiler = Profiler()
+        self.diagnostics.append(self.profiler)
+
+        routes = [
+            (self._normalize_uri(debug_url, 'profile'),
+             ProfileHandler,
+             handler_args)
+        ]
+        if self.watchdog is not None:
+            from calm.watchdog import WatchdogHandler
+            routes.append(
+                (self._normalize_uri(debug_url, 'watchdog'),
+                 WatchdogHandler,
+                 handler_args)
+            )
+        if self.memory_profiler is not None:
+            from calm.memory import MemoryHandler
+            routes.append(
+                (self._normalize_uri(debug_url, 'memory'),
+                 MemoryHandler,
+                 handler_args)
+            )
+
+        return routes
+
+    def _make_watchdog(self):
+        """
+        Sets up the event-loop watchdog, if it is configured.
+
+        The watchdog runs when the `blocking_threshold` or the
+        `latency_budget` configuration is set, or any handler has a
+        `@latency_budget`.
+        """
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            self.watchdog = None
+
+        budgeted = any(
+            hdef.latency_budget
+            for methods in self._route_map.values()
+            for hdef in methods.values()
+        )
+        if not (self.config['blocking_threshold'] or
+                self.config['latency_budget'] or budgeted):
+            return
+
+        from calm.watchdog import Watchdog
+        self.watchdog = Watchdog(
+            threshold=self.config['blocking_threshold'],
+            latency_budget=self.config['latency_budget'],
+            buffer_size=self.config['watchdog_buffer_size']
+        )
+        self.diagnostics.append(self.watchdog)
+
+    def listen(self, port, address='', **kwargs):
+        """
+        Compiles the application and starts serving it on `port`.
+
+        The keyword arguments are passed to the Tornado `HTTPServer`. The
+        server is stopped by `shutdown`. Once the server is accepting
+        connections, the swagger.json is generated in the background by
+        `warm_up`. When the `broker_path` is configured, the broadcast hub is
+        connected to the broker listening on it, which the first process
+        starts itself unless `broker_embedded` is disabled.
+        """
+        if self._app is None:
+            self.make_app()
+
+        server = self._app.listen(port, address, **kwargs)
+        self._servers.append(server)
+
+        if self.config['broker_path'] is not None and self.broker is None:
+            try:
+                from calm.broker import BrokerClient
+            except ImportError as ex:
+                raise DefinitionError(
+                    "The 'broker_path' requires the Unix sockets"
+                ) from ex
+
+            self.broker = BrokerClient(
+                self.config['broker_path'], self.broadcast,
+                embedded=self.config['broker_embedded']
+            )
+            IOLoop.current().add_callback(self.broker.connect)
+
+        if self.config['swagger_warmup'] and self._swagger_json is None:
+            IOLoop.current().add_callback(self.warm_up)
+
+        return server
+
+    def on_shutdown(self, hook):
+        """
+        Decorator for the cleanup hooks of the application.
+
+        The hooks are called without arguments, in the order of registration,
+        after the application is drained. They may be coroutines.
+        """
+        self._shutdown_hooks.append(hook)
+
+        return hook
+
+    @property
+    def draining(self):
+        """Whether the application is shutting down."""
+        return self.lifecycle.draining
+
+    async def shutdown(self, grace_period=None):
+        """
+        Gracefully drains and stops the application.
+
+        The shutdown takes the following steps:
+            * stops accepting connections on the servers started by `listen`
+              and starts failing the health checks
+            * waits for the in-flight requests to finish
+            * closes the WebSocket connections with `1001` (Going Away) code
+              and waits for them to close
+            * closes the remaining, idle keep-alive connections
+            * runs the cleanup hooks registered by `on_shutdown`
+            * disconnects from the broadcast broker
+            * stops the event-loop watchdog and flushes the access log
+
+        The waiting steps share the `grace_period` in seconds, which defaults
+        to the `shutdown_grace_period` configuration.
+
+        Example:
+            signal.signal(
+                signal.SIGTERM,
+                lambda *_: IOLoop.current().add_callback_from_signal(
+                    app.shutdown
+                )
+            )
+        """
+        if grace_period is None:
+            grace_period = self.config['shutdown_grace_period']
+        deadline = IOLoop.current().time() + grace_period
+
+        lifecycle = self.lifecycle
+        lifecycle.draining = True
+        servers, self._servers = self._servers, []
+        for server in servers:
+            server.stop()
+
+        if not await lifecycle.wait_requests(deadline):
+            self.log.warning("%d requests did not finish before shutdown",
+                             lifecycle.in_flight)
+
+        for websocket in list(lifecycle.websockets):
+            websocket.close(1001, "Server shutting down")
+        if not await lifecycle.wait_websockets(deadline):
+            self.log.warning("%d WebSockets did not close before shutdown",
+                             len(lifecycle.websockets))
+
+        for server in servers:
+            await server.close_all_connections()
+
+        for hook in self._shutdown_hooks:
+            try:
+                result = hook()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:  # pylint: disable=broad-except
+                self.log.exception("Shutdown hook '%s' failed",
+                                   getattr(hook, '__name__', hook))
+
+        if self.broker is not None:
+            self.broker.close()
+            self.broker = None
+        self.connections.wheel.stop()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        if self.config['access_log'] is not None:
+            self.config['access_log'].close()
+
     def add_handler(self, *url_spec):
         """Add a custom `RequestHandler` implementation to the app."""
         self._custom_handlers.append(url_spec)
@@ -202,8 +611,8 @@ class CalmApp(object):
             * produces - a Resource type of what the operation produces
         """
         uri = self._normalize_uri(*uri_fragments)
-        uri_regex = self._regexify_uri(uri)
-        handler_def = HandlerDef(uri, uri_regex, function)
+        # the URI regex is set by `make_app`, possibly from the route cache
+        handler_def = HandlerDef(uri, None, function)
 
         consumes = getattr(function, 'consumes', consumes)
         produces = getattr(function, 'produces', produces)
@@ -315,7 +724,7 @@ class CalmApp(object):
 
     def _generate_swagger_definitions(self):
         """Generate `definitions` definitions of swagger.json."""
-        resource_defs = Resource.schema_definitions
+        resource_defs = dict(Resource.schema_definitions)
         resource_defs.update(self._generate_error_schema())
 
         return resource_defs
@@ -0,0 +1,72 @@
+"""
+This module defines the request deadlines of Calm.
+
+A request handler may be limited in time either by the `@timeout` decorator,
+or by the `default_timeout` configuration of the Calm Application. The client
+may shorten the deadline of such a handler using the `X-Request-Timeout`
+header (the header name is configurable via `timeout_header`), but cannot set
+a deadline for the other handlers. The malformed and the non-positive header
+values are ignored.
+
+The deadline is available to the handlers as `request.deadline` (or `None`
+if the request has no deadline), so that the remaining time budget can be
+passed on to the downstream calls:
+
+    @app.get('/users/{user_id}')
+    @timeout(2)
+    async def get_user(request, user_id):
+        return await users_client.get(user_id,
+                                      timeout=request.deadline.remaining())
+
+When the deadline expires, the handler task is cancelled and `504` status is
+returned to the client.
+"""
+from asyncio import CancelledError
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from calm.ex import GatewayTimeoutError
+
+
+__all__ = ['Deadline']
+
+
+class Deadline(object):
+    """A point in time (in IOLoop time) by which a request must complete."""
+    __slots__ = ('timeout', 'expires_at')
+
+    def __init__(self, timeout):
+        super(Deadline, self).__init__()
+
+        self.timeout = timeout
+        self.expires_at = IOLoop.current().time() + timeout
+
+    def remaining(self):
+        """Returns the number of seconds left until the deadline."""
+        return max(0.0, self.expires_at - IOLoop.current().time())
+
+    @property
+    def expired(self):
+        """Whether the deadline has already passed."""
+        return IOLoop.current().time() >= self.expires_at
+
+    async def run(self, awaitable):
+        """
+        Awaits `awaitable` until the deadline.
+
+        Raises `GatewayTimeoutError` if the deadline expires first, after
+        cancelling the task running `awaitable`.
+        """
+        io_loop = IOLoop.current()
+        future = gen.convert_yielded(awaitable)
+        timeout_handle = io_loop.call_at(self.expires_at, future.cancel)
+        try:
+            return await future
+        except CancelledError:
+            if not self.expired:
+                raise
+
+            raise GatewayTimeoutError()
+        finally:
+            io_loop.remove_timeout(timeout_handle)
@@ -2,6 +2,7 @@
 This module defines general decorators to define the Calm Application.
 """
 from calm.resource import Resource
+from calm.ratelimit import RateLimit, client_ip
 from calm.ex import DefinitionError, ClientError
 
 
@@ -66,3 +67,54 @@ def deprecated(func):
     _set_handler_attribute(func, 'deprecated', True)
 
     return func
+
+
+def timeout(seconds):
+    """Decorator to specify the deadline of the handler in seconds."""
+    if not isinstance(seconds, (int, float)) or seconds <= 0:
+        raise DefinitionError('@timeout value should be a positive number.')
+
+    def decor(func):
+        """The function wrapper."""
+        _set_handler_attribute(func, 'timeout', seconds)
+
+        return func
+
+    return decor
+
+
+def rate_limit(rate, burst=None, key=client_ip):
+    """
+    Decorator to specify the rate limit of the handler.
+
+    The handler accepts `rate` requests per second with bursts up to `burst`
+    from every client, as keyed by the `key` function.
+    """
+    quota = RateLimit(rate, burst, key)
+
+    def decor(func):
+        """The function wrapper."""
+        _set_handler_attribute(func, 'rate_limit', quota)
+
+        return func
+
+    return decor
+
+
+def latency_budget(seconds):
+    """
+    Decorator to specify the latency budget of the handler in seconds.
+
+    The watchdog logs the stack of the requests exceeding the budget.
+    """
+    if not isinstance(seconds, (int, float)) or seconds <= 0:
+        raise DefinitionError('@latency_budget value should be a positive '
+                              'number.')
+
+    def decor(func):
+        """The function wrapper."""
+        _set_handler_attribute(func, 'latency_budget', seconds)
+
+        return func
+
+    return decor
@@ -10,7 +10,9 @@ inherit. On the next level, there come two exceptions:
                   request and cannot be processed further.
     ServerError - this one is the root exception for all the errors that are
                   caused by the application, specifically an incorrect usage
-                  of Calm by the application.
+                  of Calm by the application. Server errors that define a
+                  `code` (e.g. when the server is overloaded) are returned to
+                  the client the same way as client errors.
 
 """
 
@@ -71,6 +73,12 @@ class NotFoundError(ClientError):
     message = "Resource not found"
 
 
+class TooManyRequestsError(ClientError):
+    """Error when the client exceeds its rate limit."""
+    code = 429
+    message = "Too many requests"
+
+
 class ServerError(CalmError):
     """The root class for server errors."""
     pass
@@ -79,3 +87,15 @@ class ServerError(CalmError):
 class DefinitionError(ServerError):
     """Error when the application programmer uses Calm incorrectly."""
     pass
+
+
+class ServiceUnavailableError(ServerError):
+    """Error when the server is overloaded and sheds the request."""
+    code = 503
+    message = "Service temporarily unavailable"
+
+
+class GatewayTimeoutError(ServerError):
+    """Error when the request handler does not complete before its deadline."""
+    code = 504
+    message = "Request timed out"
@@ -8,23 +8,71 @@ Classes:
                        within the application, returning `404` error.
 """
 import re
+import hmac
 import json
+import math
+import time
+import weakref
+import asyncio
 import inspect
 from inspect import Parameter
 import logging
 import datetime
+from contextlib import nullcontext
+from contextvars import ContextVar
 
 from tornado.web import RequestHandler
-from tornado.web import MissingArgumentError
 
 from untt.util import parse_docstring
 from untt.ex import ValidationError
 
-from calm.ex import (ServerError, ClientError, BadRequestError,
-                     MethodNotAllowedError, NotFoundError, DefinitionError)
+from calm.ex import (CalmError, ServerError, ClientError, BadRequestError,
+                     MethodNotAllowedError, NotFoundError, DefinitionError,
+                     ServiceUnavailableError, GatewayTimeoutError,
+                     TooManyRequestsError)
 from calm.param import QueryParam, PathParam
+from calm.query import QueryParser
+from calm.deadline import Deadline
+from calm.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from calm.timing import PhaseTimer
 
-__all__ = ['MainHandler', 'DefaultHandler']
+__all__ = ['MainHandler', 'DefaultHandler', 'current_handler_def',
+           'task_handler_def']
+
+
+# the `HandlerDef` processed in the current context, which is inherited by
+# the tasks created for the request, e.g. the one running the handler until
+# its deadline
+current_handler_def = ContextVar('current_handler_def', default=None)
+
+# the `HandlerDef` processed by each task, as the contexts of the tasks are
+# not readable outside of the IOLoop thread
+_TASK_HANDLER_DEFS = weakref.WeakKeyDictionary()
+
+
+def task_handler_def(task):
+    """
+    Returns the `HandlerDef` processed by the asyncio `task`, or `None`.
+
+    This is safe to call from any thread, e.g. with the task currently
+    running on a blocked IOLoop.
+    """
+    return _TASK_HANDLER_DEFS.get(task)
+
+
+def _track_handler_def():
+    """Records the `HandlerDef` of the current context for its task."""
+    task = asyncio.current_task()
+    if task is not None:
+        _TASK_HANDLER_DEFS[task] = current_handler_def.get()
+
+
+async def _tracked(awaitable):
+    """
+    Awaits `awaitable`, recording the `HandlerDef` for the task it runs in.
+    """
+    _track_handler_def()
+    return await awaitable
 
 
 class MainHandler(RequestHandler):
@@ -45,7 +93,7 @@ class MainHandler(RequestHandler):
         Arguments:
             * get, post, put, delete - appropriate HTTP method handler for
                                        a specific URI
-            * argument_parser - a `calm.ArgumentParser` subclass
+            * argument_parser - a `calm.ArgumentParser` instance
             * app - the Calm application
         """
         self._get_handler = kwargs.pop('get', None)
@@ -53,20 +101,92 @@ class MainHandler(RequestHandler):
         self._put_handler = kwargs.pop('put', None)
         self._delete_handler = kwargs.pop('delete', None)
 
-        self._argument_parser = kwargs.pop('argument_parser')()
+        self._argument_parser = kwargs.pop('argument_parser')
         self._app = kwargs.pop('app')
+        self._start_time = None
+        self._timer = None
+        self._span = None
+        self._request_size = 0
 
         self.log = logging.getLogger('calm')
 
         super(MainHandler, self).__init__(*args, **kwargs)
 
+    @property
+    def route(self):
+        """The route template served by the handler, used in metrics."""
+        for handler_def in (self._get_handler, self._post_handler,
+                            self._put_handler, self._delete_handler):
+            if handler_def:
+                return handler_def.uri
+
+        return None
+
+    def prepare(self):
+        """
+        Records the start of the request in the metrics and the trace, and
+        assigns the request ID.
+        """
+        metrics = self._app.metrics
+        if metrics is not None:
+            self._start_time = time.perf_counter()
+            metrics.request_started(self.route)
+
+        tracer = self._app.config['tracer']
+        if tracer is not None:
+            self._span = tracer.start_request(self.request, self.route)
+        self.request.span = self._span
+
+        access_log = self._app.config['access_log']
+        request_id = None
+        if access_log is not None:
+            request_id = access_log.request_id(self.request)
+            self.set_header(access_log.request_id_header, request_id)
+            self._request_size = len(self.request.body)
+        self.request.request_id = request_id
+
+    def on_finish(self):
+        """
+        Records the end of the request in the metrics, the trace and the
+        access log.
+        """
+        metrics = self._app.metrics
+        if metrics is not None and self._start_time is not None:
+            metrics.request_finished(self.route,
+                                     self.request.method,
+                                     self.get_status(),
+                                     time.perf_counter() - self._start_time)
+
+        span = self._span
+        if span is not None:
+            span.set_attribute('http.status_code', self.get_status())
+            span.finish()
+
+        access_log = self._app.config['access_log']
+        if access_log is not None:
+            request = self.request
+            access_log.record({
+                'time': request._start_time,  # pylint: disable=W0212
+                'request_id': getattr(request, 'request_id', None),
+                'method': request.method,
+                'route': self.route,
+                'status': self.get_status(),
+                'duration': request.request_time(),
+                'request_size': self._request_size,
+                'response_size': int(self._headers.get('Content-Length', 0)),
+                'remote_ip': request.remote_ip
+            })
+
     def _get_query_args(self, handler_def):
         """Retreives the values for query arguments."""
+        values = handler_def.query_parser.parse(
+            self.request.query_arguments
+        )
+
         query_args = {}
         for qarg in handler_def.query_args:
-            try:
-                query_args[qarg.name] = self.get_query_argument(qarg.name)
-            except MissingArgumentError:
+            qarg_values = values.get(qarg.name)
+            if qarg_values is None:
                 if not qarg.required:
                     continue
 
@@ -74,18 +194,21 @@ class MainHandler(RequestHandler):
                     "Missing required query argument '{}'".format(qarg.name)
                 )
 
+            # the last value wins, unless all of them are expected
+            query_args[qarg.name] = (qarg_values if qarg.is_array
+                                     else qarg_values[-1])
+
         return query_args
 
-    def _cast_args(self, handler, args):
+    def _cast_args(self, handler_def, args):
         """Converts the request arguments to appropriate types."""
-        arg_types = handler.__annotations__
-        for arg in args:
-            arg_type = arg_types.get(arg)
+        arg_parsers = handler_def.arg_parsers
+        if arg_parsers is None:
+            arg_parsers = handler_def.resolve_parsers(self._argument_parser)
 
-            if not arg_type:
-                continue
-
-            args[arg] = self._argument_parser.parse(arg_type, args[arg])
+        for arg, parser in arg_parsers.items():
+            if arg in args:
+                args[arg] = parser(args[arg])
 
     def _parse_and_update_body(self, handler_def):
         """Parses the request body to JSON."""
@@ -112,15 +235,208 @@ class MainHandler(RequestHandler):
         if not handler_def:
             raise MethodNotAllowedError()
 
+        lifecycle = self._app.lifecycle
+        if lifecycle.draining:
+            self.set_header('Connection', 'close')
+
+        lifecycle.request_started()
+        probes = self._start_probes(handler_def)
+        try:
+            await self._admit_request(handler_def, **kwargs)
+        finally:
+            lifecycle.request_finished()
+            if probes is not None:
+                for probe in probes:
+                    probe.request_finished()
+
+    def _start_probes(self, handler_def):
+        """
+        Reports the start of the request to the enabled diagnostic tools.
+
+        Returns the probes to be finished with the request, or `None` if no
+        tool is interested in it.
+        """
+        probes = None
+        for tool in self._app.diagnostics:
+            probe = tool.request_started(handler_def)
+            if probe is not None:
+                if probes is None:
+                    probes = []
+                probes.append(probe)
+
+        return probes
+
+    async def _admit_request(self, handler_def, **kwargs):
+        """Applies the rate and concurrency limits to the request."""
+        if not self._check_rate_limits(handler_def):
+            return
+
+        limiter = self._app.config.get('concurrency_limiter')
+        if limiter is None:
+            await self._process_request(handler_def, **kwargs)
+            return
+
+        permit = limiter.acquire(handler_def.uri)
+        if permit is None:
+            self._write_rendered_error(ServiceUnavailableError)
+            return
+
+        with permit:
+            await self._process_request(handler_def, **kwargs)
+
+    def _check_rate_limits(self, handler_def):
+        """
+        Checks the app-wide and the handler rate limits.
+
+        Returns `False` when the request is rejected, after writing the
+        pre-rendered `429` response.
+        """
+        app_quota = self._app.config.get('rate_limit')
+        if app_quota is None and handler_def.rate_limit is None:
+            return True
+
+        rate_limiter = self._app.rate_limiter
+        retry_after = 0
+        if app_quota is not None:
+            retry_after = rate_limiter.check(app_quota, None, self.request)
+        if not retry_after and handler_def.rate_limit is not None:
+            retry_after = rate_limiter.check(handler_def.rate_limit,
+                                             handler_def,
+                                             self.request)
+
+        if not retry_after:
+            return True
+
+        self.set_header('Retry-After', retry_after)
+        self._write_rendered_error(TooManyRequestsError)
+
+        return False
+
+    def _write_rendered_error(self, error):
+        """
+        Writes the response of the `error` class and finishes the request.
+
+        This is meant for rejecting requests under load, so the response body
+        is rendered only once per app and no exception is raised.
+        """
+        rendered = self._app.rendered_errors
+        error_key = self._app.config['error_key']
+        body = rendered.get((error, error_key))
+        if body is None:
+            body = rendered[(error, error_key)] = json.dumps({
+                error_key: error.message
+            }).encode('utf-8')
+
+        self.set_status(error.code)
+        self.set_header('Content-Type', 'application/json')
+        self.finish(body)
+
+    def _get_deadline(self, handler_def):
+        """
+        Defines the deadline of the request.
+
+        The handler `@timeout`, or else the app-wide default timeout, is
+        taken. The client may shorten it by the timeout header, but it cannot
+        set a deadline for a route without one. The malformed and the
+        non-positive header values are ignored. Returns `None` if the route
+        has no deadline.
+        """
+        timeout = handler_def.timeout or self._app.config.get(
+            'default_timeout'
+        )
+        if timeout is None:
+            return None
+
+        header = self._app.config.get('timeout_header')
+        value = self.request.headers.get(header) if header else None
+        if value is not None:
+            try:
+                client_timeout = float(value)
+            except ValueError:
+                client_timeout = math.nan
+
+            if math.isfinite(client_timeout) and client_timeout > 0:
+                timeout = min(timeout, client_timeout)
+            else:
+                self.log.debug("Ignoring the malformed '%s' header: %r",
+                               header, value)
+
+        return Deadline(timeout)
+
+    def _write_timeout_error(self, handler_def):
+        """Returns `504` to the client, when the deadline has expired."""
+        self.log.warning("'%s' did not complete before its deadline",
+                         handler_def.uri)
+        self._write_rendered_error(GatewayTimeoutError)
+
+    def _child_span(self, name):
+        """
+        Returns a child span of the request span, or a context manager doing
+        nothing if the request is not traced.
+        """
+        if self._span is None:
+            return nullcontext()
+
+        return self._span.child(name)
+
+    async def _process_request(self, handler_def, **kwargs):
+        """Parses the request, calls the user handler and writes the result."""
+        current_handler_def.set(handler_def)
+        _track_handler_def()
+
+        deadline = self._get_deadline(handler_def)
+        self.request.deadline = deadline
+        if deadline is not None and deadline.expired:
+            self._write_timeout_error(handler_def)
+            return
+
+        if self._app.phase_timings is not None:
+            self._timer = PhaseTimer()
+        timer = self._timer
+
         handler = handler_def.handler
         kwargs.update(self._get_query_args(handler_def))
-        self._cast_args(handler, kwargs)
-        self._parse_and_update_body(handler_def)
-        if inspect.iscoroutinefunction(handler):
-            resp = await handler(self.request, **kwargs)
-        else:
-            self.log.warning("'%s' is not a coroutine!", handler_def.handler)
-            resp = handler(self.request, **kwargs)
+        if timer is not None:
+            timer.mark('query')
+        self._cast_args(handler_def, kwargs)
+        if timer is not None:
+            timer.mark('cast')
+        with self._child_span('body'):
+            self._parse_and_update_body(handler_def)
+        if timer is not None:
+            timer.mark('body')
+        timed_out = False
+        with self._child_span('handler') as child_span:
+            if child_span is not None:
+                self.request.span = child_span
+            try:
+                if inspect.iscoroutinefunction(handler):
+                    if deadline is None:
+                        resp = await handler(self.request, **kwargs)
+                    else:
+                        try:
+                            resp = await deadline.run(
+                                _tracked(handler(self.request, **kwargs))
+                            )
+                        except GatewayTimeoutError:
+                            timed_out = True
+                            if child_span is not None:
+                                child_span.set_attribute(
+                                    'error', GatewayTimeoutError.__name__
+                                )
+                else:
+                    self.log.warning("'%s' is not a coroutine!",
+                                     handler_def.handler)
+                    resp = handler(self.request, **kwargs)
+            finally:
+                self.request.span = self._span
+        if timed_out:
+            # written once the handler span is finished, as writing the
+            # response finishes and exports the root span
+            self._write_timeout_error(handler_def)
+            return
+        if timer is not None:
+            timer.mark('handler')
 
         if resp:
             self._write_response(resp, handler_def)
@@ -143,46 +459,74 @@ class MainHandler(RequestHandler):
 
     def _write_response(self, response, handler_def=None):
         """Converts various types to JSON and returns to the client"""
-        result = response
-        if hasattr(response, '__json__'):
-            result = response.__json__()
+        with self._child_span('serialize'):
+            result = response
+            if hasattr(response, '__json__'):
+                result = response.__json__()
+
+            if handler_def:
+                if handler_def.produces:
+                    try:
+                        handler_def.produces.validate(result)
+                    except ValidationError:
+                        self.log.warning("Bad output data structure in '%s'",
+                                         handler_def.uri)
+                else:
+                    self.log.warning(
+                        "'%s' has no return type but returns data.",
+                        handler_def.uri
+                    )
 
-        if handler_def:
-            if handler_def.produces:
-                try:
-                    handler_def.produces.validate(result)
-                except ValidationError:
-                    self.log.warning("Bad output data structure in '%s'",
-                                     handler_def.uri)
-            else:
-                self.log.warning("'%s' has no return type but returns data.",
-                                 handler_def.uri)
+            timer = self._timer
+            if timer is not None:
+                timer.mark('validate')
 
-        try:
-            json_str = json.dumps(result)
-        except TypeError:
-            raise ServerError(
-                "Could not serialize '{}' to JSON".format(
-                    type(response).__name__
+            try:
+                json_str = json.dumps(result)
+            except TypeError:
+                raise ServerError(
+                    "Could not serialize '{}' to JSON".format(
+                        type(response).__name__
+                    )
                 )
-            )
+
+            if timer is not None:
+                timer.mark('serialize')
 
         self.set_header('Content-Type', 'application/json')
         self.write(json_str)
         self.finish()
 
+    def finish(self, chunk=None):
+        """Adds the `Server-Timing` header, if the request is timed."""
+        timer = self._timer
+        if timer is not None:
+            self._timer = None
+            self.set_header('Server-Timing', timer.header())
+            self._app.phase_timings.record(self.route, timer)
+
+        return super(MainHandler, self).finish(chunk)
+
     def write_error(self, status_code, exc_info=None, **kwargs):
         """The top function for writing errors"""
+        access_log = self._app.config['access_log']
+        request_id = getattr(self.request, 'request_id', None)
+        if access_log is not None and request_id is not None:
+            # the headers were cleared by `send_error`
+            self.set_header(access_log.request_id_header, request_id)
+
         if exc_info:
             exc_type, exc_inst, _ = exc_info
-            if issubclass(exc_type, ClientError):
+            if (issubclass(exc_type, ClientError) or
+                    (issubclass(exc_type, CalmError) and
+                     getattr(exc_type, 'code', None))):
                 self._write_client_error(exc_inst)
                 return
 
         self._write_server_error()
 
     def _write_client_error(self, exc):
-        """Formats and returns a client error to the client"""
+        """Formats and returns a client (or coded server) error"""
         result = {
             self._app.config['error_key']: exc.message or str(exc)
         }
@@ -213,6 +557,8 @@ class DefaultHandler(MainHandler):
     It implements the `_handle_request` method and raises `NotFoundError` which
     will be returned to the user as an appropriate JSON message.
     """
+    route = '<unmatched>'
+
     async def _handle_request(self, *_, **dummy):
         raise NotFoundError()
 
@@ -246,14 +592,32 @@ class HandlerDef(object):
         self.produces = getattr(handler, 'produces', None)
         self.errors = getattr(handler, 'errors', [])
         self.deprecated = getattr(handler, 'deprecated', False)
+        self.timeout = getattr(handler, 'timeout', None)
+        self.rate_limit = getattr(handler, 'rate_limit', None)
+        self.latency_budget = getattr(handler, 'latency_budget', None)
 
         self._extract_arguments()
-        self.operation_definition = self._generate_operation_definition()
+        self.arg_parsers = None
+        self._operation_definition = None
+
+    @property
+    def operation_definition(self):
+        """
+        The Swagger operation definition of the handler.
+
+        It is generated on the first access, so that defining the routes does
+        not pay for parsing the docstrings and expanding the schemas.
+        """
+        if self._operation_definition is None:
+            self._operation_definition = self._generate_operation_definition()
+
+        return self._operation_definition
 
     def _extract_path_args(self):
         """Extracts path arguments from the URI."""
-        regex = re.compile(self.uri_regex)
-        path_arg_names = list(regex.groupindex.keys())
+        # the groups of the URI regex are named after the URI placeholders,
+        # so the regex does not need to be compiled here
+        path_arg_names = self.URI_REGEX.findall(self.uri)
 
         for arg_name in path_arg_names:
             if arg_name in self._params:
@@ -297,6 +661,35 @@ class HandlerDef(object):
         self._extract_path_args()
         self._extract_query_arguments()
 
+        self.query_parser = QueryParser([q.name for q in self.query_args])
+
+    def resolve_parsers(self, argument_parser):
+        """
+        Resolves the parsers of the annotated arguments by `argument_parser`,
+        and returns the mapping of the argument names to the parsers.
+
+        Raises `DefinitionError` if there is no parser for an argument type.
+        """
+        arg_parsers = {}
+        for arg in self.path_args + self.query_args:
+            arg_type = self._params[arg.name].annotation
+            if arg_type is Parameter.empty:
+                continue
+
+            try:
+                arg_parsers[arg.name] = argument_parser.resolve(arg_type)
+            except DefinitionError as ex:
+                raise DefinitionError(
+                    "Argument '{}' of '{}': {}".format(
+                        arg.name,
+                        self.handler.__name__,
+                        ex
+                    )
+                ) from ex
+
+        self.arg_parsers = arg_parsers
+        return arg_parsers
+
     def _generate_operation_definition(self):
         summary, description = parse_docstring(self.handler.__doc__ or '')
 
@@ -351,5 +744,70 @@ class SwaggerHandler(DefaultHandler):
     This handler defined the GET method to output the Swagger.io (OpenAPI)
     definition for the Calm Application.
     """
+    @property
+    def route(self):
+        return self._app.config['swagger_url']
+
     async def get(self):
         self._write_response(self._app.swagger_json)
+
+
+class HealthHandler(DefaultHandler):
+    """
+    The health check handler.
+
+    Returns `200` while the Calm Application is serving and `503` once it
+    starts shutting down, so that the load balancers stop routing traffic to
+    it.
+    """
+    @property
+    def route(self):
+        return self._app.config['health_url']
+
+    async def get(self):
+        if self._app.draining:
+            self._write_rendered_error(ServiceUnavailableError)
+            return
+
+        self._write_response({'status': 'ok'})
+
+
+class DebugHandler(DefaultHandler):
+    """
+    The base class of the debug handlers.
+
+    The debug handlers are served under the `debug_url` prefix, and respond
+    only to the requests bearing the `debug_token` configuration value in the
+    `X-Calm-Debug-Token` header. Otherwise they pretend to not exist.
+    """
+    TOKEN_HEADER = 'X-Calm-Debug-Token'
+
+    @property
+    def route(self):
+        return self.request.path
+
+    def prepare(self):
+        """Checks the debug token."""
+        super(DebugHandler, self).prepare()
+
+        token = self.request.headers.get(self.TOKEN_HEADER, '')
+        if not hmac.compare_digest(token.encode('utf-8'),
+                                   self._app.config['debug_token'].encode(
+                                       'utf-8'
+                                   )):
+            raise NotFoundError()
+
+
+class MetricsHandler(DefaultHandler):
+    """
+    The handler for the request metrics.
+
+    Serves the metrics of the Calm Application in the Prometheus text format.
+    """
+    @property
+    def route(self):
+        return self._app.config['metrics_url']
+
+    async def get(self):
+        self.set_header('Content-Type', METRICS_CONTENT_TYPE)
+        self.finish(self._app.metrics.render())
@@ -0,0 +1,145 @@
+"""
+This module defines the lifecycle tracking of Calm Applications.
+
+In order to shutdown gracefully, the Calm Application needs to know about the
+requests it is processing and the WebSocket connections it holds. The
+`Lifecycle` class keeps track of them, while `track_websocket` wraps the
+WebSocket handlers registered via `CalmApp.websocket` to register their
+connections, with the `ConnectionManager` of `calm.connections` as well.
+"""
+from tornado import gen
+from tornado.escape import json_encode
+from tornado.locks import Event
+
+
+__all__ = ['Lifecycle', 'track_websocket']
+
+
+class Lifecycle(object):
+    """Tracks the in-flight requests and the open WebSocket connections."""
+    def __init__(self):
+        super(Lifecycle, self).__init__()
+
+        self.draining = False
+        self.in_flight = 0
+        self.websockets = set()
+
+        self._requests_done = Event()
+        self._requests_done.set()
+        self._websockets_done = Event()
+        self._websockets_done.set()
+
+    def request_started(self):
+        """Registers the start of a request."""
+        self.in_flight += 1
+        self._requests_done.clear()
+
+    def request_finished(self):
+        """Registers the end of a request."""
+        self.in_flight -= 1
+        if not self.in_flight:
+            self._requests_done.set()
+
+    def websocket_opened(self, websocket):
+        """Registers an open WebSocket connection."""
+        self.websockets.add(websocket)
+        self._websockets_done.clear()
+
+    def websocket_closed(self, websocket):
+        """Registers a closed WebSocket connection."""
+        self.websockets.discard(websocket)
+        if not self.websockets:
+            self._websockets_done.set()
+
+    async def wait_requests(self, deadline):
+        """
+        Waits for the in-flight requests to finish until `deadline`.
+
+        The `deadline` is in IOLoop time. Returns whether all the requests
+        have finished.
+        """
+        return await self._wait(self._requests_done, deadline)
+
+    async def wait_websockets(self, deadline):
+        """
+        Waits for the WebSocket connections to close until `deadline`.
+
+        The `deadline` is in IOLoop time. Returns whether all the connections
+        have closed.
+        """
+        return await self._wait(self._websockets_done, deadline)
+
+    @classmethod
+    async def _wait(cls, event, deadline):
+        """Waits for `event` until `deadline`."""
+        try:
+            await event.wait(deadline)
+        except gen.TimeoutError:
+            return False
+
+        return True
+
+
+def track_websocket(klass, lifecycle, broadcast=None,
+                    connections=None, uri=None):
+    """
+    Returns a subclass of the WebSocket handler `klass` tracked by `lifecycle`.
+
+    The connections of the subclass register themselves while open, and new
+    connections are refused with `503` status while the application drains,
+    or while the `connections` manager is at its cap. The connections of
+    `uri` are watched by the `connections` manager, and the closed ones are
+    unsubscribed from the `broadcast` hub.
+    """
+    class TrackedWebSocket(klass):
+        """WebSocket handler tracked for graceful shutdown."""
+        def get(self, *args, **kwargs):
+            if lifecycle.draining or (connections is not None
+                                      and not connections.admit(uri)):
+                self.set_status(503)
+                self.finish()
+                return None
+
+            return super(TrackedWebSocket, self).get(*args, **kwargs)
+
+        def open(self, *args, **kwargs):
+            lifecycle.websocket_opened(self)
+            if connections is not None:
+                connections.opened(self, uri)
+            return super(TrackedWebSocket, self).open(*args, **kwargs)
+
+        def on_message(self, message):
+            if connections is not None:
+                connections.message_received(self)
+            return super(TrackedWebSocket, self).on_message(message)
+
+        def on_pong(self, data):
+            if connections is not None:
+                connections.pong_received(self)
+            return super(TrackedWebSocket, self).on_pong(data)
+
+        def write_message(self, message, binary=False):
+            if isinstance(message, dict):
+                message = json_encode(message)
+            future = super(TrackedWebSocket, self).write_message(message,
+                                                                 binary)
+            if connections is not None:
+                size = (len(message.encode('utf-8'))
+                        if isinstance(message, str) else len(message))
+                connections.message_sent(self, size)
+            return future
+
+        def on_close(self):
+            lifecycle.websocket_closed(self)
+            if connections is not None:
+                connections.closed(self)
+            if broadcast is not None:
+                broadcast.unsubscribe(self)
+            return super(TrackedWebSocket, self).on_close()
+
+    TrackedWebSocket.__name__ = klass.__name__
+    TrackedWebSocket.__qualname__ = klass.__qualname__
+    TrackedWebSocket.__module__ = klass.__module__
+    TrackedWebSocket.__doc__ = klass.__doc__
+
+    return TrackedWebSocket
@@ -0,0 +1,190 @@
+"""
+This module defines the adaptive concurrency limiter of Calm.
+
+A static concurrency limit is hard to tune, as the capacity of a service
+changes with the host size and the health of its downstream dependencies.
+The `AdaptiveLimiter` measures the latency of every route and adjusts the
+allowed concurrency of each route automatically, using the
+additive-increase/multiplicative-decrease (AIMD) algorithm. The requests that
+exceed the current limit are shed with `503` status.
+
+Classes:
+    * AdaptiveLimiter - the per-route AIMD concurrency limiter
+"""
+import time
+import logging
+
+from calm.ex import ClientError
+
+
+__all__ = ['AdaptiveLimiter']
+
+
+class _RouteLimit(object):
+    """Holds the limiter state of a single route."""
+    __slots__ = ('limit', 'in_flight', 'accepted', 'rejected', 'dropped',
+                 'latency', 'min_latency', '_window_min', '_window_count',
+                 '_since_decrease')
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.latency = None
+        self.min_latency = None
+        self._window_min = None
+        self._window_count = 0
+        self._since_decrease = 0
+
+    def snapshot(self):
+        """Returns the observable state of the route as a `dict`."""
+        return {
+            'limit': int(self.limit),
+            'in_flight': self.in_flight,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'dropped': self.dropped,
+            'latency': self.latency,
+            'min_latency': self.min_latency
+        }
+
+
+class _Permit(object):
+    """
+    A context manager holding one concurrency slot of a route.
+
+    The slot is released on exit, feeding the measured latency back to the
+    limiter.
+    """
+    __slots__ = ('_limiter', '_route', '_start')
+
+    def __init__(self, limiter, route):
+        self._limiter = limiter
+        self._route = route
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        dropped = (exc_type is not None and
+                   not issubclass(exc_type, ClientError))
+        self._limiter.release(self._route,
+                              time.monotonic() - self._start,
+                              dropped=dropped)
+
+
+class AdaptiveLimiter(object):
+    """
+    Per-route adaptive concurrency limiter.
+
+    Every route starts with `initial_limit` allowed concurrent requests. Each
+    completed request is a latency sample. A sample that is more than
+    `tolerance` times slower than the best recent latency of the route (or
+    slower than `max_latency`, if defined), as well as a request that failed
+    with a server error, is a congestion signal and the limit is multiplied by
+    `backoff`. The limit decreases at most once per round of in-flight
+    requests, so that a single burst of slow responses does not collapse it.
+    Otherwise, while the route is utilized, the limit grows by one for every
+    `limit` successful requests.
+
+    The best recent latency is the minimum of the last `window` samples, so
+    that the limiter follows the changes of the baseline latency as well. It
+    is never considered lower than `latency_floor` seconds, so that the
+    jitter of very fast routes is not mistaken for congestion.
+
+    Use it by configuring the Calm Application:
+
+        app.configure(concurrency_limiter=AdaptiveLimiter())
+
+    The state of the limiter is available via `snapshot()`.
+    """
+    def __init__(self, *,
+                 initial_limit=20, min_limit=1, max_limit=1000,
+                 backoff=0.9, tolerance=2.0, max_latency=None,
+                 window=100, latency_floor=0.001):
+        super(AdaptiveLimiter, self).__init__()
+
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.max_latency = max_latency
+        self.window = window
+        self.latency_floor = latency_floor
+
+        self._routes = {}
+
+        self.log = logging.getLogger('calm')
+
+    def acquire(self, uri):
+        """
+        Acquires a concurrency slot for the route `uri`.
+
+        Returns a `_Permit` context manager which should wrap the processing
+        of the request, or `None` if the request should be shed.
+        """
+        route = self._routes.get(uri)
+        if route is None:
+            route = self._routes[uri] = _RouteLimit(self.initial_limit)
+
+        if route.in_flight >= int(route.limit):
+            route.rejected += 1
+            return None
+
+        route.in_flight += 1
+        route.accepted += 1
+
+        return _Permit(self, route)
+
+    def release(self, route, latency, dropped=False):
+        """Releases a slot of `route` and adjusts its limit."""
+        route.in_flight -= 1
+        route._since_decrease += 1
+
+        if route.latency is None:
+            route.latency = latency
+        else:
+            route.latency += (latency - route.latency) * 0.1
+
+        if route._window_min is None or latency < route._window_min:
+            route._window_min = latency
+        if route.min_latency is None or latency < route.min_latency:
+            route.min_latency = latency
+        route._window_count += 1
+        if route._window_count >= self.window:
+            route.min_latency = route._window_min
+            route._window_min = None
+            route._window_count = 0
+
+        if dropped:
+            route.dropped += 1
+
+        if dropped or self._is_congested(route, latency):
+            if route._since_decrease > route.in_flight:
+                route._since_decrease = 0
+                route.limit = max(self.min_limit,
+                                  route.limit * self.backoff)
+                self.log.debug("Concurrency limit decreased to %d",
+                               int(route.limit))
+        elif (route.in_flight + 1) * 2 >= route.limit:
+            route.limit = min(self.max_limit,
+                              route.limit + 1.0 / route.limit)
+
+    def _is_congested(self, route, latency):
+        """Checks whether the latency sample signals a congestion."""
+        if self.max_latency is not None and latency > self.max_latency:
+            return True
+
+        baseline = max(route.min_latency, self.latency_floor)
+        return latency > baseline * self.tolerance
+
+    def snapshot(self):
+        """Returns the observable state of all routes, keyed by route URI."""
+        return {
+            uri: route.snapshot() for uri, route in self._routes.items()
+        }
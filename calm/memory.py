@@ -0,0 +1,176 @@
+"""
+This module defines the per-route memory accounting of Calm.
+
+When the `memory_sample_rate` configuration is set, a fraction of the
+requests is traced by `tracemalloc`. The tracing starts with the sampled
+request and stops when it finishes, so the other requests run at full speed.
+For every sampled request the following is recorded per route:
+
+    * peak - the peak of the memory allocated during the request
+    * retained - the memory allocated during the request and still not freed
+                 when it finished, which is where the leaks show up
+
+The allocations retained by the sampled requests are aggregated per route by
+their allocation site, and the top ones are reported on demand by
+`MemoryProfiler.report` and, when the `debug_url` configuration is set, by
+the `<debug_url>/memory` endpoint.
+
+Only one request is traced at a time. Note that the allocations of the
+requests interleaved with the sampled one on the IOLoop are attributed to it
+as well. Sampling is skipped while `tracemalloc` is used by someone else.
+"""
+import random
+import tracemalloc
+from collections import Counter
+
+from calm.ex import BadRequestError
+from calm.handler import DebugHandler
+
+
+__all__ = ['MemoryProfiler', 'MemoryHandler']
+
+
+class _RouteMemory(object):
+    """The aggregated memory accounting of a route."""
+    MAX_SITES = 100
+
+    def __init__(self, handler):
+        super(_RouteMemory, self).__init__()
+
+        self.handler = handler
+        self.requests = 0
+        self.peak_total = 0
+        self.peak_max = 0
+        self.retained_total = 0
+        self.sizes = Counter()
+        self.counts = Counter()
+
+    def add(self, peak, retained, statistics):
+        """Adds the accounting of a sampled request."""
+        self.requests += 1
+        self.peak_total += peak
+        self.peak_max = max(self.peak_max, peak)
+        self.retained_total += retained
+
+        for stat in statistics:
+            site = tuple(str(frame) for frame in stat.traceback)
+            self.sizes[site] += stat.size
+            self.counts[site] += stat.count
+
+        if len(self.sizes) > self.MAX_SITES * 2:
+            self.sizes = Counter(dict(self.sizes.most_common(self.MAX_SITES)))
+            self.counts = Counter({site: self.counts[site]
+                                   for site in self.sizes})
+
+    def report(self, top):
+        """Returns the accounting with the `top` retained allocation sites."""
+        return {
+            'handler': self.handler,
+            'requests': self.requests,
+            'peak_bytes': {
+                'mean': self.peak_total // self.requests,
+                'max': self.peak_max
+            },
+            'retained_bytes': {
+                'mean': self.retained_total // self.requests,
+                'total': self.retained_total
+            },
+            'top_retained': [
+                {
+                    'traceback': list(site),
+                    'size': size,
+                    'count': self.counts[site]
+                } for site, size in self.sizes.most_common(top)
+            ]
+        }
+
+
+class _MemorySample(object):
+    """Traces the memory of a sampled request."""
+    __slots__ = ('_profiler', '_handler_def')
+
+    def __init__(self, profiler, handler_def):
+        self._profiler = profiler
+        self._handler_def = handler_def
+
+        tracemalloc.start(profiler.frames)
+
+    def request_finished(self):
+        """Stops the tracing and records the accounting of the request."""
+        retained, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        self._profiler.record(self._handler_def, peak, retained, snapshot)
+
+
+class MemoryProfiler(object):
+    """
+    Accounts the memory of the sampled requests per route.
+
+    Arguments:
+        * sample_rate - the fraction of the requests to trace
+        * frames - the number of the frames stored per allocation site
+    """
+    def __init__(self, sample_rate=0.01, frames=1):
+        super(MemoryProfiler, self).__init__()
+
+        self.sample_rate = sample_rate
+        self.frames = frames
+        self.routes = {}
+
+        self._filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__)
+        ]
+
+    def request_started(self, handler_def):
+        """
+        Samples the request of `handler_def`.
+
+        Returns the probe tracing the request, or `None` if it is not sampled.
+        """
+        if (random.random() >= self.sample_rate or
+                tracemalloc.is_tracing()):
+            return None
+
+        return _MemorySample(self, handler_def)
+
+    def record(self, handler_def, peak, retained, snapshot):
+        """Records the accounting of a sampled request of `handler_def`."""
+        route = self.routes.get(handler_def.uri)
+        if route is None:
+            handler = handler_def.handler
+            route = self.routes[handler_def.uri] = _RouteMemory(
+                '.'.join([handler.__module__, handler.__qualname__])
+            )
+
+        statistics = snapshot.filter_traces(self._filters).statistics(
+            'traceback' if self.frames > 1 else 'lineno'
+        )
+        route.add(peak, retained, statistics)
+
+    def report(self, route=None, top=10):
+        """
+        Returns the accounting of `route` (all by default) with the `top`
+        retained allocation sites.
+        """
+        return {
+            uri: memory.report(top)
+            for uri, memory in sorted(self.routes.items())
+            if route is None or uri == route
+        }
+
+
+class MemoryHandler(DebugHandler):
+    """The handler of the memory accounting endpoint."""
+    async def get(self):
+        try:
+            top = int(self.get_query_argument('top', '10'))
+        except ValueError:
+            raise BadRequestError("Bad 'top' argument")
+
+        self._write_response(self._app.memory_profiler.report(
+            route=self.get_query_argument('route', None),
+            top=top
+        ))
@@ -0,0 +1,216 @@
+"""
+This module defines the typed message routing of the Calm WebSockets.
+
+The messages of a `MessageWebSocket` are JSON envelopes carrying the message
+type and its data, e.g. `{"type": "join", "data": {"room": "lobby"}}`. The
+messages are routed to the methods decorated with `handles` by their type,
+and the `consumes` and `produces` decorators define the Resources of the
+data, the same way as for the HTTP handlers:
+
+    @app.websocket('/chat')
+    class ChatWebSocket(MessageWebSocket):
+        @handles('join')
+        @consumes(JoinRequest)
+        @produces(Room)
+        async def join(self, request):
+            return await rooms.join(request.room)
+
+The data of a consumed Resource is validated by its compiled validator and
+converted to the Resource object, the value returned by the method is sent
+back with the same message type, and the `ClientError`s raised by the method
+are sent back as `error` messages. A frame may carry an array of envelopes,
+which are routed one by one.
+
+The methods decorated with `handles(message_type, batch=True)` receive the
+messages in batches: the validated data of the messages of their type is
+collected for `batch_interval` seconds, and the method is called once with
+the list of the data, e.g.:
+
+    class GameWebSocket(MessageWebSocket):
+        batch_interval = 0.05
+
+        @handles('move', batch=True)
+        @consumes(Move)
+        async def moves(self, moves):
+            await game.apply(moves)
+
+The batched messages are handled after the messages routed in the meantime.
+
+Independently of that, when the `send_interval` attribute is set, the
+messages sent by `send` are not written one frame per message, but collected
+for `send_interval` seconds and written as a JSON array in a single frame.
+"""
+import json
+import inspect
+import logging
+
+from tornado.ioloop import IOLoop
+from tornado.websocket import WebSocketHandler, WebSocketClosedError
+
+from untt.ex import ValidationError
+
+from calm.ex import ClientError
+
+
+__all__ = ['MessageWebSocket', 'handles']
+
+
+def handles(message_type, batch=False):
+    """
+    Decorator to specify the type of the messages the method handles.
+
+    With `batch` set, the method is called with the list of the data of the
+    messages received within `MessageWebSocket.batch_interval`.
+    """
+    def decor(func):
+        """The function wrapper."""
+        func.message_type = message_type
+        func.message_batch = batch
+
+        return func
+
+    return decor
+
+
+class MessageWebSocket(WebSocketHandler):
+    """
+    The base class of the WebSocket handlers routing typed messages.
+
+    The message routes are collected from the methods decorated with
+    `handles` when the class is defined.
+    """
+    TYPE_KEY = 'type'
+    DATA_KEY = 'data'
+    ERROR_TYPE = 'error'
+    batch_interval = 0
+    send_interval = None
+    message_routes = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super(MessageWebSocket, cls).__init_subclass__(**kwargs)
+
+        routes = dict(cls.message_routes)
+        for name, attribute in vars(cls).items():
+            message_type = getattr(attribute, 'message_type', None)
+            if message_type is not None:
+                routes[message_type] = name
+        cls.message_routes = routes
+
+    def initialize(self, *args, **kwargs):
+        super(MessageWebSocket, self).initialize(*args, **kwargs)
+
+        self._batches = {}
+        self._sent = None
+        self.log = logging.getLogger('calm')
+
+    async def on_message(self, message):
+        """Routes the message, or the array of messages, by the type."""
+        try:
+            envelopes = json.loads(message)
+        except ValueError:
+            self.send(self.ERROR_TYPE, "Malformed message. JSON is expected.")
+            return
+
+        if not isinstance(envelopes, list):
+            envelopes = [envelopes]
+
+        for envelope in envelopes:
+            await self._route_message(envelope)
+
+    async def _route_message(self, envelope):
+        """Calls the method handling the `envelope` type."""
+        method_name = None
+        if isinstance(envelope, dict):
+            message_type = envelope.get(self.TYPE_KEY)
+            method_name = self.message_routes.get(message_type)
+        if method_name is None:
+            self.send(self.ERROR_TYPE, "Unknown message type.")
+            return
+
+        method = getattr(self, method_name)
+        data = envelope.get(self.DATA_KEY)
+
+        consumes = getattr(method, 'consumes', None)
+        if consumes is not None:
+            try:
+                data = consumes.from_json(data)
+            except ValidationError:
+                self.send(self.ERROR_TYPE, "Bad data structure.")
+                return
+
+        if getattr(method, 'message_batch', False):
+            self._queue_batch(message_type, data)
+            return
+
+        await self._call_handler(message_type, method, data)
+
+    def _queue_batch(self, message_type, data):
+        """Queues the `data` for the batched handler of `message_type`."""
+        batch = self._batches.get(message_type)
+        if batch is None:
+            batch = self._batches[message_type] = []
+            IOLoop.current().call_later(self.batch_interval,
+                                        self._flush_batch, message_type)
+        batch.append(data)
+
+    async def _flush_batch(self, message_type):
+        """Calls the batched handler of `message_type` with the queued data."""
+        batch = self._batches.pop(message_type, None)
+        if batch:
+            method = getattr(self, self.message_routes[message_type])
+            await self._call_handler(message_type, method, batch)
+
+    async def _call_handler(self, message_type, method, data):
+        """Calls `method` with `data` and sends the result back."""
+        try:
+            result = method(data)
+            if inspect.isawaitable(result):
+                result = await result
+        except ClientError as ex:
+            self.send(self.ERROR_TYPE, ex.message or str(ex))
+            return
+
+        if result is None:
+            return
+
+        if hasattr(result, '__json__'):
+            result = result.__json__()
+
+        produces = getattr(method, 'produces', None)
+        if produces is not None:
+            try:
+                produces.validate(result)
+            except ValidationError:
+                self.log.warning("Bad output data structure of '%s' "
+                                 "messages", message_type)
+
+        self.send(message_type, result)
+
+    def send(self, message_type, data=None):
+        """Sends a message of `message_type` with `data`."""
+        if hasattr(data, '__json__'):
+            data = data.__json__()
+
+        envelope = {self.TYPE_KEY: message_type, self.DATA_KEY: data}
+        if self.send_interval is None:
+            self._write(json.dumps(envelope))
+            return
+
+        if self._sent is None:
+            self._sent = []
+            IOLoop.current().call_later(self.send_interval,
+                                        self._flush_sent)
+        self._sent.append(envelope)
+
+    def _flush_sent(self):
+        """Writes the messages collected by `send` in a single frame."""
+        sent = self._sent
+        self._sent = None
+        if sent:
+            self._write(json.dumps(sent))
+
+    def _write(self, message):
+        try:
+            self.write_message(message)
+        except WebSocketClosedError:
+            pass
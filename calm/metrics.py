@@ -0,0 +1,192 @@
+"""
+This module defines the request metrics of Calm.
+
+When the `metrics_url` configuration is set, the Calm Application records a
+latency histogram for every route template, HTTP method and response status,
+along with the in-flight requests and the server errors of every route. The
+metrics are served on `metrics_url` in the Prometheus text format.
+
+The metrics are recorded on the IOLoop thread only, so recording needs no
+locks: it is a dictionary lookup, a bisection over the bucket bounds and a few
+integer increments.
+
+Classes:
+    * Histogram - a fixed-bucket latency histogram
+    * Metrics - the metrics registry of a Calm Application
+"""
+from bisect import bisect_left
+
+
+__all__ = ['Histogram', 'Metrics', 'format_labels']
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram(object):
+    """A histogram with fixed bucket upper bounds."""
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Records a `value`."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """Returns the `(upper bound, cumulative count)` pairs, up to `+Inf`."""
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+
+def _escape(value):
+    """Escapes a Prometheus label value."""
+    return (str(value).replace('\\', r'\\')
+            .replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def _format_bound(bound):
+    """Formats a bucket bound as Prometheus does."""
+    if bound == float('inf'):
+        return '+Inf'
+
+    return repr(float(bound))
+
+
+def format_labels(**labels):
+    """Formats the labels of a sample in the Prometheus text format."""
+    return '{' + ','.join(
+        '{}="{}"'.format(name, _escape(value))
+        for name, value in labels.items()
+    ) + '}'
+
+
+class Metrics(object):
+    """
+    The metrics registry of a Calm Application.
+
+    The latencies are kept per route, method and status, where the route is
+    the route template (`HandlerDef.uri`) and not the raw request path, so
+    that the number of series stays bounded.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        super(Metrics, self).__init__()
+
+        self.buckets = tuple(buckets)
+
+        self.latencies = {}
+        self.in_flight = {}
+        self.errors = {}
+
+        self._collectors = []
+
+    def add_collector(self, collector):
+        """
+        Adds a collector of more metrics to the registry.
+
+        A collector is a function returning a list of lines in the Prometheus
+        text format, which are appended to the rendered metrics.
+        """
+        self._collectors.append(collector)
+
+    def request_started(self, route):
+        """Records the start of a request of `route`."""
+        self.in_flight[route] = self.in_flight.get(route, 0) + 1
+
+    def request_finished(self, route, method, status, latency):
+        """Records a finished request and its latency in seconds."""
+        self.in_flight[route] -= 1
+
+        # nested dictionaries are used instead of tuple keys and
+        # `Histogram.observe` is inlined, as this is on the hot path
+        try:
+            histogram = self.latencies[route][method][status]
+        except KeyError:
+            histogram = self._add_histogram(route, method, status)
+
+        histogram.counts[bisect_left(histogram.bounds, latency)] += 1
+        histogram.sum += latency
+        histogram.count += 1
+
+        if status >= 500:
+            key = (route, method, status)
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def _add_histogram(self, route, method, status):
+        """Creates the latency histogram of a new series."""
+        histogram = Histogram(self.buckets)
+        self.latencies.setdefault(route, {}).setdefault(method, {})[
+            status
+        ] = histogram
+
+        return histogram
+
+    def histograms(self):
+        """Yields `(route, method, status, histogram)` of all the series."""
+        for route, methods in self.latencies.items():
+            for method, statuses in methods.items():
+                for status, histogram in statuses.items():
+                    yield route, method, status, histogram
+
+    def render(self):
+        """Renders the metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP calm_request_duration_seconds '
+            'Request latency by route template.',
+            '# TYPE calm_request_duration_seconds histogram'
+        ]
+        for route, method, status, histogram in sorted(
+                self.histograms(), key=lambda series: series[:3]):
+            labels = dict(route=route, method=method, status=status)
+            for bound, count in histogram.cumulative_counts():
+                bucket_labels = dict(labels, le=_format_bound(bound))
+                lines.append('calm_request_duration_seconds_bucket{} {}'.format(
+                    format_labels(**bucket_labels), count
+                ))
+            lines.append('calm_request_duration_seconds_sum{} {!r}'.format(
+                format_labels(**labels), histogram.sum
+            ))
+            lines.append('calm_request_duration_seconds_count{} {}'.format(
+                format_labels(**labels), histogram.count
+            ))
+
+        lines += [
+            '# HELP calm_requests_in_flight '
+            'Requests being processed by route template.',
+            '# TYPE calm_requests_in_flight gauge'
+        ]
+        for route, count in sorted(self.in_flight.items()):
+            lines.append('calm_requests_in_flight{} {}'.format(
+                format_labels(route=route), count
+            ))
+
+        lines += [
+            '# HELP calm_request_errors_total '
+            'Requests failed with a server error by route template.',
+            '# TYPE calm_request_errors_total counter'
+        ]
+        for (route, method, status), count in sorted(self.errors.items()):
+            labels = format_labels(route=route, method=method, status=status)
+            lines.append('calm_request_errors_total{} {}'.format(
+                labels, count
+            ))
+
+        for collector in self._collectors:
+            lines += collector()
+
+        return '\n'.join(lines) + '\n'
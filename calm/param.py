@@ -16,6 +16,7 @@ class Parameter(object):
             raise DefinitionError(
                 "Wrong argument type for '{}'".format(name)
             ) from ex
+        self.is_array = isinstance(self.param_type, list)
         self.param_in = param_in
         self.required = default is P.empty
         self.default = default if default is not P.empty else None
@@ -30,6 +31,9 @@ class Parameter(object):
 
         if self.json_type == 'array':
             swagger['items'] = self.json_type.params['items']
+            if self.param_in == 'query':
+                # both repeated and comma separated values are accepted
+                swagger['collectionFormat'] = 'multi'
 
         if not self.required:
             swagger['default'] = self.default
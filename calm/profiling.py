@@ -0,0 +1,267 @@
+"""
+This module defines the on-demand profiling of live Calm workers.
+
+When the `debug_url` configuration is set (along with `debug_token`), the
+Calm Application serves the profiling endpoint at `<debug_url>/profile`. The
+endpoint profiles the worker and returns the aggregated results, so that
+flamegraphs can be produced without restarting it. It supports three modes,
+selected by the `mode` query argument:
+
+    * requests - profiles the next `count` requests with cProfile
+    * route - profiles the next `count` requests of the route template
+              `route` with cProfile
+    * sample - samples the stack of the IOLoop thread every `interval`
+               seconds for `seconds` seconds
+
+The cProfile modes return the `pstats` text report, or the binary `pstats`
+dump (loadable by `pstats.Stats`) when `format=pstats`. Note that cProfile
+profiles the whole IOLoop thread from the start of the first profiled request
+to the end of the last one, including the interleaved requests. The sampling
+mode has a much lower overhead and returns the collapsed stacks, one per line
+with the number of samples, which is the input format of `flamegraph.pl`.
+
+Example:
+    $ curl -H 'X-Calm-Debug-Token: secret' \\
+        'localhost:8888/_calm/profile?mode=sample&seconds=30' > stacks.txt
+    $ flamegraph.pl stacks.txt > flamegraph.svg
+"""
+import io
+import os
+import sys
+import time
+import pstats
+import marshal
+import cProfile
+import threading
+from collections import Counter
+
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from tornado import gen
+
+from calm.ex import BadRequestError
+from calm.handler import DebugHandler
+
+
+__all__ = ['Profiler', 'ProfileHandler']
+
+
+class _ProfileSession(object):
+    """Profiles the next `count` requests matching `route` with cProfile."""
+    def __init__(self, count, route=None):
+        super(_ProfileSession, self).__init__()
+
+        self.count = count
+        self.route = route
+        self.done = Future()
+
+        self._profile = cProfile.Profile()
+        self._started = 0
+        self._finished = 0
+
+    def _matches(self, route):
+        return self.route is None or self.route == route
+
+    def request_started(self, route):
+        """Starts profiling, if the request matches the session."""
+        if self._started >= self.count or not self._matches(route):
+            return False
+
+        if not self._started:
+            self._profile.enable()
+        self._started += 1
+
+        return True
+
+    def request_finished(self):
+        """Stops profiling after the last profiled request."""
+        self._finished += 1
+        if self._finished >= self.count:
+            self.stop()
+
+    def stop(self):
+        """Stops profiling and resolves the session."""
+        if self.done.done():
+            return
+
+        self._profile.disable()
+        self.done.set_result(self._finished)
+
+    def render(self, output_format):
+        """Returns the aggregated stats in `output_format`."""
+        if not self._started:
+            if output_format == 'pstats':
+                return marshal.dumps({})
+            return "No requests were profiled.\n"
+
+        if output_format == 'pstats':
+            self._profile.create_stats()
+            return marshal.dumps(self._profile.stats)
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats()
+
+        return stream.getvalue()
+
+
+class _SamplingSession(object):
+    """Samples the stack of a thread periodically in a background thread."""
+    def __init__(self, thread_id, seconds, interval):
+        super(_SamplingSession, self).__init__()
+
+        self.thread_id = thread_id
+        self.seconds = seconds
+        self.interval = interval
+        self.done = Future()
+
+        self._stacks = Counter()
+        self._io_loop = IOLoop.current()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample,
+                                        name='calm-profiler',
+                                        daemon=True)
+
+    def start(self):
+        """Starts sampling."""
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling."""
+        self._stopped.set()
+
+    def _sample(self):
+        """The sampling loop running in the background thread."""
+        deadline = time.monotonic() + self.seconds
+        while not self._stopped.is_set() and time.monotonic() < deadline:
+            frame = sys._current_frames().get(  # pylint: disable=W0212
+                self.thread_id
+            )
+            if frame is not None:
+                self._stacks[collapse_stack(frame)] += 1
+            self._stopped.wait(self.interval)
+
+        self._io_loop.add_callback(self._resolve)
+
+    def _resolve(self):
+        if not self.done.done():
+            self.done.set_result(sum(self._stacks.values()))
+
+    def render(self, _):
+        """Returns the collapsed stacks."""
+        return ''.join(
+            '{} {}\n'.format(stack, count)
+            for stack, count in self._stacks.most_common()
+        )
+
+
+def collapse_stack(frame):
+    """Formats the stack of `frame` as a collapsed stack, root first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{}:{}'.format(os.path.basename(code.co_filename),
+                                    code.co_name))
+        frame = frame.f_back
+
+    return ';'.join(reversed(names))
+
+
+class Profiler(object):
+    """
+    Holds the profiling session of a Calm Application.
+
+    Only one session may run at a time. `MainHandler` reports the requests to
+    the running session.
+    """
+    def __init__(self):
+        super(Profiler, self).__init__()
+
+        self.session = None
+
+    async def profile_requests(self, count, route=None, timeout=60):
+        """
+        Profiles the next `count` requests (of `route`, if given).
+
+        Waits for the requests at most `timeout` seconds, then returns the
+        session with the stats collected so far.
+        """
+        if count < 1:
+            raise BadRequestError("At least one request must be profiled")
+
+        session = _ProfileSession(count, route)
+        return await self._run(session, timeout)
+
+    async def sample(self, seconds, interval=0.005):
+        """Samples the stack of the IOLoop thread for `seconds` seconds."""
+        session = _SamplingSession(threading.get_ident(), seconds, interval)
+        session.start()
+        return await self._run(session, seconds + 5)
+
+    async def _run(self, session, timeout):
+        if self.session is not None:
+            session.stop()
+            raise BadRequestError("A profiling session is already running")
+
+        self.session = session
+        try:
+            await gen.with_timeout(IOLoop.current().time() + timeout,
+                                   session.done)
+        except gen.TimeoutError:
+            pass
+        finally:
+            session.stop()
+            self.session = None
+
+        return session
+
+    def request_started(self, handler_def):
+        """
+        Reports the start of a request of `handler_def` to the running session.
+
+        Returns the session if it profiles the request, otherwise `None`.
+        """
+        session = self.session
+        if isinstance(session, _ProfileSession):
+            if session.request_started(handler_def.uri):
+                return session
+
+        return None
+
+
+class ProfileHandler(DebugHandler):
+    """The handler of the on-demand profiling endpoint."""
+    async def get(self):
+        profiler = self._app.profiler
+        mode = self.get_query_argument('mode', 'requests')
+        output_format = self.get_query_argument('format', 'text')
+
+        try:
+            if mode in ('requests', 'route'):
+                route = None
+                if mode == 'route':
+                    route = self.get_query_argument('route')
+                session = await profiler.profile_requests(
+                    int(self.get_query_argument('count', '10')),
+                    route=route,
+                    timeout=float(self.get_query_argument('timeout', '60'))
+                )
+            elif mode == 'sample':
+                session = await profiler.sample(
+                    float(self.get_query_argument('seconds', '10')),
+                    interval=float(self.get_query_argument('interval',
+                                                           '0.005'))
+                )
+            else:
+                raise BadRequestError(
+                    "Unknown profiling mode '{}'".format(mode)
+                )
+        except ValueError:
+            raise BadRequestError("Bad profiling arguments")
+
+        result = session.render(output_format)
+        if isinstance(result, bytes):
+            self.set_header('Content-Type', 'application/octet-stream')
+        else:
+            self.set_header('Content-Type', 'text/plain; charset=utf-8')
+        self.finish(result)
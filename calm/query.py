@@ -0,0 +1,62 @@
+"""
+This module defines the query argument extraction of Calm.
+
+The query arguments of a handler are extracted in a single pass over its
+declared argument names, and only their values are decoded, instead of a
+`RequestHandler.get_query_argument` call per argument. The values are cleaned
+up the same way as by Tornado:
+
+    * the values are decoded as UTF-8, a bad value is a `BadRequestError`
+    * the control characters are replaced by spaces
+    * the leading and trailing whitespace is stripped
+"""
+import re
+
+from calm.ex import BadRequestError
+
+
+__all__ = ['QueryParser']
+
+
+_CONTROL_CHARS_REGEX = re.compile(r'[\x00-\x08\x0e-\x1f]')
+
+
+class QueryParser(object):
+    """Extracts the values of the query arguments with `names`."""
+    __slots__ = ('names',)
+
+    def __init__(self, names):
+        super(QueryParser, self).__init__()
+
+        self.names = tuple(names)
+
+    def parse(self, query_arguments):
+        """
+        Returns a mapping of the names found in `query_arguments`, as parsed
+        by Tornado, to the lists of their decoded values, in the order of
+        appearance, so that the last one wins for the single values.
+        """
+        arguments = {}
+        if not query_arguments:
+            return arguments
+
+        for name in self.names:
+            raw_values = query_arguments.get(name)
+            if raw_values is None:
+                continue
+
+            values = arguments[name] = []
+            for raw_value in raw_values:
+                try:
+                    value = raw_value.decode('utf-8')
+                except UnicodeDecodeError:
+                    raise BadRequestError(
+                        "Invalid unicode in query argument '{}'".format(name)
+                    )
+
+                if not value.isprintable():
+                    value = _CONTROL_CHARS_REGEX.sub(' ', value)
+
+                values.append(value.strip())
+
+        return arguments
@@ -0,0 +1,150 @@
+"""
+This module defines the in-memory rate limiting of Calm.
+
+Rate limits are token buckets, keyed by a client key, which is the client IP
+address by default. A quota may be defined for a single handler using the
+`@rate_limit` decorator, or for the whole application using the `rate_limit`
+configuration. The application-wide quota is shared by all the routes, while
+a handler quota is counted for its route only. The rejected requests are
+returned `429` status before their body is parsed.
+
+Example:
+    from calm.ratelimit import RateLimit, header_key
+
+    app.configure(rate_limit=RateLimit(100, burst=200))
+
+    @app.post('/reports')
+    @rate_limit(1, burst=5, key=header_key('X-API-Key'))
+    async def create_report(request):
+        ...
+
+Classes:
+    * RateLimit - the quota definition
+    * RateLimiter - the token bucket store of the application
+"""
+import time
+import math
+from collections import OrderedDict
+
+from calm.ex import DefinitionError
+
+
+__all__ = ['RateLimit', 'RateLimiter', 'client_ip', 'header_key']
+
+
+def client_ip(request):
+    """The default key function, which keys the clients by IP address."""
+    return request.remote_ip
+
+
+def header_key(header):
+    """
+    Returns a key function which keys the clients by the `header` value.
+
+    The clients that do not send the header are keyed by IP address.
+    """
+    def key(request):
+        """Takes the key from the header."""
+        return request.headers.get(header) or request.remote_ip
+
+    return key
+
+
+class RateLimit(object):
+    """
+    Defines a quota of `rate` requests per second with bursts up to `burst`.
+
+    The `key` function takes the request and returns the client key the
+    quota is counted for.
+    """
+    def __init__(self, rate, burst=None, key=client_ip):
+        super(RateLimit, self).__init__()
+
+        if rate <= 0:
+            raise DefinitionError("Rate limit should be a positive number.")
+        if not callable(key):
+            raise DefinitionError("Rate limit key should be a function.")
+
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.key = key
+
+
+class _Bucket(object):
+    """The token bucket of a single client key."""
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter(object):
+    """
+    Holds the token buckets of all the active client keys.
+
+    Every bucket takes constant memory. The buckets are kept in the order of
+    their last use, so the idle ones are at the front: a few of them are
+    evicted on every check once they are idle for `max_idle` seconds, and the
+    least recently used ones are evicted beyond `max_keys`. A bucket which is
+    idle long enough to refill is equivalent to a new one, so eviction is
+    lossless as long as `max_idle` is longer than `burst / rate` of the
+    quotas.
+    """
+    SWEEP_BATCH = 4
+
+    def __init__(self, *, max_idle=300, max_keys=1000000):
+        super(RateLimiter, self).__init__()
+
+        self.max_idle = max_idle
+        self.max_keys = max_keys
+
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def check(self, quota, scope, request):
+        """
+        Takes a token for the request from the bucket of `quota` in `scope`.
+
+        Returns `0` when the request is allowed, otherwise the number of
+        seconds after which the client should retry.
+        """
+        now = time.monotonic()
+        key = (scope, quota.key(request))
+        buckets = self._buckets
+
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _Bucket(quota.burst, now)
+            if len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+            bucket.tokens = min(
+                quota.burst,
+                bucket.tokens + (now - bucket.updated) * quota.rate
+            )
+            bucket.updated = now
+
+        self._sweep(now)
+
+        if bucket.tokens < 1:
+            return max(1, math.ceil((1 - bucket.tokens) / quota.rate))
+
+        bucket.tokens -= 1
+        return 0
+
+    def _sweep(self, now):
+        """Evicts a few of the idle buckets."""
+        buckets = self._buckets
+        for _ in range(self.SWEEP_BATCH):
+            if not buckets:
+                return
+
+            key = next(iter(buckets))
+            if now - buckets[key].updated < self.max_idle:
+                return
+
+            del buckets[key]
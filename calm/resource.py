@@ -1,13 +1,115 @@
+from weakref import WeakKeyDictionary
+from collections.abc import MutableMapping
+
+from jsonschema import FormatChecker
+from jsonschema import ValidationError as JsonSchemaValidationError
+from jsonschema.validators import validator_for
+
 from untt import Entity
+from untt.entity import SCHEMA_URL
+from untt.ex import ValidationError
+from untt.field import Field
 from untt.util import entity_base
 from untt.types import (Integer, Number, String,  # noqa
                         Boolean, Array, Datetime)
 
+from calm.ex import DefinitionError
+
+
+def field_storage(field):
+    """
+    Returns the mapping the `untt.Field` stores the values of the objects in.
+
+    `untt.Field` has no public way to store a value without validating it,
+    and keeps the values in a plain dict, so this is the only place relying
+    on its internals. The dict is replaced by a WeakKeyDictionary on the first
+    call.
+    """
+    values = vars(field).get('_values')
+    if isinstance(values, WeakKeyDictionary):
+        return values
+    if not isinstance(values, MutableMapping):
+        raise DefinitionError(
+            "Unsupported untt version: '{}' keeps no '_values' mapping"
+            .format(type(field).__name__)
+        )
+
+    values = field._values = WeakKeyDictionary(values)
+
+    return values
+
 
 @entity_base
 class Resource(Entity):
+    """
+    The base class of the Calm Resources.
+
+    Unlike `untt.Entity`, which builds and checks the JSON Schema and its
+    validator on every validation and validates every field again on
+    assignment, a Resource compiles its validator once, and `from_json`
+    validates the whole JSON value with it once.
+
+    The fields of the Resources hold their values weakly, so the Resource
+    objects are freed when they are not used anymore.
+    """
     schema_root = True
 
+    def __init_subclass__(cls, **kwargs):
+        super(Resource, cls).__init_subclass__(**kwargs)
+
+        for field in cls.__dict__.values():
+            if isinstance(field, Field):
+                field_storage(field)
+
+    @classmethod
+    def validator(cls):
+        """Returns the compiled JSON Schema validator of the Resource."""
+        validator = cls.__dict__.get('_compiled_validator')
+        if validator is None:
+            schema = {
+                '$schema': SCHEMA_URL,
+                'definitions': cls.schema_definitions,
+            }
+            schema.update(cls.json_schema)
+
+            validator_class = validator_for(schema)
+            validator_class.check_schema(schema)
+            validator = validator_class(schema,
+                                        format_checker=FormatChecker())
+            cls._compiled_validator = validator
+
+        return validator
+
+    @classmethod
+    def validate(cls, json_value):
+        """Validates `json_value` against the Resource JSON Schema."""
+        try:
+            cls.validator().validate(json_value)
+        except JsonSchemaValidationError as ex:
+            raise ValidationError(str(ex)) from ex
+
+    @classmethod
+    def from_json(cls, json_value):
+        """Initiates a Resource object out of a valid JSON object."""
+        json_obj = cls.load_json(json_value)
+
+        try:
+            obj = cls()
+        except TypeError as ex:
+            raise TypeError(
+                "'{}' implements a custom '__init__' with arguments. "
+                "Please implement a custom 'from_json' to support it."
+                .format(cls.__name__)
+            ) from ex
+
+        # the values are valid already, so the validation of the fields on
+        # assignment is skipped
+        properties = cls.untt_properties
+        for name, value in json_obj.items():
+            field_storage(properties[name])[obj] = value
+
+        return obj
+
     def __json__(self):
         """Proxies `Entity.to_json()`."""
         return self.to_json()  # pragma: no cover
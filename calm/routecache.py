@@ -0,0 +1,191 @@
+"""
+This module defines the persisted route table snapshot of Calm.
+
+When the `route_cache` configuration is set to a file path, the Calm
+Application stores the compiled route regexes and the swagger.json document,
+along with the operation definitions in it, to that file once they are
+generated. The next processes load them from the file instead of generating
+them again.
+
+The snapshot is keyed by a hash of the routes, the handlers, the Application
+metadata and the modules (their paths, modification times and sizes) defining
+the handlers and every type they refer to: the argument and return
+annotations, the consumed and produced Resources, the Resources and the field
+types nested in them and their base classes. As the route table and the
+swagger.json are generated by Calm itself, the key includes the hashes of the
+sources of the Calm modules too, which may change without a version bump. Any
+change of the code or the routes changes the key, and the stale snapshot is
+ignored and replaced.
+
+Note that the regexes are compiled by Tornado in every process, as the
+compiled regexes cannot be persisted, and that the handler signatures are
+still inspected when the handlers are defined, as that validates the handler
+definitions.
+"""
+import os
+import sys
+import json
+import hashlib
+import logging
+import tempfile
+from functools import lru_cache
+
+from untt.field import Field
+
+from calm.ex import ClientError
+
+
+__all__ = ['RouteCache']
+
+
+def _collect_modules(value, modules, seen):
+    """
+    Adds the modules of the types `value` refers to, to `modules`.
+
+    The Resources and the untt fields are followed recursively, so that the
+    types nested in them are collected as well.
+    """
+    if id(value) in seen:
+        return
+    seen.add(id(value))
+
+    if isinstance(value, type):
+        if value.__module__ != 'builtins':
+            modules.add(value.__module__)
+        for base in value.__mro__[1:]:
+            _collect_modules(base, modules, seen)
+        for field in getattr(value, 'untt_properties', {}).values():
+            _collect_modules(field, modules, seen)
+    elif isinstance(value, Field):
+        _collect_modules(type(value), modules, seen)
+        for name, attribute in vars(value).items():
+            # the values of the objects are not part of the definition
+            if name != '_values':
+                _collect_modules(attribute, modules, seen)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            _collect_modules(item, modules, seen)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_modules(item, modules, seen)
+
+
+@lru_cache(maxsize=None)
+def _calm_source_hashes():
+    """
+    Returns the hashes of the sources of the Calm package modules, read once
+    per process. The whole package is hashed, as its modules are imported
+    lazily.
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    hashes = []
+    for name in sorted(os.listdir(package_dir)):
+        if not name.endswith('.py'):
+            continue
+
+        try:
+            with open(os.path.join(package_dir, name), 'rb') as source:
+                digest = hashlib.sha256(source.read()).hexdigest()
+        except OSError:
+            digest = None
+        hashes.append([name, digest])
+
+    return hashes
+
+
+class RouteCache(object):
+    """The route table snapshot of `app` stored at `path`."""
+    VERSION = 1
+
+    def __init__(self, path, app):
+        super(RouteCache, self).__init__()
+
+        self.path = path
+        self.key = self._compute_key(app)
+
+        self.log = logging.getLogger('calm')
+
+    @classmethod
+    def _compute_key(cls, app):
+        """Returns the hash of everything the snapshot depends on."""
+        from calm import __version__
+
+        material = [cls.VERSION, __version__, app.name, app.version,
+                    app.description, app.tos, app.license, app.contact,
+                    app.host, app.base_path, app.config['error_key'],
+                    _calm_source_hashes()]
+        modules = set()
+        seen = set()
+        route_map = app._route_map  # pylint: disable=W0212
+        for uri, methods in sorted(route_map.items()):
+            for method, handler_def in sorted(methods.items()):
+                handler = handler_def.handler
+                material.append([uri, method, handler.__module__,
+                                 handler.__qualname__])
+                modules.add(handler.__module__)
+                for resource in (handler_def.consumes, handler_def.produces):
+                    if resource is not None:
+                        material.append(resource.__qualname__)
+                signature = handler_def._signature  # pylint: disable=W0212
+                annotations = [signature.return_annotation] + [
+                    param.annotation
+                    for param in signature.parameters.values()
+                ]
+                _collect_modules(
+                    [handler_def.consumes, handler_def.produces] + [
+                        annotation for annotation in annotations
+                        if annotation is not signature.empty
+                    ],
+                    modules, seen
+                )
+
+        for error in ClientError.get_defined_errors():
+            material.append(error.__qualname__)
+            modules.add(error.__module__)
+
+        for module_name in sorted(modules):
+            path = getattr(sys.modules.get(module_name), '__file__', None)
+            if path is None:
+                material.append([module_name, None])
+                continue
+
+            try:
+                stat = os.stat(path)
+                material.append([path, stat.st_mtime_ns, stat.st_size])
+            except OSError:
+                material.append([path, None])
+
+        return hashlib.sha256(
+            json.dumps(material, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+
+    def load(self):
+        """Returns the stored snapshot, or `None` if it is missing or stale."""
+        try:
+            with open(self.path, encoding='utf-8') as cache_file:
+                snapshot = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(snapshot, dict) or snapshot.get('key') != self.key:
+            return None
+
+        return snapshot
+
+    def store(self, routes, swagger_json):
+        """Stores the route regexes and the swagger.json atomically."""
+        snapshot = {
+            'key': self.key,
+            'routes': routes,
+            'swagger': swagger_json
+        }
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as cache_file:
+                json.dump(snapshot, cache_file)
+            os.replace(tmp_path, self.path)
+        except (OSError, TypeError, ValueError):
+            self.log.warning("Could not store the route cache to '%s'",
+                             self.path, exc_info=True)
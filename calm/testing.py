@@ -2,42 +2,121 @@
 This is the testing module for Calm applications.
 
 This defines a handy subclass with its utilities, so that you can use them to
-test your Calm applications more conveniently and with less code.
+test your Calm applications more conveniently and with less code. The
+`CalmInProcessTestCase` runs the requests through the application in-process,
+without sockets, by `CalmTestClient`. The `CalmHTTPTestCase.load` utility
+drives concurrent load against the app under test, so that performance
+assertions can live next to the functional tests.
 """
 import json
-
-from tornado.testing import AsyncHTTPTestCase
+import time
+import asyncio
+from io import BytesIO
+
+from tornado.concurrent import Future
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPResponse
+from tornado.httputil import HTTPHeaders, HTTPServerRequest
+from tornado.testing import (AsyncHTTPTestCase, AsyncTestCase,
+                             get_async_test_timeout)
 from tornado.websocket import websocket_connect
 
 from calm.core import CalmApp
 
 
-class CalmHTTPTestCase(AsyncHTTPTestCase):
+def percentile(values, pct):
+    """Returns the `pct` percentile of the sorted `values`."""
+    if not values:
+        return None
+
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def _milliseconds(seconds):
+    if seconds is None:
+        return None
+
+    return round(seconds * 1000, 3)
+
+
+async def drive(request, concurrency, *, requests=None, duration=None):
     """
-    This is the base class to inherit in order to test your Calm app.
+    Runs `concurrency` workers calling `request` concurrently.
+
+    Each worker calls `await request(worker)` in a loop, where `worker` is its
+    index, and the call returns the status of the response. The load stops
+    after `requests` calls in total or after `duration` seconds, whichever
+    comes first.
 
-    You may use this to test only the HTTP part of your application.
+    Returns the number of requests, the throughput, the latency percentiles
+    in milliseconds and the status distribution.
     """
-    def get_calm_app(self):
-        """
-        This method needs to be implemented by the user.
+    if requests is None and duration is None:
+        raise ValueError("Either 'requests' or 'duration' is required")
+
+    latencies = []
+    statuses = {}
+    remaining = [requests if requests is not None else float('inf')]
+    deadline = (time.perf_counter() + duration if duration is not None
+                else float('inf'))
+
+    async def worker(index):
+        while remaining[0] > 0 and time.perf_counter() < deadline:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            status = await request(index)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(i) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'duration': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'p50': _milliseconds(percentile(latencies, 50)),
+            'p90': _milliseconds(percentile(latencies, 90)),
+            'p99': _milliseconds(percentile(latencies, 99)),
+            'max': _milliseconds(latencies[-1] if latencies else None)
+        },
+        'statuses': {str(s): c for s, c in sorted(statuses.items())}
+    }
+
+
+async def generate_load(url, *, concurrency=8, requests=None, duration=None,
+                        **kwargs):
+    """
+    Sends `concurrency` concurrent requests to `url` for `duration` seconds
+    or `requests` requests in total, see `drive`.
 
-        Simply return an instance of your Calm application so that Calm will
-        know what are you testing.
-        """
-        pass  # pragma: no cover
+    The requests are made by a pooled `AsyncHTTPClient` of `concurrency`
+    connections on the current IOLoop. The keyword arguments are passed to
+    `AsyncHTTPClient.fetch`.
+    """
+    client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
 
-    def get_app(self):
-        """This one is for Tornado, returns the app under test."""
-        calm_app = self.get_calm_app()
+    async def request(_):
+        resp = await client.fetch(url, raise_error=False, **kwargs)
+        return resp.code
 
-        if calm_app is None or not isinstance(calm_app, CalmApp):
-            raise NotImplementedError(  # pragma: no cover
-                "Please implement CalmTestCase.get_calm_app()"
-            )
+    try:
+        return await drive(request, concurrency,
+                           requests=requests, duration=duration)
+    finally:
+        client.close()
 
-        return calm_app.make_app()
 
+class CalmRequestMixin(object):
+    """
+    The request and assertion utilities of the Calm test cases.
+
+    The test case makes the requests by its `fetch(url, **kwargs)` method,
+    returning a `tornado.httpclient.HTTPResponse`.
+    """
     def _request(self, url, *args,
                  expected_code=200,
                  expected_body=None,
@@ -108,6 +187,219 @@ class CalmHTTPTestCase(AsyncHTTPTestCase):
         return self._request(url, *args, **kwargs)
 
 
+class CalmHTTPTestCase(CalmRequestMixin, AsyncHTTPTestCase):
+    """
+    This is the base class to inherit in order to test your Calm app.
+
+    You may use this to test only the HTTP part of your application. The
+    requests are sent over a loopback HTTP connection, see
+    `CalmInProcessTestCase` for the faster in-process requests.
+    """
+    def get_calm_app(self):
+        """
+        This method needs to be implemented by the user.
+
+        Simply return an instance of your Calm application so that Calm will
+        know what are you testing.
+        """
+        pass  # pragma: no cover
+
+    def get_app(self):
+        """This one is for Tornado, returns the app under test."""
+        calm_app = self.get_calm_app()
+
+        if calm_app is None or not isinstance(calm_app, CalmApp):
+            raise NotImplementedError(  # pragma: no cover
+                "Please implement CalmTestCase.get_calm_app()"
+            )
+
+        return calm_app.make_app()
+
+    def load(self, url, *, concurrency=8, requests=None, duration=None,
+             json_body=None, **kwargs):
+        """
+        Loads the `url` of your app with concurrent requests.
+
+        Sends `concurrency` concurrent requests for `duration` seconds or
+        `requests` requests in total, and returns the number of requests, the
+        throughput (`rps`), the latency percentiles in milliseconds
+        (`latency_ms`) and the status distribution (`statuses`), e.g.:
+
+            result = self.load('/items', concurrency=64, duration=5)
+            self.assertLess(result['latency_ms']['p99'], 50)
+            self.assertEqual(set(result['statuses']), {'200'})
+
+        The rest of the keyword arguments are passed to
+        `AsyncHTTPClient.fetch`.
+        """
+        if json_body is not None:
+            kwargs['body'] = json.dumps(json_body)
+
+        return self.io_loop.run_sync(
+            lambda: generate_load(self.get_url(url),
+                                  concurrency=concurrency,
+                                  requests=requests,
+                                  duration=duration,
+                                  **kwargs),
+            timeout=None
+        )
+
+
+class _Context(object):
+    """The address of the in-process client."""
+    remote_ip = '127.0.0.1'
+    protocol = 'http'
+
+
+class _InProcessConnection(object):
+    """
+    The `HTTPConnection` of an in-process request.
+
+    The response is collected in memory and `done` is resolved when the
+    handler finishes.
+    """
+    def __init__(self):
+        super(_InProcessConnection, self).__init__()
+
+        self.context = _Context()
+        self.start_line = None
+        self.headers = None
+        self.chunks = []
+        self.done = Future()
+
+    @classmethod
+    def _written(cls):
+        future = Future()
+        future.set_result(None)
+
+        return future
+
+    def set_close_callback(self, callback):
+        """The in-process connection is never closed by the client."""
+
+    def write_headers(self, start_line, headers, chunk=None):
+        """Records the response status line and headers."""
+        self.start_line = start_line
+        self.headers = headers
+        if chunk:
+            self.chunks.append(chunk)
+
+        return self._written()
+
+    def write(self, chunk):
+        """Records a chunk of the response body."""
+        self.chunks.append(chunk)
+
+        return self._written()
+
+    def finish(self):
+        """Marks the response as complete."""
+        if not self.done.done():
+            self.done.set_result(None)
+
+
+class CalmTestClient(object):
+    """
+    Runs the requests through a Calm application in-process.
+
+    Every request is built as a `HTTPServerRequest` in memory and passed to
+    the router and the handler of the application directly, without a socket
+    and without the HTTP parsing, e.g.:
+
+        client = CalmTestClient(app)
+        resp = await client.fetch('/items?limit=5')
+        assert resp.code == 200
+    """
+    def __init__(self, calm_app):
+        super(CalmTestClient, self).__init__()
+
+        self.calm_app = calm_app
+        self.app = calm_app.make_app()
+
+    async def fetch(self, url, method='GET', body=None, headers=None):
+        """
+        Makes a request to the `url` path of the application.
+
+        Returns a `tornado.httpclient.HTTPResponse` with the status, the
+        headers and the body of the response.
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        headers = HTTPHeaders(headers or {})
+        headers.setdefault('Host', '127.0.0.1')
+        if body is not None:
+            headers['Content-Length'] = str(len(body))
+
+        connection = _InProcessConnection()
+        request = HTTPServerRequest(method=method, uri=url, version='HTTP/1.1',
+                                    headers=headers, body=body,
+                                    connection=connection)
+        request._parse_body()  # pylint: disable=protected-access
+
+        start = time.perf_counter()
+        self.app(request)
+        await connection.done
+
+        start_line = connection.start_line
+        return HTTPResponse(
+            HTTPRequest('http://127.0.0.1' + url, method=method,
+                        headers=headers, body=body),
+            start_line.code,
+            reason=start_line.reason,
+            headers=connection.headers,
+            buffer=BytesIO(b''.join(connection.chunks)),
+            request_time=time.perf_counter() - start
+        )
+
+
+class CalmInProcessTestCase(CalmRequestMixin, AsyncTestCase):
+    """
+    The base class to test your Calm app with in-process requests.
+
+    It has the same utilities as `CalmHTTPTestCase`, but the requests are run
+    through the application by `CalmTestClient`, without a server, which
+    makes the tests a lot faster. The tests relying on a real connection,
+    e.g. its closing, or on the `HTTPServer` options should use
+    `CalmHTTPTestCase`.
+
+    The application is compiled once per test case class, and compiled again
+    only when `get_calm_app` returns another application, so the routes
+    should be defined before the first test runs. The compiled application is
+    started on the IOLoop of every test by `CalmApp.start`.
+    """
+    def get_calm_app(self):
+        """
+        This method needs to be implemented by the user.
+
+        Simply return an instance of your Calm application so that Calm will
+        know what are you testing.
+        """
+        pass  # pragma: no cover
+
+    def setUp(self):
+        super(CalmInProcessTestCase, self).setUp()
+
+        calm_app = self.get_calm_app()
+        if calm_app is None or not isinstance(calm_app, CalmApp):
+            raise NotImplementedError(  # pragma: no cover
+                "Please implement CalmInProcessTestCase.get_calm_app()"
+            )
+
+        # the class of the test case, not its base, keeps the client
+        client = type(self).__dict__.get('_client')
+        if client is None or client.calm_app is not calm_app:
+            client = type(self)._client = CalmTestClient(calm_app)
+        else:
+            calm_app.start()
+        self.client = client
+
+    def fetch(self, url, **kwargs):
+        """Makes a request to the `url` path synchronously."""
+        return self.io_loop.run_sync(lambda: self.client.fetch(url, **kwargs),
+                                     timeout=get_async_test_timeout())
+
+
 class CalmWebSocketTestCase(AsyncHTTPTestCase):
     """
     This is the base class to inherit in order to test your WS handlers.
@@ -0,0 +1,112 @@
+"""
+This module defines the per-phase request timing of Calm.
+
+When the `server_timing` configuration is enabled, `MainHandler` times every
+phase of the request processing:
+
+    * query - extracting the query arguments
+    * cast - casting the arguments to the annotated types
+    * body - decoding and validating the request body
+    * handler - the user handler itself
+    * validate - validating the output of the handler
+    * serialize - serializing the output to JSON
+
+The timings are returned to the client in the `Server-Timing` response
+header, and are aggregated per route template. When the timing is disabled,
+the only cost left in `MainHandler` is a `None` check per phase.
+
+Classes:
+    * PhaseTimer - the timer of a single request
+    * PhaseTimings - the per-route aggregation of the phase timings
+"""
+import time
+
+from calm.metrics import format_labels
+
+
+__all__ = ['PhaseTimer', 'PhaseTimings']
+
+
+class PhaseTimer(object):
+    """
+    Times the consecutive phases of a single request.
+
+    Every `mark` call closes the phase that started with the previous mark
+    (or with the creation of the timer).
+    """
+    __slots__ = ('phases', '_last')
+
+    def __init__(self):
+        self.phases = []
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        """Records the duration of `phase`, which has just ended."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def header(self):
+        """Formats the `Server-Timing` header value, in milliseconds."""
+        return ', '.join(
+            '{};dur={:.3f}'.format(phase, duration * 1000)
+            for phase, duration in self.phases
+        )
+
+
+class PhaseTimings(object):
+    """Aggregates the phase timings of the requests per route template."""
+    def __init__(self):
+        super(PhaseTimings, self).__init__()
+
+        self._routes = {}
+
+    def record(self, route, timer):
+        """Adds the phases of a finished request of `route`."""
+        phases = self._routes.get(route)
+        if phases is None:
+            phases = self._routes[route] = {}
+
+        for phase, duration in timer.phases:
+            stats = phases.get(phase)
+            if stats is None:
+                phases[phase] = [1, duration]
+            else:
+                stats[0] += 1
+                stats[1] += duration
+
+    def snapshot(self):
+        """
+        Returns the aggregated timings.
+
+        The result maps routes to phases to the number of timed requests and
+        the total and mean durations in seconds.
+        """
+        return {
+            route: {
+                phase: {
+                    'count': count,
+                    'total': total,
+                    'mean': total / count
+                } for phase, (count, total) in phases.items()
+            } for route, phases in self._routes.items()
+        }
+
+    def collect(self):
+        """Returns the timings as lines of the Prometheus text format."""
+        lines = [
+            '# HELP calm_request_phase_seconds '
+            'Time spent in the request processing phases by route template.',
+            '# TYPE calm_request_phase_seconds summary'
+        ]
+        for route, phases in sorted(self._routes.items()):
+            for phase, (count, total) in sorted(phases.items()):
+                labels = format_labels(route=route, phase=phase)
+                lines.append('calm_request_phase_seconds_sum{} {!r}'.format(
+                    labels, total
+                ))
+                lines.append('calm_request_phase_seconds_count{} {}'.format(
+                    labels, count
+                ))
+
+        return lines
@@ -0,0 +1,301 @@
+"""
+This module defines the lightweight request tracing of Calm.
+
+When the `tracer` configuration is set to a `Tracer`, `MainHandler` opens a
+root span for every sampled request, with the child spans for parsing the
+request body, running the handler and serializing the response. The span of
+the handler is available to it as `request.span`, so that it can add its own
+child spans and propagate the trace to the downstream services:
+
+    @app.get('/items/{item_id}')
+    async def get_item(request, item_id):
+        headers = {}
+        if request.span is not None:
+            headers['traceparent'] = request.span.traceparent
+        return await fetch_item(item_id, headers)
+
+The incoming W3C `traceparent` header continues the trace of the caller, and
+its sampling decision is respected. The requests the caller has not sampled
+get a `NonRecordingSpan`, which records nothing but still propagates the trace
+ID and the flags of the caller. Other requests are sampled at the
+`sample_rate` of the tracer, and the unsampled ones get `request.span` set to
+`None` and allocate no spans at all.
+
+The finished spans of a request are passed to the exporter of the tracer as a
+batch. Calm ships with the following exporters:
+
+    * NoopExporter - discards the spans, the default
+    * InMemoryExporter - keeps the spans in a list, meant for tests
+    * FileExporter - appends the spans as JSON lines to a file
+"""
+import re
+import json
+import time
+import random
+import logging
+
+from calm.ex import DefinitionError
+
+__all__ = ['Tracer', 'Span', 'NonRecordingSpan', 'NoopExporter',
+           'InMemoryExporter', 'FileExporter']
+
+
+TRACEPARENT_REGEX = re.compile(
+    r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$'
+)
+INVALID_TRACE_ID = '0' * 32
+INVALID_SPAN_ID = '0' * 16
+SAMPLED_FLAG = 0x01
+
+
+def _new_trace_id():
+    return '{:032x}'.format(random.getrandbits(128))
+
+
+def _new_span_id():
+    return '{:016x}'.format(random.getrandbits(64))
+
+
+def parse_traceparent(header):
+    """
+    Parses the W3C `traceparent` header.
+
+    Returns a tuple of the trace ID, the parent span ID and the trace flags,
+    of which `SAMPLED_FLAG` is the sampled flag, or `None` if the header is
+    malformed.
+    """
+    match = TRACEPARENT_REGEX.match(header.strip().lower())
+    if match is None:
+        return None
+
+    version, trace_id, span_id, flags = match.groups()
+    if (version == 'ff' or trace_id == INVALID_TRACE_ID or
+            span_id == INVALID_SPAN_ID):
+        return None
+
+    return trace_id, span_id, int(flags, 16)
+
+
+class Span(object):
+    """
+    A timed operation of a trace.
+
+    The spans are created by `Tracer.start_request` and `Span.child`, and
+    must be finished by `finish` (or by using them as context managers).
+    Finishing the root span exports all the finished spans of the request.
+    """
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'flags',
+                 'attributes', 'start_time', 'duration', '_start', '_trace',
+                 '_tracer')
+
+    def __init__(self, name, trace_id, parent_id, trace, tracer=None,
+                 flags=SAMPLED_FLAG):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.flags = flags
+        self.attributes = {}
+        self.start_time = time.time()
+        self.duration = None
+
+        self._start = time.perf_counter()
+        self._trace = trace
+        self._tracer = tracer
+
+    @property
+    def traceparent(self):
+        """The W3C `traceparent` header value to propagate the span."""
+        return '00-{}-{}-{:02x}'.format(self.trace_id, self.span_id,
+                                        self.flags)
+
+    def child(self, name):
+        """Starts a child span."""
+        return Span(name, self.trace_id, self.span_id, self._trace,
+                    flags=self.flags)
+
+    def set_attribute(self, key, value):
+        """Sets an attribute of the span."""
+        self.attributes[key] = value
+
+    def finish(self):
+        """Finishes the span, exporting the trace if this is the root span."""
+        if self.duration is not None:
+            return
+
+        self.duration = time.perf_counter() - self._start
+        self._trace.append(self)
+        if self._tracer is not None:
+            self._tracer.export(self._trace)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        self.finish()
+
+    def __json__(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'attributes': self.attributes
+        }
+
+
+class NonRecordingSpan(object):
+    """
+    The span of a request the caller has not sampled.
+
+    It records nothing, and its children are the span itself, but it
+    propagates the trace ID, the span ID and the flags of the caller, so that
+    the downstream services see the same unsampled trace.
+    """
+    __slots__ = ('trace_id', 'span_id', 'flags')
+
+    def __init__(self, trace_id, span_id, flags):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.flags = flags
+
+    @property
+    def traceparent(self):
+        """The W3C `traceparent` header value to propagate the span."""
+        return '00-{}-{}-{:02x}'.format(self.trace_id, self.span_id,
+                                        self.flags)
+
+    def child(self, name):
+        """Returns the span itself, as nothing is recorded."""
+        return self
+
+    def set_attribute(self, key, value):
+        """Discards the attribute."""
+        pass
+
+    def finish(self):
+        """Does nothing, as nothing is recorded."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+
+class NoopExporter(object):
+    """Discards the spans."""
+    def export(self, spans):
+        """Exports the finished spans of a request."""
+        pass
+
+
+class InMemoryExporter(object):
+    """Keeps the exported spans in the `spans` list."""
+    def __init__(self):
+        super(InMemoryExporter, self).__init__()
+
+        self.spans = []
+
+    def export(self, spans):
+        """Exports the finished spans of a request."""
+        self.spans.extend(spans)
+
+    def clear(self):
+        """Forgets the exported spans."""
+        self.spans = []
+
+
+class FileExporter(object):
+    """
+    Appends the spans to the file at `path`, one JSON object per line.
+
+    The file is written on the IOLoop thread, so this exporter is meant for
+    tests and local debugging.
+    """
+    def __init__(self, path):
+        super(FileExporter, self).__init__()
+
+        self.path = path
+        self._file = None
+
+    def export(self, spans):
+        """Exports the finished spans of a request."""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+        self._file.write(''.join(
+            json.dumps(span.__json__()) + '\n' for span in spans
+        ))
+        self._file.flush()
+
+    def close(self):
+        """Closes the file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Tracer(object):
+    """
+    Samples the requests and starts their root spans.
+
+    Arguments:
+        * exporter - the exporter of the finished spans, `NoopExporter` by
+                     default
+        * sample_rate - the fraction of the requests to trace, when the
+                        caller does not decide it by the `traceparent` header
+    """
+    HEADER = 'traceparent'
+
+    def __init__(self, exporter=None, sample_rate=1.0):
+        super(Tracer, self).__init__()
+
+        if not 0 <= sample_rate <= 1:
+            raise DefinitionError("'sample_rate' should be between 0 and 1")
+
+        self.exporter = exporter if exporter is not None else NoopExporter()
+        self.sample_rate = sample_rate
+
+        self.log = logging.getLogger('calm')
+
+    def start_request(self, request, route):
+        """
+        Starts the root span of `request` to `route`.
+
+        Returns a `NonRecordingSpan` if the caller has not sampled the
+        request, and `None` if the request is not sampled otherwise.
+        """
+        trace_id = parent_id = None
+        flags = SAMPLED_FLAG
+        header = request.headers.get(self.HEADER)
+        if header is not None:
+            parent = parse_traceparent(header)
+            if parent is not None:
+                trace_id, parent_id, flags = parent
+                if not flags & SAMPLED_FLAG:
+                    return NonRecordingSpan(trace_id, parent_id, flags)
+
+        if trace_id is None:
+            if random.random() >= self.sample_rate:
+                return None
+            trace_id = _new_trace_id()
+
+        span = Span('{} {}'.format(request.method, route),
+                    trace_id, parent_id, [], self, flags)
+        span.attributes['http.method'] = request.method
+        span.attributes['http.route'] = route
+
+        return span
+
+    def export(self, spans):
+        """Passes the finished spans to the exporter."""
+        try:
+            self.exporter.export(spans)
+        except Exception:  # pylint: disable=broad-except
+            self.log.exception("Failed to export the spans")
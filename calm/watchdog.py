@@ -0,0 +1,249 @@
+"""
+This module defines the event-loop watchdog of Calm.
+
+The watchdog catches two kinds of problems:
+
+    * blocked - the IOLoop did not run for longer than the
+                `blocking_threshold` configuration, e.g. because a handler
+                does blocking I/O or heavy computation. A background thread
+                notices the missing heartbeat of the IOLoop and captures the
+                stack of the blocking code, along with the route and the
+                handler being executed.
+    * slow - a request took longer than its latency budget, which is set by
+             the `@latency_budget` decorator or the `latency_budget`
+             configuration. The stack of the request coroutine is captured
+             at the moment the budget expires, showing what it is waiting on.
+
+Every finding is logged to the `calm` logger and kept in a bounded ring
+buffer, which is queryable by `Watchdog.query` and, when the `debug_url`
+configuration is set, by the `<debug_url>/watchdog` endpoint.
+"""
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from calm.ex import BadRequestError
+from calm.handler import DebugHandler, task_handler_def
+
+
+__all__ = ['Watchdog', 'WatchdogHandler']
+
+
+def _running_handler_def(io_loop):
+    """
+    Returns the `HandlerDef` processed by the task running on `io_loop`, which
+    is called from another thread.
+    """
+    task = asyncio.current_task(io_loop.asyncio_loop)
+    if task is None:
+        return None
+
+    return task_handler_def(task)
+
+
+def _coroutine_frames(coro):
+    """Returns the frames of the await chain of `coro`, outermost first."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame',
+                                                           None)
+        if frame is not None:
+            frames.append(frame)
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom',
+                                                          None)
+
+    return frames
+
+
+def _current_coroutine():
+    """Returns the coroutine of the running asyncio task, if any."""
+    try:
+        task = asyncio.current_task()
+    except (RuntimeError, AttributeError):
+        return None
+
+    return getattr(task, '_coro', None)
+
+
+class _SlowRequestProbe(object):
+    """Captures the stack of a request, if it exceeds its latency budget."""
+    __slots__ = ('_watchdog', '_handler_def', '_coro', '_start', '_timeout')
+
+    def __init__(self, watchdog, handler_def, budget):
+        self._watchdog = watchdog
+        self._handler_def = handler_def
+        self._coro = _current_coroutine()
+        self._start = time.perf_counter()
+        self._timeout = watchdog.io_loop.call_later(budget, self._expired)
+
+    def _expired(self):
+        self._timeout = None
+        frames = _coroutine_frames(self._coro)
+        self._watchdog.report(
+            'slow',
+            time.perf_counter() - self._start,
+            self._handler_def,
+            traceback.StackSummary.extract(
+                (frame, frame.f_lineno) for frame in frames
+            )
+        )
+
+    def request_finished(self):
+        """Cancels the capture, if the request finished in time."""
+        if self._timeout is not None:
+            self._watchdog.io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+
+
+class Watchdog(object):
+    """
+    Detects the blocked IOLoop and the requests exceeding their budget.
+
+    Arguments:
+        * threshold - the IOLoop lag in seconds to report, `None` disables
+                      the blocking detection
+        * latency_budget - the default latency budget of the routes in
+                           seconds, `None` means no budget
+        * buffer_size - the number of the findings to keep
+    """
+    def __init__(self, threshold=0.1, latency_budget=None, buffer_size=100):
+        super(Watchdog, self).__init__()
+
+        self.threshold = threshold
+        self.latency_budget = latency_budget
+        self.findings = deque(maxlen=buffer_size)
+        self.io_loop = None
+
+        self._interval = threshold / 2 if threshold else None
+        self._heartbeat = None
+        self._thread_id = None
+        self._periodic = None
+        self._stopped = threading.Event()
+
+        self.log = logging.getLogger('calm')
+
+    def start(self):
+        """
+        Starts watching the current IOLoop. A stopped watchdog may be started
+        again, e.g. on another IOLoop.
+        """
+        self.io_loop = IOLoop.current()
+        if self.threshold is None:
+            return
+
+        self._heartbeat = None
+        self._stopped = threading.Event()
+        self._periodic = PeriodicCallback(self._beat, self._interval * 1000)
+        self._periodic.start()
+        threading.Thread(target=self._monitor,
+                         args=(self._stopped,),
+                         name='calm-watchdog',
+                         daemon=True).start()
+
+    def stop(self):
+        """Stops watching."""
+        self._stopped.set()
+        if self._periodic is not None:
+            self._periodic.stop()
+            self._periodic = None
+
+    def _beat(self):
+        """The heartbeat, called periodically on the IOLoop thread."""
+        self._thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+
+    def _monitor(self, stopped):
+        """Checks the heartbeat of the IOLoop in the background thread."""
+        reported = None
+        while not stopped.wait(self._interval):
+            heartbeat = self._heartbeat
+            if heartbeat is None or heartbeat == reported:
+                continue
+
+            lag = time.monotonic() - heartbeat - self._interval
+            if lag < self.threshold:
+                continue
+
+            reported = heartbeat
+            frame = sys._current_frames().get(  # pylint: disable=W0212
+                self._thread_id
+            )
+            if frame is None:
+                continue
+
+            self.report('blocked',
+                        lag,
+                        _running_handler_def(self.io_loop),
+                        traceback.extract_stack(frame))
+
+    def request_started(self, handler_def):
+        """
+        Starts watching the latency of a request of `handler_def`.
+
+        Returns the probe to be finished with the request, or `None` if the
+        route has no latency budget.
+        """
+        budget = handler_def.latency_budget or self.latency_budget
+        if budget is None:
+            return None
+
+        return _SlowRequestProbe(self, handler_def, budget)
+
+    def report(self, kind, duration, handler_def, stack):
+        """Logs a finding and adds it to the ring buffer."""
+        route = handler = None
+        if handler_def is not None:
+            route = handler_def.uri
+            handler = '.'.join([handler_def.handler.__module__,
+                                handler_def.handler.__qualname__])
+        stack = ''.join(stack.format())
+
+        self.findings.append({
+            'kind': kind,
+            'time': time.time(),
+            'duration': duration,
+            'route': route,
+            'handler': handler,
+            'stack': stack
+        })
+
+        if kind == 'blocked':
+            message = "The IOLoop has been blocked for %.3fs in '%s' (%s)\n%s"
+        else:
+            message = ("A request took more than %.3fs in '%s' (%s), "
+                       "waiting on:\n%s")
+        self.log.warning(message, duration, route, handler, stack)
+
+    def query(self, kind=None, route=None, limit=None):
+        """Returns the latest findings of `kind` and `route`, newest first."""
+        findings = [
+            finding for finding in reversed(list(self.findings))
+            if (kind is None or finding['kind'] == kind) and
+            (route is None or finding['route'] == route)
+        ]
+
+        return findings[:limit]
+
+
+class WatchdogHandler(DebugHandler):
+    """The handler of the watchdog findings endpoint."""
+    async def get(self):
+        limit = self.get_query_argument('limit', None)
+        try:
+            limit = int(limit) if limit is not None else None
+        except ValueError:
+            raise BadRequestError("Bad 'limit' argument")
+
+        self._write_response({
+            'findings': self._app.watchdog.query(
+                kind=self.get_query_argument('kind', None),
+                route=self.get_query_argument('route', None),
+                limit=limit
+            )
+        })
@@ -0,0 +1,185 @@
+"""
+Simulation benchmark of the Calm adaptive concurrency limiter.
+
+A local fake slow backend with a fixed capacity is put behind a Calm route,
+served by a separate process, so that the work of the load generator does not
+delay the server and inflate the latencies the limiter reacts to. The offered
+load is ramped up in stages of a fixed request rate, once without a
+concurrency limiter and once with `AdaptiveLimiter`. The load is open-loop:
+the requests are sent on schedule regardless of the responses, so the shed
+requests are not retried and the latency is measured from the scheduled send
+time. For every stage the goodput (the accepted requests per second, until the
+last response), the shed ratio, the latency percentiles of the accepted
+requests and the concurrency limit are reported.
+
+Without the limiter the requests queue up in the backend once the offered load
+exceeds its capacity, and the p99 latency grows with the offered load. With
+the limiter the excess load is shed, the p99 latency stays bounded and the
+goodput stays close to the capacity.
+
+Usage:
+    python scripts/bench_limiter.py [--stages 0.5,1,1.5,2,4] [--duration 5]
+
+The stages are the offered load relative to the backend capacity, which is
+`capacity / delay` requests per second.
+"""
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import multiprocessing
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+
+from calm import Application
+from calm.limiter import AdaptiveLimiter
+
+
+class FakeBackend(object):
+    """A backend serving `capacity` calls at a time, each taking `delay`."""
+    def __init__(self, capacity, delay):
+        self._slots = asyncio.Semaphore(capacity)
+        self._delay = delay
+
+    async def call(self):
+        async with self._slots:
+            await asyncio.sleep(self._delay)
+
+
+def make_app(backend, limiter):
+    app = Application('bench', '1')
+    app.configure(concurrency_limiter=limiter)
+
+    @app.get('/backend')
+    async def backend_route(request):
+        await backend.call()
+
+    @app.get('/limit')
+    async def limit_route(request) -> dict:
+        if limiter is None:
+            return {'limit': None}
+        return {'limit': limiter.snapshot().get('/backend', {}).get('limit')}
+
+    return app.make_app()
+
+
+def serve(port_pipe, capacity, delay, limited, initial_limit):
+    """Runs the server of the fake backend, reporting its port."""
+    logging.getLogger('tornado.access').setLevel(logging.CRITICAL)
+    logging.getLogger('calm').setLevel(logging.ERROR)
+
+    async def start():
+        backend = FakeBackend(capacity, delay)
+        limiter = (AdaptiveLimiter(initial_limit=initial_limit)
+                   if limited else None)
+        sockets = bind_sockets(0, '127.0.0.1', backlog=4096)
+        HTTPServer(make_app(backend, limiter)).add_sockets(sockets)
+        port_pipe.send(sockets[0].getsockname()[1])
+
+    IOLoop.current().add_callback(start)
+    IOLoop.current().start()
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+async def run_stage(client, url, rate, duration):
+    latencies = []
+    statuses = {}
+    requests = []
+    start = time.monotonic()
+
+    async def request(scheduled):
+        resp = await client.fetch(url + '/backend', raise_error=False)
+        if resp.code == 200:
+            latencies.append(time.monotonic() - scheduled)
+        statuses[resp.code] = statuses.get(resp.code, 0) + 1
+
+    sent = 0
+    while sent < rate * duration:
+        scheduled = start + sent / rate
+        delay = scheduled - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        requests.append(asyncio.ensure_future(request(scheduled)))
+        sent += 1
+
+    await asyncio.gather(*requests)
+    # the queued requests of an overloaded backend finish after the stage
+    elapsed = time.monotonic() - start
+    limit = await client.fetch(url + '/limit')
+
+    total = sum(statuses.values())
+    return {
+        'offered_rps': rate,
+        'goodput_rps': round(len(latencies) / elapsed, 1),
+        'shed_ratio': round(statuses.get(503, 0) / total, 3) if total else 0,
+        'p50_ms': _milliseconds(percentile(latencies, 50)),
+        'p99_ms': _milliseconds(percentile(latencies, 99)),
+        'limit': json.loads(limit.body.decode('utf-8'))['limit']
+    }
+
+
+def run_mode(limited, args):
+    # the server is spawned, as a forked one would share the IOLoop poller
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    server = context.Process(
+        target=serve,
+        args=(sender, args.capacity, args.delay, limited, args.capacity),
+        daemon=True
+    )
+    server.start()
+    url = 'http://127.0.0.1:{}'.format(receiver.recv())
+
+    capacity = args.capacity / args.delay
+    client = AsyncHTTPClient(force_instance=True, max_clients=10000,
+                             defaults={'connect_timeout': 300,
+                                       'request_timeout': 300})
+
+    async def run():
+        return [
+            await run_stage(client, url, capacity * stage, args.duration)
+            for stage in args.stages
+        ]
+
+    try:
+        return IOLoop.current().run_sync(run)
+    finally:
+        client.close()
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--stages', default='0.5,1,1.5,2,4',
+                        type=lambda s: [float(c) for c in s.split(',')])
+    parser.add_argument('--duration', default=5.0, type=float)
+    parser.add_argument('--capacity', default=8, type=int)
+    parser.add_argument('--delay', default=0.05, type=float)
+    args = parser.parse_args()
+
+    json.dump({
+        'capacity_rps': args.capacity / args.delay,
+        'unlimited': run_mode(False, args),
+        'adaptive': run_mode(True, args)
+    }, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
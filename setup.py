@@ -35,7 +35,8 @@ setup(
 
         'License :: OSI Approved :: MIT License',
 
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3 :: Only',
 
@@ -50,5 +51,10 @@ setup(
 
     packages=find_packages(exclude=['docs', 'tests']),
 
+    python_requires='>=3.7',
+
     install_requires=requirements,
+    extras_require={
+        'numpy': ['numpy']
+    },
 )
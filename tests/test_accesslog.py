@@ -0,0 +1,83 @@
+import io
+import json
+from unittest import TestCase
+
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+from calm.accesslog import AccessLog
+
+
+stream = io.StringIO()
+app = Application('testaccesslog', '1')
+app.configure(access_log=AccessLog(stream), metrics_url='/metrics')
+
+
+@app.post('/items/{item_id}')
+async def update_item(request, item_id):
+    return {'request_id': request.request_id}
+
+
+def read_records():
+    app.config['access_log'].close()
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    stream.seek(0)
+    stream.truncate()
+    app.config['access_log'].start()
+
+    return records
+
+
+class AccessLogQueueTests(TestCase):
+    def test_drop_when_full(self):
+        access_log = AccessLog(io.StringIO(), max_queue=2)
+        for _ in range(5):
+            access_log.record({})
+
+        self.assertEqual(access_log.dropped, 3)
+        self.assertIn('calm_access_log_dropped_total 3', access_log.collect())
+
+        access_log.start()
+        access_log.close()
+        self.assertEqual(access_log.target.getvalue(), '{}\n{}\n')
+
+
+class AccessLogTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        global app
+        return app
+
+    def setUp(self):
+        super(AccessLogTests, self).setUp()
+        read_records()
+
+    def test_record(self):
+        resp = self.post('/items/12', json_body={'name': 'item'})
+        request_id = json.loads(resp.body.decode('utf-8'))['request_id']
+        self.assertEqual(resp.headers['X-Request-ID'], request_id)
+
+        record, = read_records()
+        self.assertEqual(record['request_id'], request_id)
+        self.assertEqual(record['method'], 'POST')
+        self.assertEqual(record['route'], '/items/{item_id}')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['request_size'], len(b'{"name": "item"}'))
+        self.assertEqual(record['response_size'], len(resp.body))
+        self.assertGreater(record['duration'], 0)
+        self.assertEqual(record['remote_ip'], '127.0.0.1')
+
+    def test_request_id_propagation(self):
+        resp = self.post('/items/12', headers={'X-Request-ID': 'abc-123'})
+        self.assertEqual(resp.headers['X-Request-ID'], 'abc-123')
+
+        resp = self.post('/items/12', headers={'X-Request-ID': 'bad id!'})
+        self.assertNotEqual(resp.headers['X-Request-ID'], 'bad id!')
+
+    def test_errors(self):
+        resp = self.get('/not/found', expected_code=404,
+                        headers={'X-Request-ID': 'abc-123'})
+        self.assertEqual(resp.headers['X-Request-ID'], 'abc-123')
+
+        record, = read_records()
+        self.assertEqual(record['route'], '<unmatched>')
+        self.assertEqual(record['status'], 404)
+        self.assertEqual(record['request_id'], 'abc-123')
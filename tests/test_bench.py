@@ -0,0 +1,29 @@
+from tornado.testing import AsyncTestCase, gen_test
+
+from calm.bench import run
+
+
+class BenchTests(AsyncTestCase):
+    @gen_test(timeout=30)
+    async def test_run(self):
+        results = await run(['hello', 'websocket_echo'],
+                            concurrency=2, requests=20)
+
+        self.assertEqual([s['scenario'] for s in results['scenarios']],
+                         ['hello', 'websocket_echo'])
+        for scenario in results['scenarios']:
+            for app in ('calm', 'tornado'):
+                result = scenario[app]
+                self.assertEqual(result['requests'], 20)
+                self.assertEqual(result['statuses'], {'200': 20})
+                self.assertLessEqual(result['latency_ms']['p50'],
+                                     result['latency_ms']['p99'])
+                self.assertEqual(
+                    sorted(result['allocations_per_request']),
+                    ['blocks', 'bytes']
+                )
+
+    @gen_test
+    async def test_unknown_scenario(self):
+        with self.assertRaises(ValueError):
+            await run(['unknown'])
@@ -0,0 +1,111 @@
+import asyncio
+
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+from tornado.websocket import WebSocketHandler
+
+from calm import Application
+from calm.broadcast import BroadcastHub
+from calm.ex import DefinitionError
+from calm.testing import CalmWebSocketTestCase
+
+
+app = Application('testbroadcast', '1')
+
+
+@app.websocket('/feed/{topic}')
+class FeedWebSocket(WebSocketHandler):
+    def open(self, topic):
+        app.broadcast.subscribe(self, topic)
+        self.write_message('subscribed')
+
+
+class SlowConnection(object):
+    """A connection that never flushes its messages."""
+    def __init__(self):
+        self.messages = []
+        self.closed = None
+
+    def write_message(self, message, binary=False):
+        self.messages.append((message, binary))
+        return Future()
+
+    def close(self, code=None, reason=None):
+        self.closed = code
+
+
+class BroadcastHubTests(AsyncTestCase):
+    @gen_test
+    async def test_drop_oldest(self):
+        hub = BroadcastHub(max_queue=2)
+        connection = SlowConnection()
+        hub.subscribe(connection, 'topic')
+
+        hub.publish('topic', '0')
+        await asyncio.sleep(0.01)
+        for number in range(1, 5):
+            self.assertEqual(hub.publish('topic', str(number)), 1)
+
+        # the first message is in flight, the queue keeps the latest ones
+        self.assertEqual(connection.messages, [(b'0', False)])
+        self.assertEqual(hub.dropped, 2)
+        queue = hub._subscribers[connection].queue
+        self.assertEqual([m for m, _ in queue], [b'3', b'4'])
+
+    @gen_test
+    async def test_disconnect(self):
+        hub = BroadcastHub()
+        hub.configure(max_queue=1, overflow='disconnect')
+        slow = SlowConnection()
+        hub.subscribe(slow, 'topic')
+
+        hub.publish('topic', {'n': 1})
+        await asyncio.sleep(0.01)
+        hub.publish('topic', {'n': 2})
+        self.assertEqual(hub.publish('topic', {'n': 3}), 0)
+
+        self.assertEqual(slow.closed, BroadcastHub.OVERFLOW_CLOSE_CODE)
+        self.assertEqual(hub.disconnected, 1)
+        self.assertEqual(hub.subscribers('topic'), 0)
+        self.assertIn('calm_broadcast_disconnected_total 1', hub.collect())
+
+    def test_subscriptions(self):
+        hub = BroadcastHub()
+        connection = SlowConnection()
+        hub.subscribe(connection, 'a')
+        hub.subscribe(connection, 'b')
+
+        hub.unsubscribe(connection, 'a')
+        self.assertEqual(hub.subscribers('a'), 0)
+        self.assertEqual(hub.subscribers('b'), 1)
+
+        hub.unsubscribe(connection)
+        self.assertEqual(hub.publish('b', 'message'), 0)
+        self.assertEqual(hub._subscribers, {})
+
+        self.assertRaises(DefinitionError, hub.configure, 10, 'block')
+
+
+class BroadcastTests(CalmWebSocketTestCase):
+    def get_calm_app(self):
+        return app
+
+    @gen_test
+    async def test_publish(self):
+        first = await self.init_websocket('/feed/news')
+        second = await self.init_websocket('/feed/news')
+        other = await self.init_websocket('/feed/sports')
+        for connection in (first, second, other):
+            self.assertEqual(await connection.read_message(), 'subscribed')
+
+        self.assertEqual(app.broadcast.publish('news', {'title': 'Calm'}), 2)
+        self.assertEqual(await first.read_message(), '{"title": "Calm"}')
+        self.assertEqual(await second.read_message(), '{"title": "Calm"}')
+
+        first.close()
+        second.close()
+        other.close()
+        while app.broadcast.subscribers('news'):
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(app.broadcast.publish('news', 'gone'), 0)
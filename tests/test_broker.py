@@ -0,0 +1,236 @@
+import os
+import sys
+import asyncio
+import tempfile
+import subprocess
+from unittest import TestCase
+from unittest.mock import patch
+
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+
+from calm import Application
+from calm.broadcast import BroadcastHub
+from calm.broker import (Broker, BrokerClient, encode_frame, split_frames,
+                         count_frames, decode_frames, MAX_FRAME_SIZE)
+from calm.ex import DefinitionError
+
+
+class Connection(object):
+    def __init__(self):
+        self.messages = []
+
+    def write_message(self, message, binary=False):
+        self.messages.append((message, binary))
+        future = Future()
+        future.set_result(None)
+        return future
+
+
+class FrameTests(TestCase):
+    def test_frames(self):
+        data = (encode_frame('prices', b'{"EUR": 1.08}') +
+                encode_frame('raw', b'\x00\x01', binary=True))
+
+        self.assertEqual(split_frames(data[:-1]),
+                         len(encode_frame('prices', b'{"EUR": 1.08}')))
+        self.assertEqual(split_frames(data), len(data))
+        self.assertEqual(count_frames(data[:-1]), 1)
+        self.assertEqual(count_frames(data), 2)
+        self.assertEqual(list(decode_frames(data)), [
+            ('prices', b'{"EUR": 1.08}', False),
+            ('raw', b'\x00\x01', True)
+        ])
+
+
+class BrokerTests(AsyncTestCase):
+    def setUp(self):
+        super(BrokerTests, self).setUp()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'broker.sock')
+        self.broker = Broker(self.path)
+        self.broker.start_serving()
+
+    def tearDown(self):
+        self.broker.stop()
+        self.directory.cleanup()
+
+        super(BrokerTests, self).tearDown()
+
+    async def connect(self):
+        hub = BroadcastHub()
+        client = BrokerClient(self.path, hub)
+        await client.connect()
+
+        return hub, client
+
+    async def wait_for(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+
+    @gen_test
+    async def test_cross_process_publish(self):
+        hub1, client1 = await self.connect()
+        hub2, client2 = await self.connect()
+        await self.wait_for(lambda: len(self.broker.streams) == 2)
+
+        local, remote = Connection(), Connection()
+        hub1.subscribe(local, 'prices')
+        hub2.subscribe(remote, 'prices')
+
+        hub1.publish('prices', {'EUR': 1.08})
+        hub1.publish('prices', b'\x00', binary=True)
+        await self.wait_for(lambda: len(remote.messages) == 2)
+
+        expected = [(b'{"EUR": 1.08}', False), (b'\x00', True)]
+        self.assertEqual(local.messages, expected)
+        self.assertEqual(remote.messages, expected)
+
+        # the broker does not send the messages back to the publisher
+        await asyncio.sleep(0.05)
+        self.assertEqual(local.messages, expected)
+
+        client1.close()
+        client2.close()
+        self.assertIsNone(hub1.broker)
+
+    @gen_test
+    async def test_single_write_per_iteration(self):
+        hub, client = await self.connect()
+        writes = []
+        write = client._stream.write
+        client._stream.write = lambda data: writes.append(data) or write(data)
+
+        for number in range(10):
+            hub.publish('prices', number)
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(
+            [message for _, message, _ in decode_frames(writes[0])],
+            [str(number).encode() for number in range(10)]
+        )
+
+        client.close()
+
+    @gen_test
+    async def test_disconnected(self):
+        hub = BroadcastHub()
+        client = BrokerClient(self.path + '.missing', hub)
+        hub.broker = client
+        connection = Connection()
+        hub.subscribe(connection, 'prices')
+
+        self.assertEqual(hub.publish('prices', 1), 1)
+        self.assertEqual(client.dropped, 1)
+
+    @gen_test
+    async def test_stalled_process(self):
+        class StalledStream(object):
+            def __init__(self):
+                self.writes = 0
+
+            def write(self, data):
+                self.writes += 1
+                return Future()
+
+            def close(self):
+                pass
+
+        hub, client = await self.connect()
+        await self.wait_for(lambda: len(self.broker.streams) == 1)
+        self.broker.max_buffer_size = 8
+        stalled = StalledStream()
+        self.broker.streams.add(stalled)
+
+        remote = Connection()
+        hub.subscribe(remote, 'prices')
+        frames = encode_frame('prices', b'1') + encode_frame('prices', b'2')
+        self.broker.relay(None, frames)
+        await self.wait_for(lambda: len(remote.messages) == 2)
+        self.broker.relay(None, frames)
+        await self.wait_for(lambda: len(remote.messages) == 4)
+
+        # the first batch fills the buffer of the stalled process
+        self.assertEqual(len(remote.messages), 4)
+        self.assertEqual(stalled.writes, 1)
+        self.assertEqual(self.broker.dropped, 2)
+
+        client.close()
+
+    @gen_test
+    async def test_oversized_frame(self):
+        hub, client = await self.connect()
+        await self.wait_for(lambda: len(self.broker.streams) == 1)
+
+        client._stream.write((MAX_FRAME_SIZE + 1).to_bytes(4, 'big'))
+        await self.wait_for(lambda: not self.broker.streams)
+        self.assertEqual(self.broker.streams, set())
+
+        client.close()
+
+
+class EmbeddedBrokerTests(AsyncTestCase):
+    def setUp(self):
+        super(EmbeddedBrokerTests, self).setUp()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'broker.sock')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+        super(EmbeddedBrokerTests, self).tearDown()
+
+    @gen_test
+    async def test_first_process_serves(self):
+        hub1, hub2 = BroadcastHub(), BroadcastHub()
+        client1 = BrokerClient(self.path, hub1, reconnect_interval=0.01,
+                               embedded=True)
+        client2 = BrokerClient(self.path, hub2, reconnect_interval=0.01,
+                               embedded=True)
+        await client1.connect()
+        await client2.connect()
+
+        self.assertIsNotNone(client1.embedded_broker)
+        self.assertIsNone(client2.embedded_broker)
+        self.assertFalse(Broker(self.path).start_serving())
+
+        remote = Connection()
+        hub2.subscribe(remote, 'prices')
+        hub1.publish('prices', 1)
+        for _ in range(100):
+            if remote.messages:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(remote.messages, [(b'1', False)])
+
+        # the other process takes over when the broker goes away
+        client1.close()
+        for _ in range(100):
+            if client2.embedded_broker is not None and client2.connected:
+                break
+            await asyncio.sleep(0.01)
+        self.assertIsNotNone(client2.embedded_broker)
+
+        client2.close()
+
+
+class PlatformTests(TestCase):
+    def test_import_without_unix_sockets(self):
+        # the broker module is imported only when the broker is configured
+        script = ("import sys; from calm import Application; "
+                  "Application('app', '1').make_app(); "
+                  "print('calm.broker' in sys.modules)")
+        output = subprocess.check_output([sys.executable, '-c', script])
+        self.assertEqual(output.strip(), b'False')
+
+    def test_broker_without_unix_sockets(self):
+        app = Application('testbroker', '1')
+        app.configure(broker_path='/tmp/calm-broker.sock')
+
+        with patch.dict('sys.modules', {'calm.broker': None}):
+            self.assertRaises(DefinitionError, app.listen, 0, '127.0.0.1')
@@ -1,9 +1,15 @@
-from unittest import TestCase
-from unittest.mock import MagicMock
+from unittest import TestCase, skipIf
+from unittest.mock import MagicMock, patch
 
+from calm import Application
 from calm.codec import ArgumentParser
 from calm.ex import DefinitionError, ArgumentParseError
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class CodecTests(TestCase):
     def test_argument_parser(self):
@@ -30,3 +36,97 @@ class CodecTests(TestCase):
         self.assertTrue(parser.parse(bool, 'yes'))
         self.assertRaises(ArgumentParseError,
                           parser.parse, bool, 'womp')
+
+    def test_array_type(self):
+        parser = ArgumentParser()
+
+        self.assertEqual(parser.parse([int], ['1, 2', '3']), [1, 2, 3])
+        self.assertEqual(parser.parse([int], '4,5'), [4, 5])
+        self.assertEqual(parser.parse([bool], ['yes', 'no']), [True, False])
+        self.assertEqual(parser.parse([str], ['a,b']), ['a', 'b'])
+
+        with self.assertRaisesRegex(ArgumentParseError, 'at index 2'):
+            parser.parse([int], ['1,2', 'x'])
+
+    def test_vectorized_array_without_numpy(self):
+        class VectorizedArgumentParser(ArgumentParser):
+            vectorized_arrays = True
+            VECTORIZE_MIN_SIZE = 2
+
+        parser = VectorizedArgumentParser()
+        self.assertEqual(parser.parse([int], '1'), [1])
+
+        with patch.dict('sys.modules', {'numpy': None}):
+            self.assertRaises(DefinitionError, parser.parse, [int], '1,2')
+
+    @skipIf(numpy is None, "NumPy is not installed")
+    def test_vectorized_array(self):
+        class VectorizedArgumentParser(ArgumentParser):
+            vectorized_arrays = True
+            VECTORIZE_MIN_SIZE = 2
+
+        parser = VectorizedArgumentParser()
+        parsed = parser.parse([int], ['1,2', '3'])
+        self.assertIsInstance(parsed, numpy.ndarray)
+        self.assertEqual(parsed.tolist(), [1, 2, 3])
+
+        with self.assertRaisesRegex(ArgumentParseError, 'at index 1'):
+            parser.parse([int], '1,x,3')
+
+        # the items NumPy does not parse still give an ndarray
+        parsed = parser.parse([int], '1_000,2')
+        self.assertIsInstance(parsed, numpy.ndarray)
+        self.assertEqual(parsed.tolist(), [1000, 2])
+
+        with self.assertRaisesRegex(ArgumentParseError, 'at index 1'):
+            parser.parse([int], '1,{}'.format(2 ** 64))
+
+    @skipIf(numpy is None, "NumPy is not installed")
+    def test_vectorized_float_array(self):
+        class VectorizedArgumentParser(ArgumentParser):
+            vectorized_arrays = True
+            VECTORIZE_MIN_SIZE = 2
+
+        parser = VectorizedArgumentParser()
+        parsed = parser.parse([float], ['1.5,2', '-3e2'])
+        self.assertIsInstance(parsed, numpy.ndarray)
+        self.assertEqual(parsed.dtype, numpy.float64)
+        self.assertEqual(parsed.tolist(), [1.5, 2.0, -300.0])
+
+        with self.assertRaisesRegex(ArgumentParseError, 'at index 2'):
+            parser.parse([float], '1,2,x')
+
+    def test_resolve(self):
+        parser = ArgumentParser()
+
+        self.assertEqual(parser.resolve(int)('12'), 12)
+        self.assertEqual(parser.resolve(float)('1.5'), 1.5)
+        self.assertEqual(parser.resolve(str)(' x '), ' x ')
+        self.assertEqual(parser.resolve([int])(['1,2']), [1, 2])
+        self.assertRaises(DefinitionError, parser.resolve, tuple)
+        self.assertRaises(DefinitionError, parser.resolve, [tuple])
+
+    def test_memoized_types(self):
+        custom_type = MagicMock()
+        custom_type.parse.side_effect = lambda value: value.upper()
+
+        class MemoizingArgumentParser(ArgumentParser):
+            memoized_types = (custom_type,)
+            MEMO_SIZE = 2
+
+        parse = MemoizingArgumentParser().resolve(custom_type)
+        self.assertEqual([parse(v) for v in 'aaba'], ['A', 'A', 'B', 'A'])
+        self.assertEqual(custom_type.parse.call_count, 2)
+
+    def test_definition_error_at_startup(self):
+        class ItemId(str):
+            pass
+
+        app = Application('testcodec', '1')
+
+        @app.get('/items/{item_id}')
+        async def get_item(request, item_id: ItemId):
+            pass
+
+        with self.assertRaisesRegex(DefinitionError, "'item_id'"):
+            app.make_app()
@@ -0,0 +1,119 @@
+import asyncio
+
+from tornado.testing import AsyncTestCase, gen_test
+from tornado.websocket import WebSocketHandler, websocket_connect
+from tornado.httpclient import HTTPClientError
+
+from calm import Application
+from calm.connections import TimerWheel, ConnectionManager
+from calm.testing import CalmWebSocketTestCase
+
+
+app = Application('testconnections', '1')
+app.configure(websocket_max_connections=2,
+              websocket_idle_timeout=0.2,
+              websocket_timer_tick=0.02)
+
+
+@app.websocket('/echo')
+class EchoWebSocket(WebSocketHandler):
+    def on_message(self, message):
+        self.write_message(message)
+
+
+class Connection(object):
+    def __init__(self):
+        self.pings = 0
+        self.closed = None
+
+    def ping(self):
+        self.pings += 1
+
+    def close(self, code=None, reason=None):
+        self.closed = code
+
+
+class TimerWheelTests(AsyncTestCase):
+    @gen_test
+    async def test_schedule(self):
+        wheel = TimerWheel(tick=0.01, slots=4)
+        fired = []
+        wheel.schedule(0.01, lambda: fired.append('first'))
+        wheel.schedule(0.07, lambda: fired.append('second'))
+        wheel.schedule(0.02, lambda: fired.append('cancelled')).cancel()
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(fired, ['first'])
+        await asyncio.sleep(0.1)
+        self.assertEqual(fired, ['first', 'second'])
+
+        # the periodic callback stops with the last timer
+        self.assertEqual(len(wheel), 0)
+        self.assertIsNone(wheel._periodic)
+
+
+class ConnectionManagerTests(AsyncTestCase):
+    @gen_test
+    async def test_ping_timeout(self):
+        manager = ConnectionManager(ping_interval=0.05, tick=0.01)
+        answering, silent = Connection(), Connection()
+        manager.opened(answering, '/ws')
+        manager.opened(silent, '/ws')
+
+        for _ in range(3):
+            await asyncio.sleep(0.06)
+            manager.pong_received(answering)
+
+        self.assertIsNone(answering.closed)
+        self.assertGreaterEqual(answering.pings, 2)
+        self.assertEqual(silent.closed, manager.UNRESPONSIVE_CLOSE_CODE)
+        self.assertEqual(silent.pings, 1)
+        self.assertEqual(manager.stats('/ws').evicted, 1)
+
+        manager.closed(answering)
+        self.assertEqual(len(manager), 0)
+
+    @gen_test
+    async def test_max_lifetime(self):
+        manager = ConnectionManager(max_lifetime=0.03, tick=0.01)
+        connection = Connection()
+        manager.opened(connection, '/ws')
+
+        await asyncio.sleep(0.06)
+        self.assertEqual(connection.closed, manager.LIFETIME_CLOSE_CODE)
+
+
+class ConnectionTests(CalmWebSocketTestCase):
+    def get_calm_app(self):
+        return app
+
+    @gen_test
+    async def test_lifecycle(self):
+        first = await self.init_websocket('/echo')
+        second = await self.init_websocket('/echo')
+
+        with self.assertRaises(HTTPClientError) as context:
+            await websocket_connect(self.get_url('/echo'))
+        self.assertEqual(context.exception.code, 503)
+
+        first.write_message('h\u00e9llo')
+        self.assertEqual(await first.read_message(), 'h\u00e9llo')
+
+        metrics = app.connections.collect()
+        self.assertIn('calm_websocket_connections{route="/echo"} 2', metrics)
+        self.assertIn(
+            'calm_websocket_messages_received_total{route="/echo"} 1', metrics
+        )
+        self.assertIn(
+            'calm_websocket_sent_bytes_total{route="/echo"} 6', metrics
+        )
+        self.assertIn('calm_websocket_rejected_total{route="/echo"} 1',
+                      metrics)
+
+        # the idle connections are closed by the server
+        self.assertIsNone(await second.read_message())
+        self.assertEqual(second.close_code,
+                         ConnectionManager.IDLE_CLOSE_CODE)
+        first.close()
+        while len(app.connections):
+            await asyncio.sleep(0.01)
@@ -2,7 +2,7 @@ from unittest.mock import patch
 
 from tornado.web import RequestHandler
 
-from calm.testing import CalmHTTPTestCase
+from calm.testing import CalmInProcessTestCase, CalmHTTPTestCase
 from calm import Application
 from calm.ex import DefinitionError, MethodNotAllowedError, NotFoundError
 from calm.resource import Resource, Integer, String
@@ -66,6 +66,11 @@ def argument_types(request, arg1, arg2: int):
     return arg1, arg2
 
 
+@app.get('/arrays')
+def array_arguments(request, ids: [int], tags: [str] = None):
+    return ids, tags
+
+
 @app.post('/json/body')
 def json_body(request):
     return request.body
@@ -95,7 +100,7 @@ def input_output_validation(self, bad: bool = False):
     }
 
 
-class CoreTests(CalmHTTPTestCase):
+class CoreTests(CalmInProcessTestCase):
     def get_calm_app(self):
         global app
         return app
@@ -218,6 +223,23 @@ class CoreTests(CalmHTTPTestCase):
                  query_args=args,
                  expected_code=400)
 
+    def test_array_arguments(self):
+        self.get('/arrays?ids=1,2&ids=3&tags=a,b',
+                 expected_code=200,
+                 expected_json_body=[[1, 2, 3], ['a', 'b']])
+
+        self.get('/arrays?ids=4',
+                 expected_code=200,
+                 expected_json_body=[[4], None])
+
+        self.get('/arrays?ids=1,two',
+                 expected_code=400,
+                 expected_json_body={
+                     'error': "Bad value for integer: two (at index 1)"
+                 })
+
+        self.get('/arrays', expected_code=400)
+
     def test_json_body(self):
         expected = {
             'list': [
@@ -240,7 +262,7 @@ class CoreTests(CalmHTTPTestCase):
 
     def test_configure(self):
         app = self.get_calm_app()
-        old_config = app.config
+        old_config = dict(app.config)
         app.configure(
             error_key='pardon'
         )
@@ -282,3 +304,12 @@ class CoreTests(CalmHTTPTestCase):
                   query_args={'bad': 'true'},
                   json_body=good_data,
                   expected_code=200)
+
+
+class CoreHTTPSmokeTests(CalmHTTPTestCase):
+    """A few of the core tests over a real HTTP connection."""
+    get_calm_app = CoreTests.get_calm_app
+    test_sync_async = CoreTests.test_sync_async
+    test_method_not_allowed = CoreTests.test_method_not_allowed
+    test_argument_types = CoreTests.test_argument_types
+    test_json_body = CoreTests.test_json_body
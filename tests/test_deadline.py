@@ -0,0 +1,111 @@
+import asyncio
+
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+from calm.decorator import timeout
+from calm.ex import DefinitionError, GatewayTimeoutError
+
+
+app = Application('testdeadline', '1')
+cancelled = []
+
+
+@app.get('/stuck')
+@timeout(0.05)
+async def stuck(request):
+    try:
+        await asyncio.sleep(5)
+    except asyncio.CancelledError:
+        cancelled.append(True)
+        raise
+
+
+@app.get('/budget')
+@timeout(10)
+async def budget(request):
+    return request.deadline.remaining()
+
+
+@app.get('/bounded')
+@timeout(5)
+async def bounded(request, delay: float = 0.2):
+    await asyncio.sleep(delay)
+    return request.deadline.remaining() <= 0.5
+
+
+@app.get('/slow')
+async def slow(request, delay: float = 0.2):
+    await asyncio.sleep(delay)
+    return request.deadline is not None
+
+
+class DeadlineTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        global app
+        return app
+
+    def test_handler_timeout(self):
+        self.get('/stuck',
+                 expected_code=504,
+                 expected_json_body={
+                     app.config['error_key']: GatewayTimeoutError.message
+                 })
+        self.io_loop.run_sync(lambda: asyncio.sleep(0))
+        self.assertEqual(cancelled, [True])
+
+    def test_remaining_budget(self):
+        resp = self.get('/budget')
+        remaining = float(resp.body)
+        self.assertGreater(remaining, 9)
+        self.assertLessEqual(remaining, 10)
+
+        resp = self.get('/budget', headers={'X-Request-Timeout': '3'})
+        self.assertLessEqual(float(resp.body), 3)
+
+    def test_timeout_header(self):
+        self.get('/bounded', expected_code=200, expected_json_body=False)
+        self.get('/bounded',
+                 headers={'X-Request-Timeout': '0.01'},
+                 expected_code=504)
+        self.get('/bounded',
+                 headers={'X-Request-Timeout': '0.5'},
+                 expected_code=200,
+                 expected_json_body=True)
+
+        # the header cannot extend the deadline of the route
+        self.get('/bounded',
+                 query_args={'delay': 0},
+                 headers={'X-Request-Timeout': '60'},
+                 expected_code=200,
+                 expected_json_body=False)
+
+        # the malformed values are ignored
+        for value in ('0', '-1', 'soon', 'inf'):
+            self.get('/bounded',
+                     query_args={'delay': 0},
+                     headers={'X-Request-Timeout': value},
+                     expected_code=200,
+                     expected_json_body=False)
+
+        # the routes without a deadline ignore the header
+        self.get('/slow',
+                 headers={'X-Request-Timeout': '0.01'},
+                 expected_code=200,
+                 expected_json_body=False)
+
+    def test_default_timeout(self):
+        app.configure(default_timeout=0.01)
+        try:
+            self.get('/slow', expected_code=504)
+        finally:
+            app.configure(default_timeout=None)
+
+    def test_timeout_decorator(self):
+        self.assertRaises(DefinitionError, timeout, 0)
+        self.assertRaises(DefinitionError, timeout, '1')
+
+        def func():
+            pass
+
+        timeout(1.5)(func)
+        self.assertEqual(func.timeout, 1.5)
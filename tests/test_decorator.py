@@ -1,4 +1,4 @@
-from calm.testing import CalmHTTPTestCase
+from calm.testing import CalmInProcessTestCase
 
 from calm import Application
 from calm.decorator import produces, consumes, fails
@@ -31,7 +31,7 @@ def reverse_order_handler(request):
     pass
 
 
-class DecoratorTests(CalmHTTPTestCase):
+class DecoratorTests(CalmInProcessTestCase):
     def get_calm_app(self):
         global app
         return app
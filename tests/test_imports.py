@@ -0,0 +1,38 @@
+import sys
+import subprocess
+from unittest import TestCase
+
+import calm
+from calm.bench.imports import measure_import
+
+
+class LazyImportTests(TestCase):
+    def test_lightweight_imports(self):
+        for statement in ('import calm',
+                          'import calm.ex',
+                          'from calm import ArgumentParser'):
+            result = measure_import(statement, runs=1)
+            self.assertEqual(result['heavy_modules'], [], statement)
+
+    def test_application_import(self):
+        result = measure_import('from calm import Application', runs=1)
+        self.assertIn('tornado.web', result['heavy_modules'])
+
+    def test_lazy_diagnostics(self):
+        # the diagnostic tools are imported only when they are configured
+        modules = ['calm.profiling', 'calm.watchdog', 'calm.memory',
+                   'calm.routecache', 'calm.broker', 'cProfile',
+                   'tracemalloc']
+        script = ("import sys; from calm import Application; "
+                  "Application('app', '1').make_app(); "
+                  "print([m for m in {!r} if m in sys.modules])"
+                  .format(modules))
+        output = subprocess.check_output([sys.executable, '-c', script])
+        self.assertEqual(output.strip(), b'[]')
+
+    def test_attributes(self):
+        from calm.core import CalmApp
+        self.assertIs(calm.Application, CalmApp)
+        self.assertIn('Application', dir(calm))
+        with self.assertRaises(AttributeError):
+            calm.NoSuchAttribute  # pylint: disable=W0104
@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+from tornado.testing import AsyncTestCase, gen_test
+
+from calm import Application
+from calm.decorator import fails
+from calm.ex import NotFoundError
+
+
+class LazySwaggerTests(AsyncTestCase):
+    def make_app(self):
+        app = Application('testlazy', '1')
+
+        @fails(NotFoundError)
+        @app.get('/items/{item_id}')
+        async def get_item(request, item_id: int):
+            """Returns the item."""
+            pass
+
+        return app, get_item.handler_def
+
+    def test_deferred_generation(self):
+        with patch('calm.handler.parse_docstring',
+                   return_value=('', '')) as parse_docstring:
+            app, handler_def = self.make_app()
+            app.make_app()
+
+            parse_docstring.assert_not_called()
+            self.assertIsNone(app._swagger_json)
+
+            swagger_json = app.swagger_json
+            parse_docstring.assert_called_once_with('Returns the item.')
+            self.assertIs(app.swagger_json, swagger_json)
+
+        # the decorators applied after the route definition are included
+        self.assertIn('404', handler_def.operation_definition['responses'])
+
+    @gen_test
+    async def test_warm_up(self):
+        app, handler_def = self.make_app()
+        app.make_app()
+
+        await app.warm_up()
+
+        self.assertIsNotNone(handler_def._operation_definition)
+        self.assertIsNotNone(app._swagger_json)
@@ -0,0 +1,118 @@
+import asyncio
+
+from tornado.tcpclient import TCPClient
+from tornado.testing import gen_test, bind_unused_port
+from tornado.websocket import WebSocketHandler, websocket_connect
+
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+
+
+def make_app():
+    app = Application('testlifecycle', '1')
+    app.configure(health_url='/health')
+    app.release = asyncio.Event()
+    app.cleaned_up = []
+
+    @app.get('/slow')
+    async def slow(request):
+        await app.release.wait()
+        return 'done'
+
+    @app.websocket('/ws')
+    class EchoWebSocket(WebSocketHandler):
+        def on_message(self, message):
+            self.write_message(message)
+
+    @app.on_shutdown
+    async def async_cleanup():
+        app.cleaned_up.append('async')
+
+    @app.on_shutdown
+    def sync_cleanup():
+        app.cleaned_up.append('sync')
+
+    return app
+
+
+class LifecycleTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        self.calm_app = make_app()
+        return self.calm_app
+
+    def ws_url(self, path):
+        return self.get_url(path).replace('http', 'ws', 1)
+
+    @gen_test
+    async def test_graceful_shutdown(self):
+        app = self.calm_app
+        resp = await self.http_client.fetch(self.get_url('/health'))
+        self.assertEqual(resp.code, 200)
+
+        websocket = await websocket_connect(self.ws_url('/ws'))
+        websocket.write_message('ping')
+        self.assertEqual(await websocket.read_message(), 'ping')
+
+        slow_request = self.http_client.fetch(self.get_url('/slow'))
+        while not app.lifecycle.in_flight:
+            await asyncio.sleep(0.01)
+
+        shutdown = asyncio.ensure_future(app.shutdown(grace_period=5))
+        await asyncio.sleep(0.05)
+        self.assertTrue(app.draining)
+        self.assertFalse(shutdown.done())
+
+        resp = await self.http_client.fetch(self.get_url('/health'),
+                                            raise_error=False)
+        self.assertEqual(resp.code, 503)
+
+        app.release.set()
+        resp = await slow_request
+        self.assertEqual(resp.body, b'"done"')
+
+        self.assertIsNone(await websocket.read_message())
+        self.assertEqual(websocket.close_code, 1001)
+
+        await shutdown
+        self.assertEqual(app.cleaned_up, ['async', 'sync'])
+        self.assertEqual(app.lifecycle.in_flight, 0)
+        self.assertEqual(app.lifecycle.websockets, set())
+
+    @gen_test
+    async def test_grace_period(self):
+        app = self.calm_app
+        slow_request = self.http_client.fetch(self.get_url('/slow'))
+        while not app.lifecycle.in_flight:
+            await asyncio.sleep(0.01)
+
+        await app.shutdown(grace_period=0.05)
+        self.assertEqual(app.lifecycle.in_flight, 1)
+        self.assertEqual(app.cleaned_up, ['async', 'sync'])
+
+        app.release.set()
+        await slow_request
+
+    @gen_test
+    async def test_draining_websocket(self):
+        app = self.calm_app
+        await app.shutdown(grace_period=0)
+
+        with self.assertRaises(Exception):
+            await websocket_connect(self.ws_url('/ws'))
+
+    @gen_test
+    async def test_idle_connections_closed(self):
+        app = self.calm_app
+        port = bind_unused_port()
+        port[0].close()
+        app.listen(port[1], '127.0.0.1')
+
+        stream = await TCPClient().connect('127.0.0.1', port[1])
+        stream.write(b'GET /health HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        headers = await stream.read_until(b'\r\n\r\n')
+        self.assertTrue(headers.startswith(b'HTTP/1.1 200'))
+
+        # the keep-alive connection is idle, and closed by the server
+        await app.shutdown(grace_period=1)
+        await stream.read_until_close()
+        self.assertTrue(stream.closed())
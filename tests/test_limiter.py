@@ -0,0 +1,114 @@
+from unittest import TestCase
+
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+from calm.limiter import AdaptiveLimiter
+from calm.ex import ServiceUnavailableError
+
+
+app = Application('testlimiter', '1')
+limiter = AdaptiveLimiter(initial_limit=1)
+app.configure(concurrency_limiter=limiter)
+
+
+@app.get('/limited')
+async def limited(request):
+    return 'ok'
+
+
+class CodedError(Exception):
+    code = 418
+
+
+@app.get('/coded')
+async def coded(request):
+    raise CodedError()
+
+
+class AdaptiveLimiterTests(TestCase):
+    def test_shedding(self):
+        limiter = AdaptiveLimiter(initial_limit=2)
+
+        first = limiter.acquire('/uri')
+        second = limiter.acquire('/uri')
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(limiter.acquire('/uri'))
+        self.assertIsNotNone(limiter.acquire('/other'))
+
+        state = limiter.snapshot()['/uri']
+        self.assertEqual(state['in_flight'], 2)
+        self.assertEqual(state['accepted'], 2)
+        self.assertEqual(state['rejected'], 1)
+
+    def test_additive_increase(self):
+        limiter = AdaptiveLimiter(initial_limit=2)
+
+        limiter.acquire('/uri')
+        for _ in range(20):
+            with limiter.acquire('/uri'):
+                pass
+
+        self.assertGreater(limiter.snapshot()['/uri']['limit'], 2)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveLimiter(initial_limit=100, latency_floor=0.01)
+        limiter.release(limiter.acquire('/uri')._route, 0.01)
+
+        for _ in range(5):
+            limiter.release(limiter.acquire('/uri')._route, 1.0)
+
+        self.assertLess(limiter.snapshot()['/uri']['limit'], 100 * 0.9 ** 4)
+
+    def test_server_error_drop(self):
+        limiter = AdaptiveLimiter(initial_limit=10)
+
+        with self.assertRaises(ValueError):
+            with limiter.acquire('/uri'):
+                raise ValueError()
+
+        state = limiter.snapshot()['/uri']
+        self.assertEqual(state['dropped'], 1)
+        self.assertEqual(state['in_flight'], 0)
+        self.assertEqual(state['limit'], 9)
+
+    def test_min_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=2, min_limit=1)
+
+        for _ in range(10):
+            try:
+                with limiter.acquire('/uri'):
+                    raise ValueError()
+            except ValueError:
+                pass
+
+        self.assertEqual(limiter.snapshot()['/uri']['limit'], 1)
+
+
+class LimiterIntegrationTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        global app
+        return app
+
+    def test_shed_request(self):
+        self.get('/limited', expected_json_body='ok')
+
+        limit = limiter.snapshot()['/limited']['limit']
+        permits = [limiter.acquire('/limited') for _ in range(limit)]
+        try:
+            self.get('/limited',
+                     expected_code=503,
+                     expected_json_body={
+                         app.config['error_key']:
+                             ServiceUnavailableError.message
+                     })
+        finally:
+            for permit in permits:
+                with permit:
+                    pass
+
+        self.get('/limited', expected_json_body='ok')
+
+    def test_coded_foreign_error(self):
+        # only the Calm errors define the status of the response
+        self.get('/coded', expected_code=500)
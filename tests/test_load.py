@@ -0,0 +1,62 @@
+import asyncio
+
+from calm.testing import CalmHTTPTestCase, percentile
+from calm import Application
+
+
+app = Application('testload', '1')
+
+
+@app.get('/items/{item_id}')
+async def get_item(request, item_id: int):
+    await asyncio.sleep(0.01)
+    if item_id % 2:
+        raise ValueError()
+
+    return item_id
+
+
+@app.post('/items')
+async def create_item(request):
+    return request.body
+
+
+class LoadTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        global app
+        return app
+
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(percentile(list(range(100)), 50), 50)
+        self.assertEqual(percentile(list(range(100)), 99), 99)
+        self.assertEqual(percentile([1], 99), 1)
+
+    def test_load_count(self):
+        result = self.load('/items/2', concurrency=16, requests=100)
+
+        self.assertEqual(result['requests'], 100)
+        self.assertEqual(result['statuses'], {'200': 100})
+        self.assertGreater(result['rps'], 0)
+        latency = result['latency_ms']
+        self.assertGreaterEqual(latency['p50'], 10)
+        self.assertLessEqual(latency['p50'], latency['p99'])
+        self.assertLessEqual(latency['p99'], latency['max'])
+
+    def test_load_duration(self):
+        result = self.load('/items', method='POST',
+                           json_body={'name': 'item'},
+                           concurrency=4, duration=0.2)
+
+        self.assertGreater(result['requests'], 0)
+        self.assertGreaterEqual(result['duration'], 0.2)
+        self.assertEqual(set(result['statuses']), {'200'})
+
+    def test_status_distribution(self):
+        with self.assertLogs('tornado', 'ERROR'):
+            result = self.load('/items/1', concurrency=2, requests=4)
+
+        self.assertEqual(result['statuses'], {'500': 4})
+
+    def test_arguments_required(self):
+        self.assertRaises(ValueError, self.load, '/items/2')
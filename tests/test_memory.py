@@ -0,0 +1,83 @@
+import json
+import tracemalloc
+from unittest import TestCase
+
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+from calm.memory import MemoryProfiler
+
+
+TOKEN = 'secret'
+app = Application('testmemory', '1')
+app.configure(memory_sample_rate=1.0,
+              debug_url='/_calm',
+              debug_token=TOKEN)
+
+LEAK = []
+
+
+def leak_memory():
+    LEAK.append(bytearray(100000))
+
+
+@app.get('/leaky')
+async def leaky(request):
+    leak_memory()
+
+
+@app.get('/clean')
+async def clean(request):
+    bytearray(100000)
+
+
+class MemoryProfilerTests(TestCase):
+    def test_not_sampled(self):
+        profiler = MemoryProfiler(sample_rate=0)
+        self.assertIsNone(profiler.request_started(leaky.handler_def))
+
+    def test_external_tracing(self):
+        profiler = MemoryProfiler(sample_rate=1)
+        tracemalloc.start()
+        try:
+            self.assertIsNone(profiler.request_started(leaky.handler_def))
+        finally:
+            tracemalloc.stop()
+
+
+class MemoryAccountingTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        global app
+        return app
+
+    def test_accounting(self):
+        for _ in range(3):
+            self.get('/leaky')
+            self.get('/clean')
+
+        self.assertFalse(tracemalloc.is_tracing())
+
+        report = app.memory_profiler.report(top=1)
+        leaky_report = report['/leaky']
+        self.assertEqual(leaky_report['requests'], 3)
+        self.assertEqual(leaky_report['handler'], 'tests.test_memory.leaky')
+        self.assertGreaterEqual(leaky_report['retained_bytes']['mean'],
+                                100000)
+        self.assertGreaterEqual(leaky_report['peak_bytes']['max'], 100000)
+        top, = leaky_report['top_retained']
+        self.assertIn('test_memory.py', top['traceback'][0])
+        self.assertGreaterEqual(top['size'], 300000)
+
+        clean_report = report['/clean']
+        self.assertGreaterEqual(clean_report['peak_bytes']['max'], 100000)
+        self.assertLess(clean_report['retained_bytes']['mean'], 100000)
+
+    def test_endpoint(self):
+        self.get('/leaky')
+
+        resp = self.get('/_calm/memory?route=/leaky&top=2',
+                        headers={'X-Calm-Debug-Token': TOKEN})
+        report = json.loads(resp.body.decode('utf-8'))
+        self.assertEqual(list(report), ['/leaky'])
+        self.assertLessEqual(len(report['/leaky']['top_retained']), 2)
+
+        self.get('/_calm/memory', expected_code=404)
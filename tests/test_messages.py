@@ -0,0 +1,155 @@
+import gc
+import sys
+import json
+from unittest import TestCase
+
+from tornado.testing import gen_test
+
+from calm import Application
+from calm.decorator import consumes, produces
+from calm.ex import NotFoundError
+from calm.messages import MessageWebSocket, handles
+from calm.resource import Resource, Integer, String, field_storage
+from calm.testing import CalmWebSocketTestCase
+
+
+app = Application('testmessages', '1')
+
+
+class JoinRequest(Resource):
+    room = String()
+
+
+class Room(Resource):
+    room = String()
+    members = Integer()
+
+
+@app.websocket('/chat')
+class ChatWebSocket(MessageWebSocket):
+    @handles('join')
+    @consumes(JoinRequest)
+    @produces(Room)
+    async def join(self, request):
+        if request.room == 'missing':
+            raise NotFoundError()
+
+        room = Room()
+        room.room = request.room
+        room.members = 1
+        return room
+
+    @handles('ping')
+    def ping(self, data):
+        return data
+
+    @handles('join_all', batch=True)
+    @consumes(JoinRequest)
+    def join_all(self, requests):
+        return [request.room for request in requests]
+
+
+@app.websocket('/batched')
+class BatchedWebSocket(ChatWebSocket):
+    batch_interval = 0.1
+    send_interval = 0.01
+
+
+class MessageWebSocketTests(CalmWebSocketTestCase):
+    def get_calm_app(self):
+        return app
+
+    async def exchange(self, websocket, message):
+        websocket.write_message(json.dumps(message))
+        return json.loads(await websocket.read_message())
+
+    @gen_test
+    async def test_routing(self):
+        websocket = await self.init_websocket('/chat')
+
+        self.assertEqual(
+            await self.exchange(websocket, {'type': 'join',
+                                            'data': {'room': 'lobby'}}),
+            {'type': 'join', 'data': {'room': 'lobby', 'members': 1}}
+        )
+        self.assertEqual(
+            await self.exchange(websocket, {'type': 'ping', 'data': 1}),
+            {'type': 'ping', 'data': 1}
+        )
+        self.assertEqual(
+            await self.exchange(websocket, {'type': 'join',
+                                            'data': {'room': 5}}),
+            {'type': 'error', 'data': 'Bad data structure.'}
+        )
+        self.assertEqual(
+            await self.exchange(websocket, {'type': 'join',
+                                            'data': {'room': 'missing'}}),
+            {'type': 'error', 'data': NotFoundError.message}
+        )
+        self.assertEqual(
+            await self.exchange(websocket, {'type': 'leave'}),
+            {'type': 'error', 'data': 'Unknown message type.'}
+        )
+
+        websocket.write_message('not json')
+        self.assertEqual(json.loads(await websocket.read_message())['type'],
+                         'error')
+
+    @gen_test
+    async def test_inbound_batching(self):
+        websocket = await self.init_websocket('/batched')
+
+        websocket.write_message(json.dumps([
+            {'type': 'join_all', 'data': {'room': 'a'}},
+            {'type': 'join_all', 'data': {'room': 3}}
+        ]))
+        websocket.write_message(json.dumps(
+            {'type': 'join_all', 'data': {'room': 'b'}}
+        ))
+
+        # the invalid message is rejected before it is batched
+        self.assertEqual(json.loads(await websocket.read_message()),
+                         [{'type': 'error', 'data': 'Bad data structure.'}])
+        self.assertEqual(json.loads(await websocket.read_message()),
+                         [{'type': 'join_all', 'data': ['a', 'b']}])
+
+    @gen_test
+    async def test_outbound_batching(self):
+        websocket = await self.init_websocket('/batched')
+
+        batch = await self.exchange(websocket, [
+            {'type': 'ping', 'data': 1},
+            {'type': 'ping', 'data': 2}
+        ])
+        self.assertEqual(batch, [{'type': 'ping', 'data': 1},
+                                 {'type': 'ping', 'data': 2}])
+
+
+class ResourceValidatorTests(TestCase):
+    def test_compiled_once(self):
+        self.assertIs(Room.validator(), Room.validator())
+        self.assertIsNot(Room.validator(), JoinRequest.validator())
+
+    def test_field_storage(self):
+        # guards the reliance of `field_storage` on the `untt` internals
+        field = vars(Room)['room']
+        storage = field_storage(field)
+        self.assertIs(field_storage(field), storage)
+
+        room = Room()
+        room.room = 'lobby'
+        self.assertEqual(storage[room], 'lobby')
+
+        room = Room.from_json({'room': 'hall', 'members': 2})
+        self.assertEqual((room.room, room.members), ('hall', 2))
+        self.assertEqual(room.to_json(), {'room': 'hall', 'members': 2})
+
+    def test_objects_are_freed(self):
+        JoinRequest.from_json({'room': 'lobby'})
+        gc.collect()
+        before = sys.getallocatedblocks()
+        for _ in range(100):
+            JoinRequest.from_json({'room': 'lobby'})
+        gc.collect()
+
+        self.assertLess(sys.getallocatedblocks() - before, 50)
@@ -0,0 +1,87 @@
+from unittest import TestCase
+
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+from calm.metrics import Histogram, Metrics
+
+
+app = Application('testmetrics', '1')
+app.configure(metrics_url='/metrics')
+
+
+@app.get('/items/{item_id}')
+async def get_item(request, item_id):
+    return item_id
+
+
+@app.post('/items')
+async def broken(request):
+    raise ValueError()
+
+
+class MetricsTests(TestCase):
+    def test_histogram(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 5.65)
+        self.assertEqual(histogram.cumulative_counts(),
+                         [(0.1, 2), (1.0, 3), (float('inf'), 4)])
+
+    def test_render(self):
+        metrics = Metrics(buckets=(0.5,))
+        metrics.request_started('/a/{b}')
+        metrics.request_started('/a/{b}')
+        metrics.request_finished('/a/{b}', 'GET', 200, 0.25)
+        metrics.request_started('/"quoted"')
+        metrics.request_finished('/"quoted"', 'POST', 500, 1)
+
+        lines = metrics.render().splitlines()
+
+        self.assertIn('# TYPE calm_request_duration_seconds histogram', lines)
+        self.assertIn('calm_request_duration_seconds_bucket{route="/a/{b}",'
+                      'method="GET",status="200",le="0.5"} 1', lines)
+        self.assertIn('calm_request_duration_seconds_bucket{route="/a/{b}",'
+                      'method="GET",status="200",le="+Inf"} 1', lines)
+        self.assertIn('calm_request_duration_seconds_sum{route="/a/{b}",'
+                      'method="GET",status="200"} 0.25', lines)
+        self.assertIn('calm_requests_in_flight{route="/a/{b}"} 1', lines)
+        self.assertIn('calm_request_errors_total{route="/\\"quoted\\"",'
+                      'method="POST",status="500"} 1', lines)
+
+
+class MetricsEndpointTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        global app
+        return app
+
+    def test_metrics_endpoint(self):
+        self.get('/items/1')
+        self.get('/items/2')
+        self.post('/items', expected_code=500)
+        self.put('/items/1', expected_code=405)
+        self.get('/not/found', expected_code=404)
+
+        resp = self.get('/metrics')
+        self.assertTrue(
+            resp.headers['Content-Type'].startswith('text/plain')
+        )
+        lines = resp.body.decode('utf-8').splitlines()
+
+        self.assertIn('calm_request_duration_seconds_count{'
+                      'route="/items/{item_id}",method="GET",status="200"} 2',
+                      lines)
+        self.assertIn('calm_request_duration_seconds_count{'
+                      'route="/items/{item_id}",method="PUT",status="405"} 1',
+                      lines)
+        self.assertIn('calm_request_duration_seconds_count{'
+                      'route="<unmatched>",method="GET",status="404"} 1',
+                      lines)
+        self.assertIn('calm_request_errors_total{'
+                      'route="/items",method="POST",status="500"} 1',
+                      lines)
+        self.assertIn('calm_requests_in_flight{route="/metrics"} 1', lines)
+        self.assertIn('calm_requests_in_flight{route="/items/{item_id}"} 0',
+                      lines)
@@ -0,0 +1,49 @@
+import os
+import json
+import tempfile
+from unittest import TestCase
+
+from calm.bench.micro import measure, compare, format_comparison, main
+
+
+class MicroBenchmarkTests(TestCase):
+    def test_measure(self):
+        results = measure('argument_parser.', min_time=0.001, repeat=1)
+
+        self.assertEqual(set(results), {'argument_parser.parse.int',
+                                        'argument_parser.parse.bool'})
+        for duration in results.values():
+            self.assertGreater(duration, 0)
+
+    def test_compare(self):
+        rows = compare({'a': 120, 'b': 100, 'c': 50},
+                       {'a': 100, 'b': 100}, tolerance=10)
+
+        self.assertEqual(rows, [('a', 100, 120, 20.0, True),
+                                ('b', 100, 100, 0.0, False),
+                                ('c', None, 50, None, False)])
+
+        table = format_comparison(rows).splitlines()
+        self.assertIn('+20.0%  REGRESSION', table[1])
+        self.assertNotIn('REGRESSION', table[2])
+        self.assertIn('new', table[3])
+
+    def test_baseline(self):
+        directory = tempfile.mkdtemp()
+        baseline = os.path.join(directory, 'baseline.json')
+        args = ['--baseline', baseline, '--case', 'param_json_type.basic',
+                '--min-time', '0.001', '--repeat', '1']
+
+        self.assertEqual(main(args), 0)
+        with open(baseline) as baseline_file:
+            recorded = json.load(baseline_file)
+        self.assertEqual(list(recorded), ['param_json_type.basic'])
+
+        recorded['param_json_type.basic'] = 0.001
+        with open(baseline, 'w') as baseline_file:
+            json.dump(recorded, baseline_file)
+        self.assertEqual(main(args), 1)
+
+        self.assertEqual(main(args + ['--update']), 0)
+        os.remove(baseline)
+        os.rmdir(directory)
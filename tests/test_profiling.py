@@ -0,0 +1,109 @@
+import asyncio
+import marshal
+from unittest import TestCase
+
+from tornado.testing import gen_test
+
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+from calm.ex import DefinitionError
+
+
+TOKEN = 'secret'
+app = Application('testprofiling', '1')
+app.configure(debug_url='/_calm', debug_token=TOKEN)
+
+
+def busy_work():
+    return sum(i * i for i in range(1000))
+
+
+@app.get('/work')
+async def work(request):
+    busy_work()
+
+
+@app.get('/other')
+async def other(request):
+    pass
+
+
+class ProfilerConfigTests(TestCase):
+    def test_token_required(self):
+        test_app = Application('testprofiling', '1')
+        test_app.configure(debug_url='/_calm')
+
+        self.assertRaises(DefinitionError, test_app.make_app)
+
+
+class ProfileHandlerTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        global app
+        return app
+
+    async def profile(self, query, requests=()):
+        url = self.get_url('/_calm/profile?' + query)
+        profile = self.http_client.fetch(url,
+                                         headers={'X-Calm-Debug-Token': TOKEN})
+        while app.profiler.session is None:
+            await asyncio.sleep(0.01)
+
+        for path in requests:
+            await self.http_client.fetch(self.get_url(path))
+
+        return await profile
+
+    def test_protection(self):
+        self.get('/_calm/profile', expected_code=404)
+        self.get('/_calm/profile',
+                 headers={'X-Calm-Debug-Token': 'wrong'},
+                 expected_code=404)
+
+    @gen_test
+    async def test_profile_requests(self):
+        resp = await self.profile('mode=requests&count=2',
+                                  ['/work', '/other'])
+
+        body = resp.body.decode('utf-8')
+        self.assertIn('function calls', body)
+        self.assertIn('busy_work', body)
+
+    @gen_test
+    async def test_profile_route(self):
+        resp = await self.profile(
+            'mode=route&count=1&route=/work&format=pstats',
+            ['/other', '/other', '/work']
+        )
+
+        stats = marshal.loads(resp.body)
+        self.assertIn('busy_work', [func for _, _, func in stats])
+
+    @gen_test
+    async def test_profile_timeout(self):
+        resp = await self.profile('mode=requests&count=100&timeout=0.1')
+
+        self.assertEqual(resp.body, b'No requests were profiled.\n')
+        self.assertIsNone(app.profiler.session)
+
+    @gen_test
+    async def test_sample(self):
+        resp = await self.profile('mode=sample&seconds=0.2&interval=0.01')
+
+        lines = resp.body.decode('utf-8').splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertGreater(int(count), 0)
+            self.assertIn(':', stack)
+
+    def test_bad_arguments(self):
+        self.get('/_calm/profile?mode=unknown',
+                 headers={'X-Calm-Debug-Token': TOKEN},
+                 expected_code=400)
+        self.get('/_calm/profile?count=many',
+                 headers={'X-Calm-Debug-Token': TOKEN},
+                 expected_code=400)
+        for count in ('0', '-1'):
+            self.get('/_calm/profile?count=' + count + '&timeout=5',
+                     headers={'X-Calm-Debug-Token': TOKEN},
+                     expected_code=400)
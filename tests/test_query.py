@@ -0,0 +1,75 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from tornado.escape import parse_qs_bytes
+from tornado.httputil import HTTPServerRequest
+from tornado.web import Application as TornadoApplication, RequestHandler
+
+from calm.ex import BadRequestError
+from calm.query import QueryParser
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+
+
+app = Application('testquery', '1')
+
+
+@app.get('/search')
+async def search(request, q, page: int = 1):
+    return [q, page]
+
+
+class QueryTests(TestCase):
+    NAMES = ['q', 'a b']
+
+    def parse(self, query, names=None):
+        return QueryParser(self.NAMES if names is None else names).parse(
+            parse_qs_bytes(query, keep_blank_values=True)
+        )
+
+    def test_tornado_semantics(self):
+        handler = RequestHandler(
+            TornadoApplication(),
+            HTTPServerRequest(uri='/', connection=MagicMock())
+        )
+
+        queries = [
+            'q=1&q=2',
+            'q=+hello+world+&other=%FF',
+            'q=%41%20b&a+b=c&a%20b=d',
+            'q&x=1&&q=',
+            'q=a%01b%09',
+            'q==x',
+            '%71=encoded&qq=1',
+            'q=caf%C3%A9'
+        ]
+        for query in queries:
+            handler.request.query_arguments = parse_qs_bytes(
+                query, keep_blank_values=True
+            )
+            expected = {
+                name: handler.get_query_arguments(name)
+                for name in self.NAMES
+                if handler.get_query_arguments(name)
+            }
+            self.assertEqual(self.parse(query), expected, query)
+
+    def test_only_declared_names(self):
+        self.assertEqual(self.parse('x=%FF&q2=2&q=1', ['q']), {'q': ['1']})
+        self.assertEqual(self.parse('q=1', []), {})
+
+    def test_invalid_unicode(self):
+        self.assertRaises(BadRequestError, self.parse, 'q=%FF', ['q'])
+
+
+class QueryHandlerTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        return app
+
+    def test_query_arguments(self):
+        self.get('/search?q=one&q=+two+&page=3',
+                 expected_code=200,
+                 expected_json_body=['two', 3])
+
+        self.get('/search?q=%FF', expected_code=400)
+        self.get('/search?page=2', expected_code=400)
@@ -0,0 +1,127 @@
+import json
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+from calm.decorator import rate_limit
+from calm.ratelimit import RateLimit, RateLimiter, header_key
+from calm.ex import DefinitionError, TooManyRequestsError
+
+
+app = Application('testratelimit', '1')
+
+
+@app.post('/limited')
+@rate_limit(0.01, burst=2)
+async def limited(request):
+    return 'ok'
+
+
+@app.get('/by_key')
+@rate_limit(0.01, burst=1, key=header_key('X-API-Key'))
+async def by_key(request):
+    return 'ok'
+
+
+@app.get('/unlimited')
+async def unlimited(request):
+    return 'ok'
+
+
+def make_request(remote_ip='127.0.0.1', headers=None):
+    request = MagicMock()
+    request.remote_ip = remote_ip
+    request.headers = headers or {}
+    return request
+
+
+class RateLimiterTests(TestCase):
+    @patch('calm.ratelimit.time.monotonic')
+    def test_token_bucket(self, monotonic):
+        monotonic.return_value = 100
+        limiter = RateLimiter()
+        quota = RateLimit(2, burst=3)
+        request = make_request()
+
+        for _ in range(3):
+            self.assertEqual(limiter.check(quota, None, request), 0)
+        self.assertEqual(limiter.check(quota, None, request), 1)
+
+        monotonic.return_value = 100.5
+        self.assertEqual(limiter.check(quota, None, request), 0)
+        self.assertEqual(limiter.check(quota, None, request), 1)
+
+        self.assertEqual(limiter.check(quota, 'other_scope', request), 0)
+        self.assertEqual(
+            limiter.check(quota, None, make_request('10.0.0.1')), 0
+        )
+
+    @patch('calm.ratelimit.time.monotonic')
+    def test_idle_eviction(self, monotonic):
+        monotonic.return_value = 0
+        limiter = RateLimiter(max_idle=10)
+        quota = RateLimit(1)
+
+        for i in range(3):
+            limiter.check(quota, None, make_request(str(i)))
+        self.assertEqual(len(limiter), 3)
+
+        monotonic.return_value = 5
+        limiter.check(quota, None, make_request('0'))
+
+        monotonic.return_value = 12
+        limiter.check(quota, None, make_request('new'))
+        self.assertEqual(len(limiter), 2)
+
+    def test_max_keys(self):
+        limiter = RateLimiter(max_keys=2)
+        quota = RateLimit(1)
+
+        for i in range(5):
+            limiter.check(quota, None, make_request(str(i)))
+
+        self.assertEqual(len(limiter), 2)
+
+    def test_definition_errors(self):
+        self.assertRaises(DefinitionError, RateLimit, 0)
+        self.assertRaises(DefinitionError, RateLimit, 1, key='ip')
+        self.assertRaises(DefinitionError, rate_limit, -1)
+
+
+class RateLimitIntegrationTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        global app
+        return app
+
+    def test_handler_rate_limit(self):
+        self.post('/limited', expected_json_body='ok')
+        self.post('/limited', expected_json_body='ok')
+
+        resp = self.post('/limited',
+                         body='not even json',
+                         expected_code=429,
+                         expected_json_body={
+                             app.config['error_key']:
+                                 TooManyRequestsError.message
+                         })
+        self.assertGreaterEqual(int(resp.headers['Retry-After']), 1)
+
+        self.get('/unlimited', expected_json_body='ok')
+
+    def test_key_function(self):
+        self.get('/by_key', headers={'X-API-Key': 'first'})
+        self.get('/by_key', headers={'X-API-Key': 'first'},
+                 expected_code=429)
+        self.get('/by_key', headers={'X-API-Key': 'second'})
+
+    def test_app_rate_limit(self):
+        app.configure(rate_limit=RateLimit(0.01, burst=1))
+        try:
+            self.get('/unlimited', expected_json_body='ok')
+            resp = self.get('/unlimited', expected_code=429)
+            self.assertEqual(json.loads(resp.body.decode('utf-8')), {
+                app.config['error_key']: TooManyRequestsError.message
+            })
+        finally:
+            app.configure(rate_limit=None)
@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import shutil
+import importlib
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from untt.field import EntityField
+
+from calm import Application
+from calm.decorator import produces
+from calm.resource import Resource
+from calm.routecache import RouteCache, _calm_source_hashes
+
+
+class RouteCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'routes.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_app(self, uri='/items/{item_id}'):
+        app = Application('testroutecache', '1')
+        app.configure(route_cache=self.path, swagger_warmup=False)
+
+        @app.get(uri)
+        async def get_item(request, item_id: int, full: bool = False):
+            """Returns the item."""
+            pass
+
+        return app
+
+    def test_store_and_load(self):
+        app = self.make_app()
+        app.make_app()
+        self.assertFalse(os.path.exists(self.path))
+
+        swagger_json = app.swagger_json
+        self.assertTrue(os.path.exists(self.path))
+
+        with patch('calm.handler.parse_docstring') as parse_docstring, \
+                patch.object(Application, '_regexify_uri') as regexify_uri:
+            cached_app = self.make_app()
+            cached_app.make_app()
+            regexify_uri.assert_not_called()
+
+            self.assertEqual(cached_app._swagger_json, swagger_json)
+            handler_def = cached_app._route_map['/items/{item_id}']['get']
+            self.assertEqual(
+                handler_def.operation_definition,
+                swagger_json['paths']['/items/{item_id}']['get']
+            )
+            parse_docstring.assert_not_called()
+
+        self.assertEqual(cached_app._route_regexes['/items/{item_id}'],
+                         r'/items/(?P<item_id>[^\/\?]*)/?')
+        self.assertEqual(handler_def.uri_regex,
+                         r'/items/(?P<item_id>[^\/\?]*)/?')
+
+    def test_invalidation(self):
+        app = self.make_app()
+        app.make_app()
+        app.swagger_json  # pylint: disable=W0104
+
+        changed_app = self.make_app('/products/{item_id}')
+        changed_app.make_app()
+        self.assertIsNone(changed_app._swagger_json)
+
+        self.assertIn('/products/{item_id}',
+                      changed_app.swagger_json['paths'])
+        with open(self.path) as cache_file:
+            self.assertEqual(json.load(cache_file)['key'],
+                             RouteCache(self.path, changed_app).key)
+
+    def test_calm_sources(self):
+        names = [name for name, _ in _calm_source_hashes()]
+        for name in ('param.py', 'handler.py', 'core.py', 'routecache.py'):
+            self.assertIn(name, names)
+
+        # a change of Calm itself invalidates the cache, even if its version
+        # is the same
+        app = self.make_app()
+        key = RouteCache(self.path, app).key
+        changed = [[name, 'changed' if name == 'param.py' else digest]
+                   for name, digest in _calm_source_hashes()]
+        with patch('calm.routecache._calm_source_hashes',
+                   return_value=changed):
+            self.assertNotEqual(RouteCache(self.path, app).key, key)
+
+    def test_corrupted(self):
+        with open(self.path, 'w') as cache_file:
+            cache_file.write('{not json')
+
+        app = self.make_app()
+        app.make_app()
+        self.assertIsNone(app._swagger_json)
+        self.assertIn('/items/{item_id}', app.swagger_json['paths'])
+
+    def test_nested_modules(self):
+        module_path = os.path.join(self.directory, 'routecache_types.py')
+        with open(module_path, 'w') as module_file:
+            module_file.write(
+                "from calm.resource import Resource, String\n"
+                "class Tag(Resource):\n"
+                "    name = String()\n"
+                "class Code(str):\n"
+                "    pass\n"
+            )
+        sys.path.insert(0, self.directory)
+        self.addCleanup(sys.path.remove, self.directory)
+        self.addCleanup(sys.modules.pop, 'routecache_types', None)
+        types = importlib.import_module('routecache_types')
+
+        class Item(Resource):
+            tag = EntityField(types.Tag)
+
+        app = Application('testroutecache', '1')
+
+        @app.get('/items/{code}')
+        @produces(Item)
+        async def get_item(request, code: types.Code):
+            pass
+
+        @app.get('/codes/{code}')
+        async def get_code(request, code: types.Code) -> str:
+            pass
+
+        # a change of a nested Resource or of an annotation type, defined in
+        # another module, invalidates the cache
+        key = RouteCache(self.path, app).key
+        with open(module_path, 'a') as module_file:
+            module_file.write("# changed\n")
+        self.assertNotEqual(RouteCache(self.path, app).key, key)
@@ -1,4 +1,4 @@
-from calm.testing import CalmHTTPTestCase
+from calm.testing import CalmInProcessTestCase
 from calm import Application
 
 
@@ -32,7 +32,7 @@ def applevel(request, retparam):
     return retparam
 
 
-class CalmServiceTests(CalmHTTPTestCase):
+class CalmServiceTests(CalmInProcessTestCase):
     def get_calm_app(self):
         global app
         return app
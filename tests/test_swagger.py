@@ -174,7 +174,8 @@ class Swaggertests(CalmHTTPTestCase):
                     'in': 'query',
                     'required': True,
                     'type': 'array',
-                    'items': 'boolean'
+                    'items': 'boolean',
+                    'collectionFormat': 'multi'
                 },
                 {
                     'in': 'body',
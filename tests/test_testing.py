@@ -0,0 +1,73 @@
+from calm import Application
+from calm.ex import NotFoundError
+from calm.testing import (CalmHTTPTestCase, CalmInProcessTestCase,
+                          CalmTestClient)
+
+
+app = Application('testtesting', '1')
+
+
+@app.get('/items/{item_id}')
+async def get_item(request, item_id: int, full: bool = False) -> dict:
+    if item_id > 10:
+        raise NotFoundError()
+
+    return {'id': item_id, 'full': full}
+
+
+budgeted_app = Application('testtestingbudget', '1')
+budgeted_app.configure(latency_budget=5)
+
+
+@budgeted_app.get('/hello')
+async def hello(request) -> str:
+    return 'hello'
+
+
+@app.post('/items')
+async def create_item(request) -> dict:
+    return {'fields': sorted(request.body)}
+
+
+class TestClientTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        return app
+
+    def assertSameResponse(self, url, **kwargs):
+        client = CalmTestClient(app)
+        expected = self.fetch(url, **kwargs)
+        actual = self.io_loop.run_sync(lambda: client.fetch(url, **kwargs))
+
+        self.assertEqual(actual.code, expected.code)
+        self.assertEqual(actual.body, expected.body)
+        self.assertEqual(actual.headers.get('Content-Type'),
+                         expected.headers.get('Content-Type'))
+
+        return actual
+
+    def test_same_responses(self):
+        resp = self.assertSameResponse('/items/5?full=true')
+        self.assertEqual(resp.body, b'{"id": 5, "full": true}')
+
+        resp = self.assertSameResponse('/items/11')
+        self.assertEqual(resp.code, 404)
+
+        resp = self.assertSameResponse('/items', method='POST',
+                                       body='{"name": "calm"}')
+        self.assertEqual(resp.body, b'{"fields": ["name"]}')
+
+        self.assertSameResponse('/missing')
+
+
+class InProcessIOLoopTests(CalmInProcessTestCase):
+    """The app compiled once per class serves the IOLoop of every test."""
+    def get_calm_app(self):
+        return budgeted_app
+
+    def test_first_loop(self):
+        self.get('/hello', expected_json_body='hello')
+        self.assertIs(budgeted_app.watchdog.io_loop, self.io_loop)
+
+    def test_second_loop(self):
+        self.get('/hello', expected_json_body='hello')
+        self.assertIs(budgeted_app.watchdog.io_loop, self.io_loop)
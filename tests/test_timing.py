@@ -0,0 +1,94 @@
+import time
+from unittest import TestCase
+
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+from calm.timing import PhaseTimer, PhaseTimings
+
+
+app = Application('testtiming', '1')
+app.configure(server_timing=True, metrics_url='/metrics')
+
+
+@app.get('/timed/{number}')
+async def timed(request, number: int, flag: bool = False):
+    return number
+
+
+@app.post('/timed')
+async def no_output(request):
+    pass
+
+
+def header_phases(resp):
+    return [p.split(';')[0].strip()
+            for p in resp.headers['Server-Timing'].split(',')]
+
+
+class PhaseTimerTests(TestCase):
+    def test_phases(self):
+        timer = PhaseTimer()
+        timer.mark('first')
+        time.sleep(0.01)
+        timer.mark('second')
+
+        self.assertEqual([p for p, _ in timer.phases], ['first', 'second'])
+        self.assertGreaterEqual(timer.phases[1][1], 0.01)
+        self.assertRegex(timer.header(),
+                         r'^first;dur=\d+\.\d{3}, second;dur=\d+\.\d{3}$')
+
+        timings = PhaseTimings()
+        timings.record('/route', timer)
+        timings.record('/route', timer)
+
+        stats = timings.snapshot()['/route']['second']
+        self.assertEqual(stats['count'], 2)
+        self.assertAlmostEqual(stats['total'], timer.phases[1][1] * 2)
+        self.assertIn('calm_request_phase_seconds_count'
+                      '{route="/route",phase="first"} 2', timings.collect())
+
+
+class ServerTimingTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        global app
+        return app
+
+    def test_server_timing_header(self):
+        resp = self.get('/timed/12', query_args={'flag': 'yes'})
+        self.assertEqual(header_phases(resp), ['query', 'cast', 'body',
+                                               'handler', 'validate',
+                                               'serialize'])
+
+        resp = self.post('/timed')
+        self.assertEqual(header_phases(resp), ['query', 'cast', 'body',
+                                               'handler'])
+
+        resp = self.get('/timed/not_a_number', expected_code=400)
+        self.assertEqual(header_phases(resp), ['query'])
+
+    def test_aggregation(self):
+        self.get('/timed/1')
+        self.get('/timed/2')
+
+        snapshot = app.phase_timings.snapshot()
+        self.assertEqual(snapshot['/timed/{number}']['handler']['count'], 2)
+
+        resp = self.get('/metrics')
+        self.assertIn('calm_request_phase_seconds_count'
+                      '{route="/timed/{number}",phase="serialize"} 2',
+                      resp.body.decode('utf-8').splitlines())
+
+
+class DisabledServerTimingTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        untimed_app = Application('testtiming', '1')
+
+        @untimed_app.get('/untimed')
+        async def untimed(request):
+            pass
+
+        return untimed_app
+
+    def test_disabled(self):
+        resp = self.get('/untimed')
+        self.assertNotIn('Server-Timing', resp.headers)
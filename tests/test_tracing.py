@@ -0,0 +1,164 @@
+import os
+import json
+import asyncio
+import tempfile
+from unittest import TestCase
+
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+from calm.decorator import timeout
+from calm.ex import DefinitionError
+from calm.tracing import (Tracer, InMemoryExporter, FileExporter,
+                          parse_traceparent)
+
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+
+exporter = InMemoryExporter()
+app = Application('testtracing', '1')
+app.configure(tracer=Tracer(exporter))
+
+
+@app.get('/items/{item_id}')
+async def get_item(request, item_id):
+    with request.span.child('db') as span:
+        span.set_attribute('db.key', item_id)
+
+    return {'traceparent': request.span.traceparent}
+
+
+@app.get('/stuck')
+@timeout(0.01)
+async def stuck(request):
+    await asyncio.sleep(1)
+
+
+@app.get('/failing')
+async def failing(request):
+    raise ValueError()
+
+
+class TraceparentTests(TestCase):
+    def test_parse(self):
+        self.assertEqual(
+            parse_traceparent('00-{}-{}-01'.format(TRACE_ID, PARENT_ID)),
+            (TRACE_ID, PARENT_ID, 1)
+        )
+        self.assertEqual(
+            parse_traceparent('00-{}-{}-00'.format(TRACE_ID, PARENT_ID)),
+            (TRACE_ID, PARENT_ID, 0)
+        )
+        self.assertIsNone(parse_traceparent('garbage'))
+        self.assertIsNone(
+            parse_traceparent('00-{}-{}-01'.format('0' * 32, PARENT_ID))
+        )
+        self.assertIsNone(
+            parse_traceparent('ff-{}-{}-01'.format(TRACE_ID, PARENT_ID))
+        )
+
+    def test_bad_sample_rate(self):
+        self.assertRaises(DefinitionError, Tracer, sample_rate=2)
+
+    def test_file_exporter(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        tracer = Tracer(FileExporter(path))
+        root = tracer.start_request(FakeRequest(), '/route')
+        root.child('child').finish()
+        root.finish()
+        tracer.exporter.close()
+
+        with open(path) as spans_file:
+            spans = [json.loads(line) for line in spans_file]
+        self.assertEqual([s['name'] for s in spans], ['child', 'GET /route'])
+        self.assertEqual(spans[0]['parent_id'], spans[1]['span_id'])
+
+
+class FakeRequest(object):
+    method = 'GET'
+    headers = {}
+
+
+class TracingTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        global app
+        return app
+
+    def setUp(self):
+        super(TracingTests, self).setUp()
+        exporter.clear()
+        app.config['tracer'].sample_rate = 1.0
+
+    def test_request_spans(self):
+        self.get('/items/12')
+
+        spans = {span.name: span for span in exporter.spans}
+        self.assertEqual(set(spans), {'GET /items/{item_id}', 'body',
+                                      'handler', 'db', 'serialize'})
+
+        root = spans['GET /items/{item_id}']
+        self.assertIsNone(root.parent_id)
+        self.assertEqual(root.attributes['http.status_code'], 200)
+        for name in ('body', 'handler', 'serialize'):
+            self.assertEqual(spans[name].parent_id, root.span_id)
+            self.assertEqual(spans[name].trace_id, root.trace_id)
+        self.assertEqual(spans['db'].parent_id, spans['handler'].span_id)
+        self.assertEqual(spans['db'].attributes, {'db.key': '12'})
+
+    def test_propagation(self):
+        resp = self.get('/items/12', headers={
+            'traceparent': '00-{}-{}-01'.format(TRACE_ID, PARENT_ID)
+        })
+
+        spans = {span.name: span for span in exporter.spans}
+        root = spans['GET /items/{item_id}']
+        self.assertEqual(root.trace_id, TRACE_ID)
+        self.assertEqual(root.parent_id, PARENT_ID)
+
+        traceparent = json.loads(resp.body.decode('utf-8'))['traceparent']
+        self.assertEqual(traceparent, '00-{}-{}-01'.format(
+            TRACE_ID, spans['handler'].span_id
+        ))
+
+    def test_failing_handler(self):
+        self.get('/failing', expected_code=500)
+
+        spans = {span.name: span for span in exporter.spans}
+        self.assertEqual(set(spans), {'GET /failing', 'body', 'handler'})
+        self.assertEqual(spans['handler'].attributes['error'], 'ValueError')
+        self.assertEqual(spans['GET /failing'].attributes,
+                         {'http.method': 'GET', 'http.route': '/failing',
+                          'http.status_code': 500})
+
+    def test_timed_out_handler(self):
+        self.get('/stuck', expected_code=504)
+
+        spans = {span.name: span for span in exporter.spans}
+        self.assertEqual(set(spans), {'GET /stuck', 'body', 'handler'})
+        root = spans['GET /stuck']
+        for name in ('body', 'handler'):
+            self.assertEqual(spans[name].parent_id, root.span_id)
+        self.assertEqual(spans['handler'].attributes['error'],
+                         'GatewayTimeoutError')
+        self.assertEqual(root.attributes['http.status_code'], 504)
+
+    def test_unsampled(self):
+        self.get('/not/found', expected_code=404, headers={
+            'traceparent': '00-{}-{}-00'.format(TRACE_ID, PARENT_ID)
+        })
+
+        # the trace of the caller is propagated, but not recorded
+        resp = self.get('/items/12', headers={
+            'traceparent': '00-{}-{}-02'.format(TRACE_ID, PARENT_ID)
+        })
+        traceparent = json.loads(resp.body.decode('utf-8'))['traceparent']
+        self.assertEqual(traceparent,
+                         '00-{}-{}-02'.format(TRACE_ID, PARENT_ID))
+
+        app.config['tracer'].sample_rate = 0
+        self.get('/not/found', expected_code=404)
+
+        self.assertEqual(exporter.spans, [])
@@ -0,0 +1,142 @@
+import time
+import asyncio
+import traceback
+from unittest import TestCase
+
+from tornado.testing import gen_test
+
+from calm.testing import CalmHTTPTestCase
+from calm import Application
+from calm.decorator import latency_budget, timeout
+from calm.ex import DefinitionError
+
+
+TOKEN = 'secret'
+app = Application('testwatchdog', '1')
+app.configure(blocking_threshold=0.05,
+              debug_url='/_calm',
+              debug_token=TOKEN)
+
+
+def block_the_loop():
+    time.sleep(0.3)
+
+
+@app.get('/blocking')
+async def blocking(request):
+    block_the_loop()
+
+
+@app.get('/blocking-with-deadline')
+@timeout(5)
+async def blocking_with_deadline(request):
+    block_the_loop()
+
+
+async def wait_for_backend():
+    await asyncio.sleep(0.3)
+
+
+@app.get('/slow')
+@latency_budget(0.05)
+async def slow(request):
+    await wait_for_backend()
+
+
+@app.get('/fast')
+@latency_budget(1)
+async def fast(request):
+    pass
+
+
+class LatencyBudgetDecoratorTests(TestCase):
+    def test_bad_budget(self):
+        self.assertRaises(DefinitionError, latency_budget, 0)
+        self.assertRaises(DefinitionError, latency_budget, '1')
+
+
+class WatchdogTests(CalmHTTPTestCase):
+    def get_calm_app(self):
+        global app
+        return app
+
+    def tearDown(self):
+        app.watchdog.stop()
+        super(WatchdogTests, self).tearDown()
+
+    @gen_test
+    async def test_blocked_loop(self):
+        # let the IOLoop beat before blocking it
+        await asyncio.sleep(0.1)
+        with self.assertLogs('calm', 'WARNING') as logs:
+            await self.http_client.fetch(self.get_url('/blocking'))
+            await asyncio.sleep(0.1)
+
+        self.assertIn('blocked', logs.output[0])
+
+        finding = app.watchdog.query(kind='blocked')[0]
+        self.assertEqual(finding['route'], '/blocking')
+        self.assertEqual(finding['handler'], 'tests.test_watchdog.blocking')
+        self.assertGreaterEqual(finding['duration'], 0.05)
+        self.assertIn('block_the_loop', finding['stack'])
+
+    @gen_test
+    async def test_blocked_loop_with_deadline(self):
+        # the handler runs in the task of the deadline
+        await asyncio.sleep(0.1)
+        with self.assertLogs('calm', 'WARNING'):
+            await self.http_client.fetch(
+                self.get_url('/blocking-with-deadline')
+            )
+            await asyncio.sleep(0.1)
+
+        finding = app.watchdog.query(kind='blocked')[0]
+        self.assertEqual(finding['route'], '/blocking-with-deadline')
+        self.assertEqual(finding['handler'],
+                         'tests.test_watchdog.blocking_with_deadline')
+        self.assertIn('block_the_loop', finding['stack'])
+
+    @gen_test
+    async def test_slow_request(self):
+        with self.assertLogs('calm', 'WARNING'):
+            await self.http_client.fetch(self.get_url('/slow'))
+        await self.http_client.fetch(self.get_url('/fast'))
+
+        findings = app.watchdog.query(kind='slow')
+        self.assertEqual(len(findings), 1)
+        self.assertEqual(findings[0]['route'], '/slow')
+        self.assertIn('wait_for_backend', findings[0]['stack'])
+
+        resp = await self.http_client.fetch(
+            self.get_url('/_calm/watchdog?kind=slow&route=/slow'),
+            headers={'X-Calm-Debug-Token': TOKEN}
+        )
+        self.assertIn(b'wait_for_backend', resp.body)
+
+    def test_ring_buffer(self):
+        watchdog = app.watchdog
+        watchdog.findings.clear()
+        with self.assertLogs('calm', 'WARNING'):
+            for _ in range(watchdog.findings.maxlen + 10):
+                watchdog.report('slow', 1, None, traceback.StackSummary())
+
+        self.assertEqual(len(watchdog.query()), watchdog.findings.maxlen)
+        self.assertEqual(len(watchdog.query(limit=3)), 3)
+        self.assertEqual(watchdog.query(kind='blocked'), [])
+
+    def test_protection(self):
+        self.get('/_calm/watchdog', expected_code=404)
+
+
+class DisabledWatchdogTests(TestCase):
+    def test_disabled(self):
+        test_app = Application('testwatchdog', '1')
+
+        @test_app.get('/plain')
+        async def plain(request):
+            pass
+
+        test_app.make_app()
+
+        self.assertIsNone(test_app.watchdog)
+        self.assertEqual(test_app.diagnostics, [])